@@ -1,11 +1,25 @@
 from pydantic_settings import BaseSettings
 from typing import Optional
+import os
 
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./nyayease.db"
     CHROMA_PERSIST_DIRECTORY: str = "./chroma_db"
     
+    # Vector store: "chroma", or "native" (memory-mapped .npy segments, optional IVF quantiser)
+    VECTOR_STORE_BACKEND: str = "chroma"
+    NATIVE_VECTOR_STORE_DIRECTORY: str = "./vector_store"
+    NATIVE_IVF_LISTS: int = 0  # coarse lists trained after bulk ingestion; 0 keeps search exact
+    NATIVE_IVF_PROBES: int = 8  # lists scanned per query
+    NATIVE_IVF_MIN_VECTORS: int = 20000  # smaller collections are always searched exactly
+    NATIVE_QUANTIZATION: str = "none"  # "float16" or "int8": search on compact codes, rescore on the float32 vectors on disk
+    NATIVE_RESCORE_FACTOR: int = 4  # quantised candidates rescored at full precision, per requested result
+    # float16 codes are decoded to float32 in memory for scoring, up to this much per collection: numpy has no
+    # fast float16 matmul, so scanning the codes directly is ~10x slower. Segments beyond it keep only the codes
+    # resident (half the memory, slow scans); 0 favours memory everywhere, and int8 is both small and fast
+    NATIVE_FLOAT16_CACHE_MB: int = 256
+    
     # API Keys
     GEMINI_API_KEY: str
     FIREBASE_CONFIG: Optional[str] = None
@@ -18,14 +32,87 @@ class Settings(BaseSettings):
     
     # AI Settings
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: str = "torch"  # or "onnx": ONNX Runtime on an export of EMBEDDING_MODEL (app/scripts/export_onnx_embeddings.py)
+    EMBEDDING_ONNX_PATH: str = "./models/all-MiniLM-L6-v2-onnx"
+    EMBEDDING_ONNX_QUANTIZED: bool = False  # load the int8 model_quantized.onnx
+    EMBEDDING_ONNX_THREADS: int = 0  # intra-op threads per encode; 0 lets ONNX Runtime use every core
+    EMBEDDING_ONNX_BATCH_SIZE: int = 32
     CHUNK_SIZE: int = 500
     CHUNK_OVERLAP: int = 50
+    RETRIEVAL_MODE: str = "hybrid"  # "vector" or "hybrid" (BM25 + vector with reciprocal-rank fusion)
+    HYBRID_CANDIDATE_MULTIPLIER: int = 4  # candidates taken from each ranking per requested result
+    RRF_K: int = 60
+    WARMUP_ON_STARTUP: bool = True  # Load models at startup; /health/ready reports 503 until done
+    
+    # Uploaded document analysis: longer documents are analysed map-reduce style
+    DOCUMENT_ANALYSIS_SINGLE_SHOT_TOKENS: int = 12000  # estimated tokens; above this, map-reduce
+    DOCUMENT_ANALYSIS_CHUNK_TOKENS: int = 4000
+    DOCUMENT_ANALYSIS_MAX_CHUNKS: int = 16  # chunks grow beyond CHUNK_TOKENS rather than exceed this
+    DOCUMENT_ANALYSIS_MAX_CONCURRENCY: int = 4  # concurrent map calls per document
+    
+    # Prompt context: MMR-selected, merged and trimmed retrieved chunks under a token budget
+    CONTEXT_CANDIDATES: int = 8  # statute chunks retrieved per query for MMR to choose from
+    CONTEXT_TOKEN_BUDGET: int = 1200  # estimated tokens of statute context per prompt
+    CONTEXT_TOKEN_BUDGETS: dict = {"hi": 900, "mr": 900}  # per answer language; Devanagari answers cost more output tokens
+    CONTEXT_MMR_LAMBDA: float = 0.7  # 1.0 ranks by relevance only, lower values favour diverse chunks
+    CONTEXT_DUPLICATE_SIMILARITY: float = 0.95  # chunks this similar to one already chosen are skipped
+    
+    # Questions about an uploaded document: only its most relevant passages are sent
+    DOCUMENT_CONTEXT_TOP_K: int = 6
+    DOCUMENT_CONTEXT_TOKEN_BUDGET: int = 1500  # estimated tokens of document passages per prompt
+    
+    # Answer cache (in-memory LRU + SQLite tier that survives restarts)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIZE: int = 1000
+    ANSWER_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    ANSWER_CACHE_PATH: Optional[str] = "./cache/answer_cache.db"  # None keeps the cache in memory only
+    
+    # Query embedding cache (optionally memory-mapped so restarts start warm)
+    EMBEDDING_CACHE_SIZE: int = 10000  # 0 disables the cache
+    EMBEDDING_CACHE_PATH: Optional[str] = "./cache/query_embeddings.npy"
+    EMBEDDING_CACHE_FLUSH_EVERY: int = 100  # persist the key index after this many new entries
+    
+    # Micro-batching of concurrent query embeddings
+    EMBEDDING_BATCHING_ENABLED: bool = True
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+    
+    # Execution pools (blocking work is kept off the event loop)
+    CPU_POOL_WORKERS: int = max(2, os.cpu_count() or 2)  # embeddings, bcrypt, PDF parsing
+    PROCESS_POOL_WORKERS: int = max(1, (os.cpu_count() or 2) - 1)  # Tesseract OCR
+    IO_POOL_WORKERS: int = 16  # ChromaDB and file access
+    LLM_MAX_CONCURRENCY: int = 8  # concurrent Gemini requests per worker
+    
+    # OCR of scanned PDF pages (fanned out over the process pool)
+    OCR_MAX_PAGES_IN_FLIGHT: int = max(1, (os.cpu_count() or 2) - 1)  # per document
+    OCR_PAGE_TIMEOUT_SECONDS: float = 60.0  # Tesseract is killed after this long on one page
+    OCR_LANGUAGES: str = "eng+hin+mar"  # full set, used when the script of a page is unclear
+    OCR_SCRIPT_DETECTION: bool = True  # probe each page's script with Tesseract OSD first
+    OCR_SCRIPT_LANGUAGES: dict = {"Latin": "eng", "Devanagari": "hin+mar"}
+    OCR_SCRIPT_MIN_CONFIDENCE: float = 2.0  # OSD script_conf below this falls back to OCR_LANGUAGES
+    # Image pre-processing before Tesseract; compare profiles with app/scripts/benchmark_ocr.py
+    OCR_PROFILE: str = "balanced"
+    OCR_PROFILES: dict = {
+        "raw": {"dpi": 72, "max_side": 0, "grayscale": False, "deskew": False, "binarize": False},  # previous behaviour
+        "fast": {"dpi": 200, "max_side": 2000, "grayscale": True, "deskew": False, "binarize": False},
+        "balanced": {"dpi": 300, "max_side": 3500, "grayscale": True, "deskew": True, "binarize": True},
+    }
+    
+    # Bulk ingestion pipeline (app/scripts/process_documents.py)
+    INGEST_EMBED_BATCH_SIZE: int = 64
+    INGEST_WRITE_BATCH_SIZE: int = 256
+    INGEST_QUEUE_SIZE: int = 8  # batches buffered between pipeline stages
     
     # File Upload
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
-    ALLOWED_EXTENSIONS: set = {".pdf", ".txt", ".doc", ".docx"}
+    ALLOWED_EXTENSIONS: set = {".pdf", ".txt", ".docx"}  # legacy .doc cannot be extracted
     UPLOAD_DIR: str = "uploads"  # Added this
     
+    # Background document processing (extraction, indexing and analysis of uploads)
+    DOCUMENT_JOB_WORKERS: int = 2
+    DOCUMENT_JOB_MAX_ATTEMPTS: int = 3  # jobs interrupted by a restart are retried up to this many times
+    DOCUMENT_JOB_STALE_SECONDS: int = 120  # unfinished jobs not touched by their process for this long are taken over
+    
     # Logging
     LOG_LEVEL: str = "INFO"  # Added this
     
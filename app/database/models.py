@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -39,8 +39,12 @@ class Document(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     filename = Column(String)
     file_path = Column(String)
+    content_hash = Column(String, index=True)  # sha256 of the file; identical uploads share one stored file
+    language = Column(String, default="en")  # language the analysis was written in
     extracted_text = Column(Text)
     analysis_result = Column(Text)
+    analysis_status = Column(String, nullable=True)  # "completed" or "failed"; only completed analyses are reused
+    indexed = Column(Boolean, nullable=True)  # chunks are in the owner's collection; None for rows from before this was recorded
     upload_date = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User", back_populates="documents")
@@ -50,7 +54,28 @@ class LegalDocument(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
-    document_type = Column(String)  # "constitution", "ipc", "act"
-    section = Column(String)
+    document_type = Column(String, index=True)  # "constitution", "ipc", "act"
+    section = Column(String, index=True)  # Article/Section number, e.g. "21", "498A"
     content = Column(Text)
-    embedding_id = Column(String)  # Reference to vector store
\ No newline at end of file
+    embedding_id = Column(String)  # Reference to vector store
+    indexed_at = Column(DateTime, default=datetime.utcnow)  # set on every rebuild, so running servers notice it
+
+class DocumentJob(Base):
+    __tablename__ = "document_jobs"
+    
+    id = Column(String, primary_key=True, index=True)  # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=True)  # Set once processing completes
+    filename = Column(String)
+    file_path = Column(String)
+    content_hash = Column(String, index=True)
+    language = Column(String, default="en")
+    worker_id = Column(String, nullable=True)  # host:pid:nonce of the server process that owns the job
+    status = Column(String, default="queued", index=True)  # "queued", "running", "completed", "failed"
+    stage = Column(String, default="queued")  # "queued", "extracting", "indexing", "analyzing", "done"
+    progress = Column(Float, default=0.0)  # 0.0 - 1.0
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
@@ -6,14 +6,42 @@ from sqlalchemy.orm import Session
 from app.database.connection import get_db
 from app.database.models import Document, User
 from app.routes.auth import get_current_user, get_optional_current_user
-from app.routes import auth, legal_query, document_upload, scenarios
+from app.routes import auth, legal_query, document_upload, scenarios, health
+from app.services.registry import services
+from app.services.executor import execution_service
+from app.services.job_queue import document_jobs
 from app.config import settings
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 import uvicorn
 
+logger = logging.getLogger(__name__)
+
+async def _warm_up_services():
+    try:
+        await asyncio.to_thread(services.warm_up)
+    except Exception as e:
+        logger.error(f"Service warm-up failed: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load models in the background so liveness probes answer while warming up
+    warmup_task = asyncio.create_task(_warm_up_services()) if settings.WARMUP_ON_STARTUP else None
+    # Resume document jobs left unfinished by the previous run
+    await document_jobs.start()
+    yield
+    await document_jobs.stop()
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    services.shutdown()
+    execution_service.shutdown(wait=False)
+
 app = FastAPI(
     title="NyayEase - Legal AI Assistant",
     description="AI-powered legal assistant for Indian law",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -36,6 +64,7 @@ app.include_router(auth.router, prefix="/api/v1/auth", tags=["authentication"])
 app.include_router(legal_query.router, prefix="/api/v1/query", tags=["legal-query"])
 app.include_router(document_upload.router, prefix="/api/v1/documents", tags=["documents"])
 app.include_router(scenarios.router, prefix="/api/v1/scenarios", tags=["scenarios"])
+app.include_router(health.router, prefix="/health", tags=["health"])
 
 @app.get("/")
 async def home(request: Request, current_user: User | None = Depends(get_optional_current_user)):
@@ -18,4 +18,17 @@ class DocumentResponse(BaseModel):
 
 class DocumentAnalysisRequest(BaseModel):
     document_id: int
-    language: Optional[str] = "en"
\ No newline at end of file
+    language: Optional[str] = "en"
+
+class DocumentJobResponse(BaseModel):
+    job_id: str
+    filename: str
+    status: str  # "queued", "running", "completed", "failed"
+    stage: str  # "queued", "extracting", "indexing", "analyzing", "done"
+    progress: float
+    error: Optional[str] = None
+    status_url: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[DocumentResponse] = None  # Set once the job has completed
@@ -6,6 +6,9 @@ class LegalQueryRequest(BaseModel):
     language: Optional[str] = "en"
     query_type: Optional[str] = "general"  # "constitution", "scenario", "general"
     document_id: Optional[int] = None # Added this line
+    document_ids: Optional[List[int]] = None  # ask about several of your documents at once
+    search_user_documents: bool = False  # search all of your uploaded documents
+    document_types: Optional[List[str]] = None  # limit statute retrieval, e.g. ["constitution", "ipc"]
 
 class LegalQueryResponse(BaseModel):
     response: str
@@ -13,6 +16,7 @@ class LegalQueryResponse(BaseModel):
     related_sections: List[str]
     confidence: float
     language: str
+    cached: bool = False  # True when served from the answer cache
 
 class ScenarioRequest(BaseModel):
     scenario_type: str
@@ -7,6 +7,7 @@ from app.database.connection import get_db
 from app.database.models import User
 from app.models.user import UserCreate, UserResponse, Token
 from app.services.auth_service import AuthService
+from app.services.executor import execution_service
 from app.config import settings
 import logging
 
@@ -76,7 +77,7 @@ async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
             )
         
         # Create new user
-        hashed_password = auth_service.get_password_hash(user_data.password)
+        hashed_password = await execution_service.run_cpu(auth_service.get_password_hash, user_data.password)
         db_user = User(
             username=user_data.username,
             email=user_data.email,
@@ -104,7 +105,10 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
         # Authenticate user
         user = db.query(User).filter(User.username == form_data.username).first()
         
-        if not user or not auth_service.verify_password(form_data.password, user.hashed_password):
+        password_ok = user is not None and await execution_service.run_cpu(
+            auth_service.verify_password, form_data.password, user.hashed_password
+        )
+        if not password_ok:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
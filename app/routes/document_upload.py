@@ -1,32 +1,37 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from app.database.connection import get_db
-from app.models.document import DocumentResponse, DocumentAnalysisRequest
-from app.services.ai_service import AIService
-from app.services.ocr_service import OCRService
-from app.services.vector_service import VectorService # Added this line
-from app.database.models import Document, User
+from app.models.document import DocumentResponse, DocumentAnalysisRequest, DocumentJobResponse
+from app.services.executor import execution_service
+from app.services.job_queue import document_jobs, ACTIVE_STATUSES
+from app.services.vector_service import VectorService
+from app.services.registry import get_vector_service
+from app.database.models import Document, DocumentJob, User
 from app.routes.auth import get_current_user
 from app.config import settings
+from app.utils.validators import sniff_file_type
+import aiofiles
+import hashlib
 import os
 import uuid
-from typing import Optional
+from typing import List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-ai_service = AIService()
-ocr_service = OCRService()
-vector_service = VectorService() # Added this line
 
-@router.post("/upload", response_model=DocumentResponse)
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+@router.post("/upload", response_model=DocumentJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(
     file: UploadFile = File(...),
     language: Optional[str] = Form("en"),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
-    """Upload and analyze legal document"""
+    """Upload a legal document and queue it for extraction, indexing and analysis.
+
+    Returns 202 with a job; poll GET /jobs/{job_id} for its progress and result.
+    """
     try:
         # Validate file
         if not file.filename:
@@ -35,8 +40,8 @@ async def upload_document(
                 detail="No file provided"
             )
         
-        # Check file size
-        if file.size > settings.MAX_FILE_SIZE:
+        # Reject early when the client declares an oversized file; the real byte count is enforced while streaming
+        if file.size is not None and file.size > settings.MAX_FILE_SIZE:
             raise HTTPException(
                 status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                 detail="File size exceeds limit"
@@ -50,70 +55,151 @@ async def upload_document(
                 detail="File type not supported"
             )
         
-        # Create unique filename
-        unique_filename = f"{uuid.uuid4().hex}_{file.filename}"
-        file_path = f"uploads/{unique_filename}"
-        
-        # Create uploads directory if not exists
-        os.makedirs("uploads", exist_ok=True)
+        # Save file, hashing it as it streams in
+        upload_path, content_hash = await _save_upload(file, file_ext)
+        file_path = os.path.join(settings.UPLOAD_DIR, f"{content_hash}{file_ext}")
         
-        # Save file
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-
-        # Process and store the document in the vector database
-        await vector_service.process_and_store_documents([file_path])
-        
-        # Extract text from document
-        if file_ext == ".pdf":
-            extracted_text = await ocr_service.extract_text_from_pdf(file_path)
-        else:
-            extracted_text = await ocr_service.extract_text_from_image(file_path)
-        
-        if not extracted_text.strip():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Could not extract text from document"
-            )
-        
-        # Analyze document using AI
-        analysis_result = await ai_service.analyze_legal_document(
-            document_text=extracted_text,
-            language=language
-        )
-        
-        # Save to database
-        db_document = Document(
+        # Extraction, indexing and analysis run in the background job queue
+        job = await document_jobs.submit(
             user_id=current_user.id,
             filename=file.filename,
             file_path=file_path,
-            extracted_text=extracted_text,
-            analysis_result=str(analysis_result)
+            language=language,
+            content_hash=content_hash,
+            upload_path=upload_path
         )
-        db.add(db_document)
-        db.commit()
-        db.refresh(db_document)
         
-        return DocumentResponse(
-            id=db_document.id,
-            filename=db_document.filename,
-            extracted_text=extracted_text[:500] + "...",  # Truncate for response
-            analysis_result=analysis_result["analysis"],
-            upload_date=db_document.upload_date
+        return DocumentJobResponse(
+            job_id=job["id"],
+            filename=job["filename"],
+            status=job["status"],
+            stage=job["stage"],
+            progress=job["progress"],
+            status_url=f"/api/v1/documents/jobs/{job['id']}"
         )
         
     except Exception as e:
+        # Clean up the upload, and the stored file if it was created and no other upload shares it
+        if 'upload_path' in locals() and os.path.exists(upload_path):
+            os.remove(upload_path)
+        if 'file_path' in locals():
+            await execution_service.run_io(document_jobs.remove_unused_file, file_path)
+        if isinstance(e, HTTPException):
+            raise
         logger.error(f"Error uploading document: {str(e)}")
-        # Clean up file if it was created
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
         
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error processing document upload."
         )
 
+async def _save_upload(file: UploadFile, file_ext: str) -> Tuple[str, str]:
+    """Stream an upload to a temporary file in settings.UPLOAD_DIR in small chunks while hashing and sniffing it.
+
+    The upload is rejected as soon as it grows past MAX_FILE_SIZE or its
+    first bytes do not match its extension. Returns the temporary path and
+    the sha256; the job queue then stores the file by content as
+    <sha256><ext>, so identical uploads share one stored file (and, downstream,
+    its chunks and analysis).
+    """
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    tmp_path = os.path.join(settings.UPLOAD_DIR, f".{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                
+                if size == 0 and not sniff_file_type(chunk, file_ext):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="File content does not match its type"
+                    )
+                size += len(chunk)
+                if size > settings.MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="File size exceeds limit"
+                    )
+                
+                digest.update(chunk)
+                await buffer.write(chunk)
+        
+        if size == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Uploaded file is empty"
+            )
+        
+        return tmp_path, digest.hexdigest()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _job_response(job: DocumentJob, db: Session) -> DocumentJobResponse:
+    result = None
+    if job.status == "completed" and job.document_id:
+        document = db.query(Document).filter(Document.id == job.document_id).first()
+        if document:
+            result = DocumentResponse(
+                id=document.id,
+                filename=document.filename,
+                extracted_text=(document.extracted_text or "")[:500] + "...",  # Truncate for response
+                analysis_result=document.analysis_result,
+                upload_date=document.upload_date
+            )
+    
+    return DocumentJobResponse(
+        job_id=job.id,
+        filename=job.filename,
+        status=job.status,
+        stage=job.stage,
+        progress=job.progress or 0.0,
+        error=job.error,
+        status_url=f"/api/v1/documents/jobs/{job.id}",
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+        finished_at=job.finished_at,
+        result=result
+    )
+
+@router.get("/jobs", response_model=List[DocumentJobResponse])
+async def list_document_jobs(
+    active_only: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """List the user's recent document processing jobs"""
+    query = db.query(DocumentJob).filter(DocumentJob.user_id == current_user.id)
+    if active_only:
+        query = query.filter(DocumentJob.status.in_(ACTIVE_STATUSES))
+    jobs = query.order_by(DocumentJob.created_at.desc()).limit(20).all()
+    return [_job_response(job, db) for job in jobs]
+
+@router.get("/jobs/{job_id}", response_model=DocumentJobResponse)
+async def get_document_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the stage, progress and result of a document processing job"""
+    job = db.query(DocumentJob).filter(
+        DocumentJob.id == job_id,
+        DocumentJob.user_id == current_user.id
+    ).first()
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    return _job_response(job, db)
+
 @router.get("/list")
 async def list_documents(
     current_user: User = Depends(get_current_user),
@@ -213,7 +299,8 @@ async def get_document(
 async def delete_document(
     document_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    vector_service: VectorService = Depends(get_vector_service)
 ):
     """Delete a specific document"""
     try:
@@ -235,11 +322,15 @@ async def delete_document(
         db.delete(document)
         db.commit()
         
-        # Delete physical file if it exists
-        if file_path and os.path.exists(file_path):
+        # Chunks live in the user's own collection; keep them while another of their uploads has the same content
+        if file_path and not document_jobs.file_in_use(file_path, user_id=current_user.id):
+            await vector_service.delete_chunks(source=file_path, collection=await vector_service.user_collection(current_user.id))
+        
+        # Delete the physical file unless another upload of the same content still uses it
+        if file_path:
             try:
-                os.remove(file_path)
-                logger.info(f"Deleted file: {file_path}")
+                if await execution_service.run_io(document_jobs.remove_unused_file, file_path):
+                    logger.info(f"Deleted file: {file_path}")
             except OSError as e:
                 logger.warning(f"Could not delete file {file_path}: {str(e)}")
         
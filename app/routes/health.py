@@ -0,0 +1,24 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.services.registry import services
+from app.services.executor import execution_service
+from app.services.job_queue import document_jobs
+
+router = APIRouter()
+
+@router.get("/live")
+async def liveness():
+    """Liveness probe - the process is up and serving requests"""
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def readiness():
+    """Readiness probe - only succeeds once the models are loaded and warm"""
+    status_info = services.status()
+    status_code = 200 if status_info["ready"] else 503
+    return JSONResponse(status_code=status_code, content=status_info)
+
+@router.get("/metrics")
+async def metrics():
+    """Execution pool queue depths and timings, document job backlog and cache hit rates"""
+    return {"execution_pools": execution_service.stats(), "document_jobs": document_jobs.stats(), **services.metrics()}
@@ -1,46 +1,143 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database.connection import get_db
+from app.database.connection import get_db, SessionLocal
 from app.models.query import LegalQueryRequest, LegalQueryResponse, ConstitutionQueryRequest, ScenarioRequest
 from app.services.ai_service import AIService
+from app.services.registry import get_ai_service
 from app.database.models import Query, User, Document  # Added Document import
 from app.routes.auth import get_optional_current_user, get_current_user
-from typing import List, Optional
+from typing import List, Optional, AsyncIterator, Dict, Any
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-ai_service = AIService()
+
+def _get_document(document_id: int, current_user: Optional[User], db: Session) -> Document:
+    """Load a referenced document; only its owner may ask about it"""
+    # Anonymous callers could otherwise read any user's passages by guessing IDs
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Log in to ask about your documents."
+        )
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found."
+        )
+    if document.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to access this document."
+        )
+    return document
+
+def _get_document_scope(request: LegalQueryRequest, current_user: Optional[User], db: Session) -> Optional[Dict[str, Any]]:
+    """The uploaded documents of the current user a query may draw passages from.
+
+    Explicitly referenced documents are checked for ownership;
+    search_user_documents adds every other document of the user. Documents
+    not known to be indexed come with their text, so they can be indexed on
+    first use; indexed ones are not loaded.
+    """
+    document_ids = list(dict.fromkeys(([request.document_id] if request.document_id else []) + (request.document_ids or [])))
+    documents = [_get_document(document_id, current_user, db) for document_id in document_ids]
+    scope = [
+        {
+            "file_path": document.file_path,
+            "filename": document.filename,
+            "indexed": bool(document.indexed),
+            "extracted_text": None if document.indexed else document.extracted_text,
+            "user_id": document.user_id,
+        }
+        for document in documents
+    ]
+
+    if request.search_user_documents:
+        if not current_user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Log in to search your documents."
+            )
+        referenced = {document["file_path"] for document in scope}
+        rows = db.query(Document.id, Document.file_path, Document.filename, Document.indexed).filter(Document.user_id == current_user.id).all()
+        rows = [row for row in rows if row.file_path not in referenced]
+        # Only documents that may lack chunks in the user's collection (e.g. removed by the namespace migration) need their text
+        unindexed_ids = [row.id for row in rows if not row.indexed]
+        texts = dict(db.query(Document.id, Document.extracted_text).filter(Document.id.in_(unindexed_ids)).all()) if unindexed_ids else {}
+        scope.extend(
+            {
+                "file_path": row.file_path,
+                "filename": row.filename,
+                "indexed": bool(row.indexed),
+                "extracted_text": texts.get(row.id),
+                "user_id": current_user.id,
+            }
+            for row in rows
+        )
+
+    if not scope:
+        return None
+    return {"user_id": current_user.id, "documents": scope}
+
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _stream_events(
+    events: AsyncIterator[Dict[str, Any]],
+    user_id: Optional[int],
+    query_text: str,
+    query_type: str,
+    language: str
+) -> AsyncIterator[str]:
+    """Relay AI events as Server-Sent Events and save the finished answer to history"""
+    async for item in events:
+        yield _format_sse(item["event"], item["data"])
+
+        if item["event"] == "done" and user_id:
+            # The request-scoped session is not guaranteed to outlive the response
+            db = SessionLocal()
+            try:
+                db.add(Query(
+                    user_id=user_id,
+                    query_text=query_text,
+                    response_text=item["data"]["response"],
+                    query_type=query_type,
+                    language=language
+                ))
+                db.commit()
+            except Exception as e:
+                logger.error(f"Error saving streamed query: {str(e)}")
+            finally:
+                db.close()
+
+def _sse_response(stream: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.post("/ask", response_model=LegalQueryResponse)
 async def ask_legal_question(
     request: LegalQueryRequest,
     current_user: Optional[User] = Depends(get_optional_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """General legal query endpoint, now allows unauthenticated access"""
     try:
-        document_context = None
-        if request.document_id:
-            document = db.query(Document).filter(Document.id == request.document_id).first()
-            if not document:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Document not found."
-                )
-            # Ensure the document belongs to the current user if authenticated
-            if current_user and document.user_id != current_user.id:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="You do not have permission to access this document."
-                )
-            document_context = document.extracted_text
-
-        # Get AI response
+        documents = _get_document_scope(request, current_user, db)
+
+        # Get AI response; only the passages of the documents relevant to the query are used
         ai_response = await ai_service.answer_legal_query(
             query=request.query,
             language=request.language,
-            document_context=document_context # Pass document context to AI service
+            documents=documents,
+            document_types=request.document_types
         )
         
         # Save query to database only if user is authenticated
@@ -60,7 +157,8 @@ async def ask_legal_question(
             sources=ai_response["sources"],
             related_sections=ai_response.get("related_sections", []),
             confidence=ai_response["confidence"],
-            language=request.language
+            language=request.language,
+            cached=ai_response.get("cached", False)
         )
         
     except HTTPException as e:
@@ -72,11 +170,35 @@ async def ask_legal_question(
             detail="Error processing your query. Please try again."
         )
 
+@router.post("/ask/stream")
+async def ask_legal_question_stream(
+    request: LegalQueryRequest,
+    current_user: Optional[User] = Depends(get_optional_current_user),
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service)
+):
+    """Streaming variant of /ask: emits sources, then answer tokens, then related sections"""
+    documents = _get_document_scope(request, current_user, db)
+    events = ai_service.stream_legal_query(
+        query=request.query,
+        language=request.language,
+        documents=documents,
+        document_types=request.document_types
+    )
+    return _sse_response(_stream_events(
+        events,
+        user_id=current_user.id if current_user else None,
+        query_text=request.query,
+        query_type=request.query_type,
+        language=request.language
+    ))
+
 @router.post("/constitution", response_model=LegalQueryResponse)
 async def ask_constitution(
     request: ConstitutionQueryRequest,
     current_user: Optional[User] = Depends(get_optional_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """Ask about Constitution articles and legal terms, now allows unauthenticated access"""
     try:
@@ -102,7 +224,8 @@ async def ask_constitution(
             sources=ai_response["sources"],
             related_sections=ai_response.get("related_sections", []),
             confidence=ai_response["confidence"],
-            language=request.language
+            language=request.language,
+            cached=ai_response.get("cached", False)
         )
         
     except Exception as e:
@@ -112,6 +235,25 @@ async def ask_constitution(
             detail="Error processing your constitution query."
         )
 
+@router.post("/constitution/stream")
+async def ask_constitution_stream(
+    request: ConstitutionQueryRequest,
+    current_user: Optional[User] = Depends(get_optional_current_user),
+    ai_service: AIService = Depends(get_ai_service)
+):
+    """Streaming variant of /constitution"""
+    events = ai_service.stream_constitution_article(
+        article=request.article_or_term,
+        language=request.language
+    )
+    return _sse_response(_stream_events(
+        events,
+        user_id=current_user.id if current_user else None,
+        query_text=f"Constitution: {request.article_or_term}",
+        query_type="constitution",
+        language=request.language
+    ))
+
 @router.get("/history")
 async def get_query_history(
     current_user: User = Depends(get_current_user),
@@ -3,13 +3,13 @@ from sqlalchemy.orm import Session
 from app.database.connection import get_db
 from app.models.query import ScenarioRequest, LegalQueryResponse
 from app.services.ai_service import AIService
+from app.services.registry import get_ai_service
 from app.database.models import Query, User
 from app.routes.auth import get_current_user
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-ai_service = AIService()
 
 @router.get("/list")
 async def get_scenarios():
@@ -63,7 +63,8 @@ async def get_scenarios():
 async def analyze_scenario(
     request: ScenarioRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """Analyze a specific legal scenario"""
     try:
@@ -89,7 +90,8 @@ async def analyze_scenario(
             sources=ai_response["sources"],
             related_sections=ai_response.get("related_sections", []),
             confidence=ai_response["confidence"],
-            language=request.language
+            language=request.language,
+            cached=ai_response.get("cached", False)
         )
         
     except Exception as e:
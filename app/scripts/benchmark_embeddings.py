@@ -0,0 +1,136 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Add the parent directory to the Python path to allow for absolute imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import numpy as np
+from app.config import settings
+
+QUERIES = [
+    "What is the punishment for cheating under Section 420 IPC?",
+    "Can the police arrest without a warrant?",
+    "What are my rights if I am detained?",
+    "Is dowry demand a criminal offence?",
+    "How do I file an FIR for theft?",
+    "Does Article 21 cover the right to privacy?",
+    "What is anticipatory bail?",
+    "क्या पुलिस बिना वारंट के गिरफ्तार कर सकती है?",
+]
+SENTENCES = [
+    "Whoever commits murder shall be punished with death, or imprisonment for life, and shall also be liable to fine.",
+    "No person shall be deprived of his life or personal liberty except according to procedure established by law.",
+    "Any police officer may without an order from a Magistrate and without a warrant arrest any person.",
+    "Whoever cheats and thereby dishonestly induces the person deceived to deliver any property shall be punished.",
+    "The State shall not deny to any person equality before the law or the equal protection of the laws within India.",
+    "When any person accused of a non-bailable offence is arrested or detained without warrant he may be released on bail.",
+]
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare the torch and ONNX Runtime embedding backends: load time, RSS, single-query latency, "
+                    "bulk throughput and cosine agreement with the torch vectors. Each backend runs in a fresh process."
+    )
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--onnx-path", default=settings.EMBEDDING_ONNX_PATH, help="ONNX export directory (default: EMBEDDING_ONNX_PATH)")
+    parser.add_argument("--queries", type=int, default=200, help="Timed single-query encodes (default: 200)")
+    parser.add_argument("--documents", type=int, default=512, help="Chunk-sized texts for the throughput run (default: 512)")
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDING_ONNX_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=settings.EMBEDDING_ONNX_THREADS, help="Intra-op threads; 0 keeps each runtime's default")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def rss_mib() -> float:
+    """Current resident set size (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def chunk_texts(count: int, seed: int):
+    """Texts about CHUNK_SIZE characters long, like the stored statute chunks"""
+    rng = np.random.default_rng(seed)
+    texts = []
+    for _ in range(count):
+        text = ""
+        while len(text) < settings.CHUNK_SIZE:
+            text += SENTENCES[rng.integers(len(SENTENCES))] + " "
+        texts.append(text[:settings.CHUNK_SIZE])
+    return texts
+
+def measure(backend: str, options: dict) -> dict:
+    """Runs in a fresh process so import cost and memory are the backend's own"""
+    from app.utils.embeddings import create_embeddings
+
+    baseline_mib = rss_mib()
+    started_at = time.perf_counter()
+    embeddings = create_embeddings(
+        "torch" if backend == "torch" else "onnx",
+        settings.EMBEDDING_MODEL,
+        path=options["onnx_path"],
+        quantized=backend == "onnx-int8",
+        threads=options["threads"],
+        batch_size=options["batch_size"],
+    )
+    embeddings.embed_query("warm up")
+    load_s = time.perf_counter() - started_at
+    if backend == "torch" and options["threads"]:
+        import torch
+        torch.set_num_threads(options["threads"])
+
+    latencies = []
+    for i in range(options["queries"]):
+        started_at = time.perf_counter()
+        embeddings.embed_query(QUERIES[i % len(QUERIES)])
+        latencies.append(time.perf_counter() - started_at)
+    latencies_ms = np.asarray(latencies) * 1000
+
+    documents = chunk_texts(options["documents"], options["seed"])
+    started_at = time.perf_counter()
+    embeddings.embed_documents(documents)
+    throughput = len(documents) / (time.perf_counter() - started_at)
+
+    return {
+        "load_s": load_s,
+        "rss_mib": rss_mib() - baseline_mib,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "docs_per_s": throughput,
+        "vectors": np.asarray(embeddings.embed_documents(QUERIES + SENTENCES), dtype=np.float32),
+    }
+
+def main(args):
+    options = vars(args)
+    results = {}
+    print(f"{settings.EMBEDDING_MODEL}, {args.queries} queries, {args.documents} x {settings.CHUNK_SIZE}-char documents\n")
+    print(f"{'backend':<12}{'load s':>8}{'+RSS MiB':>10}{'p50 ms':>9}{'p99 ms':>9}{'docs/s':>9}{'cos min':>9}{'cos mean':>10}")
+    for backend in args.backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                results[backend] = pool.submit(measure, backend, options).result()
+            except Exception as e:
+                print(f"{backend:<12}skipped: {str(e)}")
+                continue
+        result = results[backend]
+        # Agreement with the vectors already in the index (torch), or with fp32 ONNX when torch did not run
+        reference = results.get("torch", results.get("onnx", result))["vectors"]
+        similarity = np.sum(reference * result["vectors"], axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(result["vectors"], axis=1)
+        )
+        print(
+            f"{backend:<12}{result['load_s']:>8.2f}{result['rss_mib']:>10.0f}{result['p50_ms']:>9.2f}"
+            f"{result['p99_ms']:>9.2f}{result['docs_per_s']:>9.1f}{similarity.min():>9.4f}{similarity.mean():>10.4f}"
+        )
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,102 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+# Add the parent directory to the Python path to allow for absolute imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import fitz  # PyMuPDF
+from app.config import settings
+from app.services.ocr_service import OCRService, IMAGE_EXTENSIONS, _ocr_pdf_page, _extract_image_pages
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare OCR pre-processing profiles on sample notices. Each sample (a PDF or image) needs a "
+                    "ground-truth transcript next to it named <sample>.gt.txt."
+    )
+    parser.add_argument("samples", help="Directory of sample documents and their .gt.txt transcripts")
+    parser.add_argument("--profiles", nargs="+", default=list(settings.OCR_PROFILES), help="Profiles to compare (default: all)")
+    parser.add_argument("--no-script-detection", action="store_true", help="Always OCR with the full language set")
+    return parser.parse_args()
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance, two rows at a time"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+def character_accuracy(ocr_text: str, truth: str) -> float:
+    ocr_text, truth = normalize(ocr_text), normalize(truth)
+    if not truth:
+        return 1.0 if not ocr_text else 0.0
+    return max(0.0, 1 - edit_distance(ocr_text, truth) / len(truth))
+
+def ocr_sample(path: str, options: dict):
+    """OCR every page of a sample, ignoring any text layer; returns (text, pages)"""
+    if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+        pages = _extract_image_pages(path, options)
+        return pages[0]["text"], 1
+
+    doc = fitz.open(path)
+    page_count = doc.page_count
+    doc.close()
+    texts = [_ocr_pdf_page(path, page_num, options)["text"] for page_num in range(page_count)]
+    return "\n".join(texts), page_count
+
+def main(args):
+    samples = sorted(
+        name for name in os.listdir(args.samples)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS | {".pdf"}
+        and os.path.exists(os.path.join(args.samples, f"{name}.gt.txt"))
+    )
+    if not samples:
+        print(f"No samples with .gt.txt transcripts found in {args.samples}")
+        return
+
+    unknown = set(args.profiles) - set(settings.OCR_PROFILES)
+    if unknown:
+        print(f"Unknown profiles: {', '.join(sorted(unknown))}")
+        return
+
+    base_options = dict(OCRService().ocr_options)
+    if args.no_script_detection:
+        base_options["detect_script"] = False
+
+    print(f"{len(samples)} samples, profiles: {', '.join(args.profiles)}\n")
+    print(f"{'profile':<12}{'sample':<32}{'pages':>6}{'seconds':>10}{'pages/s':>10}{'char acc':>10}")
+    for profile_name in args.profiles:
+        options = {**base_options, "profile": settings.OCR_PROFILES[profile_name]}
+        total_pages, total_seconds, accuracies = 0, 0.0, []
+        for name in samples:
+            path = os.path.join(args.samples, name)
+            with open(f"{path}.gt.txt", "r", encoding="utf-8") as f:
+                truth = f.read()
+
+            started_at = time.perf_counter()
+            text, pages = ocr_sample(path, options)
+            elapsed = time.perf_counter() - started_at
+            accuracy = character_accuracy(text, truth)
+
+            total_pages += pages
+            total_seconds += elapsed
+            accuracies.append(accuracy)
+            print(f"{profile_name:<12}{name[:30]:<32}{pages:>6}{elapsed:>10.2f}{pages / elapsed:>10.2f}{accuracy:>10.1%}")
+
+        print(
+            f"{profile_name:<12}{'TOTAL':<32}{total_pages:>6}{total_seconds:>10.2f}"
+            f"{total_pages / total_seconds:>10.2f}{sum(accuracies) / len(accuracies):>10.1%}\n"
+        )
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,87 @@
+import argparse
+import os
+import sys
+import time
+
+# Add the parent directory to the Python path to allow for absolute imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import numpy as np
+from app.utils.embeddings import SimilarityIndex
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare the Python-loop top-k search EmbeddingService used to do with SimilarityIndex "
+                    "on random unit vectors shaped like the statute corpus."
+    )
+    parser.add_argument("--vectors", type=int, default=300_000, help="Indexed vectors (default: 300000)")
+    parser.add_argument("--dimension", type=int, default=384, help="Embedding dimension (default: 384, all-MiniLM-L6-v2)")
+    parser.add_argument("--queries", type=int, default=256, help="Queries for the vectorised runs (default: 256)")
+    parser.add_argument("--loop-queries", type=int, default=2, help="Queries for the slow Python loop (default: 2)")
+    parser.add_argument("-k", type=int, default=5, help="Results per query (default: 5)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def loop_top_k(query: np.ndarray, candidates: np.ndarray, top_k: int):
+    """The previous EmbeddingService.find_most_similar"""
+    similarities = []
+    for i, candidate in enumerate(candidates):
+        similarity = np.dot(query, candidate) / (np.linalg.norm(query) * np.linalg.norm(candidate))
+        similarities.append((i, similarity))
+    similarities.sort(key=lambda x: x[1], reverse=True)
+    return [idx for idx, _ in similarities[:top_k]]
+
+def timed(function, *args, **kwargs):
+    started_at = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started_at
+
+def report(name: str, queries: int, seconds: float):
+    print(f"{name:<34}{queries:>8}{seconds * 1000 / queries:>14.3f}{queries / seconds:>12.1f}")
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((args.vectors, args.dimension), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dimension), dtype=np.float32)
+    ids = [f"chunk_{i}" for i in range(args.vectors)]
+    document_types = np.array(["constitution", "ipc", "crpc", "act"])
+    metadatas = [{"document_type": document_types[i % 4]} for i in range(args.vectors)]
+
+    index = SimilarityIndex(args.dimension, capacity=args.vectors)
+    _, build_seconds = timed(index.add, ids, vectors, metadatas)
+    print(f"{args.vectors} x {args.dimension} vectors, {index.vectors.nbytes / 2**20:.0f} MiB, indexed in {build_seconds:.2f}s\n")
+    print(f"{'method':<34}{'queries':>8}{'ms/query':>14}{'queries/s':>12}")
+
+    loop_queries = queries[:args.loop_queries]
+    loop_results = []
+    started_at = time.perf_counter()
+    for query in loop_queries:
+        loop_results.append(loop_top_k(query, vectors, args.k))
+    report("python loop (previous)", len(loop_queries), time.perf_counter() - started_at)
+
+    single_results = []
+    started_at = time.perf_counter()
+    for query in queries:
+        single_results.append(index.search(query, args.k)[0])
+    report("SimilarityIndex, one at a time", len(queries), time.perf_counter() - started_at)
+
+    batch_results, seconds = timed(index.search, queries, args.k)
+    report("SimilarityIndex, batched", len(queries), seconds)
+
+    _, seconds = timed(index.search, queries, args.k, where={"document_type": "ipc"})
+    report("SimilarityIndex, batched + filter", len(queries), seconds)
+
+    matches = sum(
+        [f"chunk_{i}" for i in expected] == [chunk_id for chunk_id, _ in hits]
+        for expected, hits in zip(loop_results, batch_results)
+    )
+    print(f"\nTop-{args.k} identical to the loop for {matches}/{len(loop_results)} queries")
+    # Scores may differ in the last bits between BLAS paths; the rankings should not
+    same_ids = sum(
+        [chunk_id for chunk_id, _ in batched] == [chunk_id for chunk_id, _ in single]
+        for batched, single in zip(batch_results, single_results)
+    )
+    print(f"Batched and one-at-a-time results identical for {same_ids}/{len(queries)} queries")
+
+if __name__ == "__main__":
+    main(parse_args())
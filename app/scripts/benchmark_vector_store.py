@@ -0,0 +1,166 @@
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Optional
+
+# Add the parent directory to the Python path to allow for absolute imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import numpy as np
+from app.config import settings
+from app.services.vector_store import QUANTIZATIONS, ChromaVectorStore, NativeVectorStore
+from app.utils.embeddings import normalize_rows, top_k_rows
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare vector store backends and native quantizations: build time, cold start, "
+                    "memory scanned by search, recall@k against exact search and p50/p99 single-query latency."
+    )
+    parser.add_argument("--vectors", type=int, default=100_000, help="Synthetic vectors to index (default: 100000)")
+    parser.add_argument("--dimension", type=int, default=384, help="Embedding dimension (default: 384)")
+    parser.add_argument("--queries", type=int, default=200, help="Timed queries per backend (default: 200)")
+    parser.add_argument("-k", type=int, default=10, help="Results per query (default: 10)")
+    parser.add_argument("--ivf-lists", type=int, default=256, help="Lists for the native IVF runs; 0 skips them (default: 256)")
+    parser.add_argument("--probes", type=int, nargs="+", default=[4, 8, 16], help="nprobe values for the IVF runs")
+    parser.add_argument("--quantizations", nargs="+", default=["none", "float16", "int8"], choices=list(QUANTIZATIONS),
+                        help="Native search encodings to compare")
+    parser.add_argument("--rescore-factors", type=int, nargs="+", default=[1, 4],
+                        help="Quantised candidates rescored at full precision, per result (default: 1 4)")
+    parser.add_argument("--float16-cache-mb", type=int, default=settings.NATIVE_FLOAT16_CACHE_MB,
+                        help="float32 decode cache for the float16 runs, also run without it (default: NATIVE_FLOAT16_CACHE_MB)")
+    parser.add_argument("--backends", nargs="+", default=["chroma", "native"], choices=["chroma", "native"])
+    parser.add_argument("--from-chroma", action="store_true", help="Use the vectors of the configured legal_documents collection instead of synthetic ones")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def synthetic_vectors(count: int, dimension: int, rng: np.random.Generator) -> np.ndarray:
+    """Clustered unit vectors, closer to sentence embeddings than isotropic noise"""
+    centers = rng.standard_normal((max(1, count // 500), dimension), dtype=np.float32)
+    assignments = rng.integers(0, len(centers), size=count)
+    return normalize_rows(centers[assignments] + 0.6 * rng.standard_normal((count, dimension), dtype=np.float32))
+
+def chroma_vectors() -> np.ndarray:
+    collection = ChromaVectorStore().get_or_create_collection("legal_documents")
+    batches, offset = [], 0
+    while True:
+        batch = collection.get(include=["embeddings"], limit=5000, offset=offset)
+        if not len(batch["ids"]):
+            break
+        batches.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        offset += len(batch["ids"])
+    if not batches:
+        raise SystemExit("The legal_documents collection is empty; run process_documents.py first")
+    return normalize_rows(np.concatenate(batches))
+
+def load(collection, vectors: np.ndarray, batch_size: int = 5000):
+    for start in range(0, len(vectors), batch_size):
+        rows = range(start, min(start + batch_size, len(vectors)))
+        collection.upsert(
+            ids=[str(row) for row in rows],
+            embeddings=vectors[start:start + batch_size],
+            documents=[f"chunk {row}" for row in rows],
+            metadatas=[{"document_type": "act"} for _ in rows],
+        )
+
+def measure(collection, queries: np.ndarray, truth: np.ndarray, k: int):
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        started_at = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+        latencies.append(time.perf_counter() - started_at)
+        recalls.append(len({int(item_id) for item_id in result["ids"][0]} & set(expected.tolist())) / k)
+    latencies_ms = np.asarray(latencies) * 1000
+    return float(np.mean(recalls)), float(np.percentile(latencies_ms, 50)), float(np.percentile(latencies_ms, 99))
+
+def report(name: str, build_s: float, open_ms: float, search_bytes: Optional[int], recall: float, p50: float, p99: float):
+    memory = f"{search_bytes / 2**20:.1f}" if search_bytes is not None else "-"
+    print(f"{name:<30}{build_s:>10.1f}{open_ms:>10.1f}{memory:>12}{recall:>10.3f}{p50:>10.2f}{p99:>10.2f}")
+
+def run_chroma(vectors, queries, truth, k, workdir):
+    import chromadb
+    from chromadb.config import Settings as ChromaSettings
+
+    path = os.path.join(workdir, "chroma")
+    client = chromadb.PersistentClient(path=path, settings=ChromaSettings(anonymized_telemetry=False))
+    collection = client.create_collection("benchmark", metadata={"hnsw:space": "cosine"})
+    started_at = time.perf_counter()
+    load(collection, vectors)
+    build_s = time.perf_counter() - started_at
+    del collection, client
+
+    started_at = time.perf_counter()
+    collection = ChromaVectorStore(path).get_or_create_collection("benchmark")
+    collection.query(query_embeddings=[queries[0].tolist()], n_results=k, include=[])
+    open_ms = (time.perf_counter() - started_at) * 1000
+    report("chroma (hnsw)", build_s, open_ms, None, *measure(collection, queries, truth, k))
+
+def run_native(vectors, queries, truth, k, workdir, ivf_lists, probes, quantizations, rescore_factors, float16_cache_mb):
+    path = os.path.join(workdir, "native")
+    collection = NativeVectorStore(path, ivf_lists=0, quantization="none").get_or_create_collection("benchmark")
+    started_at = time.perf_counter()
+    load(collection, vectors)
+    collection.compact()
+    build_s = time.perf_counter() - started_at
+    train_s = 0.0
+    if ivf_lists:
+        started_at = time.perf_counter()
+        collection.build_ivf(ivf_lists)
+        train_s = time.perf_counter() - started_at
+
+    def cold_open(quantization: str, rescore_factor: int, ivf_probes: int, cache_mb: int):
+        started_at = time.perf_counter()
+        reopened = NativeVectorStore(
+            path, ivf_probes=ivf_probes, quantization=quantization, rescore_factor=rescore_factor, float16_cache_mb=cache_mb
+        ).get_or_create_collection("benchmark")
+        reopened.query(query_embeddings=[queries[0].tolist()], n_results=k, include=[])
+        return reopened, (time.perf_counter() - started_at) * 1000
+
+    for quantization in quantizations:
+        # Re-encode the segments; the float32 vectors and IVF lists are kept
+        started_at = time.perf_counter()
+        NativeVectorStore(path, quantization=quantization).get_or_create_collection("benchmark").compact()
+        encode_s = time.perf_counter() - started_at
+        # float16 is shown scanning its codes (half the memory, slow) and with the float32 decode cache (fast)
+        cache_sizes = [0, float16_cache_mb] if quantization == "float16" and float16_cache_mb else [0]
+        for rescore_factor, cache_mb in itertools.product(rescore_factors if quantization != "none" else [1], cache_sizes):
+            suffix = (f" x{rescore_factor}" if quantization != "none" else "") + (" +f32" if cache_mb else "")
+            reopened, open_ms = cold_open(quantization, rescore_factor, 0, cache_mb)
+            stats = reopened.stats()
+            # Decoded copies are memory held for search too
+            search_bytes = stats["search_bytes"] + stats["decoded_bytes"]
+            # With a trained quantiser, zero probes falls back to exact search
+            report(f"native {quantization} flat{suffix}", build_s + encode_s, open_ms, search_bytes, *measure(reopened, queries, truth, k))
+            for nprobe in (probes if ivf_lists else []):
+                reopened, open_ms = cold_open(quantization, rescore_factor, nprobe, cache_mb)
+                report(f"native {quantization} ivf{ivf_lists}/{nprobe}{suffix}", build_s + train_s + encode_s, open_ms, search_bytes,
+                       *measure(reopened, queries, truth, k))
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    vectors = chroma_vectors() if args.from_chroma else synthetic_vectors(args.vectors, args.dimension, rng)
+    # Queries are perturbed corpus vectors, like questions phrased close to a provision
+    queries = normalize_rows(vectors[rng.integers(0, len(vectors), size=args.queries)]
+                             + 0.3 * rng.standard_normal((args.queries, vectors.shape[1]), dtype=np.float32))
+    truth, _ = top_k_rows(queries @ vectors.T, args.k)
+
+    print(f"{len(vectors)} x {vectors.shape[1]} vectors, {args.queries} queries, k={args.k}\n")
+    print(f"{'backend':<30}{'build s':>10}{'cold ms':>10}{'search MiB':>12}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    workdir = tempfile.mkdtemp(prefix="vector_store_benchmark_")
+    try:
+        if "chroma" in args.backends:
+            try:
+                run_chroma(vectors, queries, truth, args.k, workdir)
+            except ImportError:
+                print("chroma: chromadb is not installed, skipped")
+        if "native" in args.backends:
+            run_native(vectors, queries, truth, args.k, workdir, args.ivf_lists, args.probes, args.quantizations, args.rescore_factors,
+                       args.float16_cache_mb)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main(parse_args())
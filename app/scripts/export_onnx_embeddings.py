@@ -0,0 +1,87 @@
+import argparse
+import os
+import sys
+
+# Add the parent directory to the Python path to allow for absolute imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import numpy as np
+from app.config import settings
+from app.utils.embeddings import OnnxEmbeddings, normalize_rows
+
+SAMPLE_TEXTS = [
+    "What is the punishment for cheating under Section 420 IPC?",
+    "Article 21 protects life and personal liberty.",
+    "Whoever commits murder shall be punished with death, or imprisonment for life, and shall also be liable to fine.",
+    "क्या पुलिस बिना वारंट के गिरफ्तार कर सकती है?",
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Export EMBEDDING_MODEL to ONNX (and optionally an int8 copy) for EMBEDDING_BACKEND=onnx. "
+                    "Needs torch, sentence-transformers, onnx and onnxruntime; the server then only needs onnxruntime."
+    )
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL, help="sentence-transformers model to export")
+    parser.add_argument("--output", default=settings.EMBEDDING_ONNX_PATH, help="Export directory (default: EMBEDDING_ONNX_PATH)")
+    parser.add_argument("--quantize", action="store_true", help="Also write model_quantized.onnx with int8 weights")
+    parser.add_argument("--opset", type=int, default=14)
+    return parser.parse_args()
+
+def export(model_name: str, output: str, opset: int):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    # Writes tokenizer.json and the pooling/normalisation config OnnxEmbeddings reads
+    model.save(output)
+    transformer = model[0].auto_model.eval()
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, module):
+            super().__init__()
+            self.module = module
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.module(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+    sample = model.tokenizer(SAMPLE_TEXTS[:2], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(transformer),
+            tuple(sample[name] for name in input_names),
+            os.path.join(output, "model.onnx"),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    return model
+
+def quantize(output: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(
+        os.path.join(output, "model.onnx"),
+        os.path.join(output, "model_quantized.onnx"),
+        weight_type=QuantType.QInt8,
+    )
+
+def main(args):
+    os.makedirs(args.output, exist_ok=True)
+    model = export(args.model, args.output, args.opset)
+    print(f"Exported {args.model} to {os.path.join(args.output, 'model.onnx')}")
+    if args.quantize:
+        quantize(args.output)
+        print(f"Wrote int8 weights to {os.path.join(args.output, 'model_quantized.onnx')}")
+
+    # The ONNX vectors must stay interchangeable with the ones already in the index
+    expected = normalize_rows(model.encode(SAMPLE_TEXTS, convert_to_numpy=True))
+    for quantized in ([False, True] if args.quantize else [False]):
+        actual = OnnxEmbeddings(args.output, quantized=quantized).encode(SAMPLE_TEXTS)
+        similarity = np.sum(expected * normalize_rows(actual), axis=1)
+        print(f"{'int8' if quantized else 'fp32'}: cosine to torch vectors min {similarity.min():.4f}, mean {similarity.mean():.4f}")
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import os
 import sys
@@ -6,31 +7,123 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 from app.services.vector_service import VectorService
+from app.services.statute_index import StatuteIndex, DOCUMENT_TITLES
+from app.services.ingestion_manifest import IngestionManifest, file_sha256
+from app.services.ingestion_pipeline import IngestionPipeline
+from app.database.connection import create_tables
 
-async def main():
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest the bare acts in app/legal_documents into the vector database.")
+    parser.add_argument("--only", nargs="+", metavar="FILE", help="Only process these file names (other files are left untouched)")
+    parser.add_argument("--force", action="store_true", help="Re-ingest files even if they are unchanged")
+    parser.add_argument("--optimize", action="store_true", help="Run vector store maintenance even if no file changed (e.g. after changing NATIVE_QUANTIZATION)")
+    return parser.parse_args()
+
+async def main(args):
     """
-    This script processes all the documents in the legal_documents directory and stores them in the vector database.
+    This script incrementally processes the documents in the legal_documents directory and stores them in the vector database.
+    Unchanged files are skipped, changed files are re-ingested and files that were removed have their chunks deleted.
+    Files are parsed in parallel and streamed through batched embedding and writes; an interrupted run can be
+    repeated and resumes without re-embedding chunks that were already stored.
     """
     # Create an instance of the VectorService
     vector_service = VectorService()
+    manifest = IngestionManifest()
 
     # Get the path to the legal_documents directory
     legal_documents_dir = os.path.join(os.path.dirname(__file__), '..', 'legal_documents')
 
     # Get the list of files in the directory
-    document_paths = [os.path.join(legal_documents_dir, f) for f in os.listdir(legal_documents_dir) if os.path.isfile(os.path.join(legal_documents_dir, f))]
+    document_names = sorted(f for f in os.listdir(legal_documents_dir) if os.path.isfile(os.path.join(legal_documents_dir, f)))
+    if args.only:
+        unknown = set(args.only) - set(document_names)
+        if unknown:
+            print(f"Not found in legal_documents: {', '.join(sorted(unknown))}")
+        document_names = [name for name in document_names if name in args.only]
+
+    create_tables()
+    statute_index = StatuteIndex()
+    summary = {"ingested": 0, "skipped": 0, "removed": 0, "failed": 0}
+
+    files = []
+    for name in document_names:
+        doc_path = os.path.join(legal_documents_dir, name)
+        content_hash = file_sha256(doc_path)
+
+        # The store is checked too, so switching VECTOR_STORE_BACKEND re-ingests into the new store
+        if not args.force and manifest.is_current(name, content_hash) and await vector_service.has_chunks(doc_path):
+            print(f"Skipping {name} (unchanged)")
+            summary["skipped"] += 1
+            continue
+
+        files.append({
+            "name": name,
+            "path": doc_path,
+            "sha256": content_hash,
+            # The previous version's chunks are deleted unless they are still current
+            "previous_chunk_ids": manifest.chunk_ids(name),
+        })
+
+    ingested = []
+
+    def on_file_done(file, chunk_ids):
+        ingested.append((file, chunk_ids))
+        print(f"Ingested {file['name']}: {len(chunk_ids)} chunks")
+
+    stats = None
+    if files:
+        pipeline = IngestionPipeline(vector_service, progress=print)
+        stats = await pipeline.run(files, force=args.force, on_file_done=on_file_done)
+        if stats["failed_files"]:
+            # Not recorded in the manifest, so the next run retries them
+            print(f"Failed to ingest, will be retried next run: {', '.join(stats['failed_files'])}")
+            summary["failed"] += len(stats["failed_files"])
+
+    # Parse the bare acts into per-Article/Section records for exact lookup. A file is only
+    # recorded in the manifest once this succeeds, so a failed rebuild is retried on the next run
+    for file, chunk_ids in ingested:
+        document_type = vector_service._get_document_type(file["path"])
+        if document_type in DOCUMENT_TITLES and file["path"].lower().endswith(".pdf"):
+            try:
+                count = statute_index.build_from_pdf(file["path"], document_type)
+            except Exception as e:
+                print(f"Error indexing provisions of {file['name']}, it will be processed again next run: {str(e)}")
+                summary["failed"] += 1
+                continue
+            print(f"Indexed {count} provisions from {file['name']} for exact lookup.")
+        manifest.record(file["name"], file["sha256"], chunk_ids)
+        manifest.save()
+        summary["ingested"] += 1
+
+    # Remove chunks of files that are no longer in the library
+    if not args.only:
+        for name in sorted(set(manifest.files) - set(document_names)):
+            deleted = await vector_service.delete_chunks(ids=manifest.chunk_ids(name))
+            document_type = vector_service._get_document_type(name)
+            if document_type in DOCUMENT_TITLES:
+                statute_index.remove(document_type)
+            manifest.forget(name)
+            manifest.save()
+            summary["removed"] += 1
+            print(f"Removed {name}: deleted {deleted} chunks")
+
+    if ingested or summary["removed"] or args.optimize:
+        store_stats = await asyncio.to_thread(vector_service.optimize)
+        if store_stats:
+            print(f"Optimized {vector_service.store.name} store: {store_stats}")
 
-    # Process and store the documents
-    if document_paths:
-        print(f"Processing {len(document_paths)} documents...")
-        await vector_service.process_and_store_documents(document_paths)
-        print("Documents processed and stored successfully.")
-    else:
-        print("No documents found in the legal_documents directory.")
+    vector_service.close()
+    print(f"Done: {summary['ingested']} ingested, {summary['skipped']} unchanged, {summary['removed']} removed, {summary['failed']} failed.")
+    if stats:
+        print(
+            f"Throughput: {stats['pages']} pages, {stats['chunks']} chunks in {stats['elapsed_s']}s "
+            f"({stats['pages_per_s']} pages/s, {stats['chunks_per_s']} chunks/s); "
+            f"{stats['embedded_chunks']} embedded, {stats['resumed_chunks']} resumed, {stats['deleted_chunks']} stale chunks deleted."
+        )
 
 if __name__ == "__main__":
     # To avoid RuntimeError: Event loop is closed
     # https://docs.python.org/3/library/asyncio-policy.html#asyncio.WindowsSelectorEventLoopPolicy
     if sys.platform == "win32":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(parse_args()))
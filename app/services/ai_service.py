@@ -1,57 +1,189 @@
 import google.generativeai as genai
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 from app.config import settings
 from app.services.vector_service import VectorService
+from app.services.executor import execution_service
+from app.services.job_queue import document_jobs
+from app.services.cache_service import AnswerCache
+from app.services.statute_index import StatuteIndex
+from app.services.context_builder import ContextBuilder, CHARS_PER_TOKEN, estimate_tokens
+from app.services.ocr_service import text_to_pages
+from app.utils.text_processing import TextProcessor
+import asyncio
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+NO_RESULTS_MESSAGE = "I couldn't find relevant legal information for your query. Please try rephrasing your question."
+ERROR_MESSAGE = "I'm sorry, I encountered an error while processing your query. Please try again."
+ANALYSIS_ERROR_MESSAGE = "Error analyzing document. Please try again."
+MAX_EXACT_PROVISIONS = 3
+
 class AIService:
-    def __init__(self):
+    def __init__(
+        self,
+        vector_service: Optional[VectorService] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        statute_index: Optional[StatuteIndex] = None
+    ):
         genai.configure(api_key=settings.GEMINI_API_KEY)
         self.model = genai.GenerativeModel('gemini-1.5-flash')
-        self.vector_service = VectorService()
+        self.vector_service = vector_service or VectorService()
+        self.statute_index = statute_index or StatuteIndex()
+        self.text_processor = TextProcessor()
+        self.context_builder = ContextBuilder()
+        if answer_cache is None and settings.ANSWER_CACHE_ENABLED:
+            answer_cache = AnswerCache()
+        self.answer_cache = answer_cache
         
-    async def answer_legal_query(self, query: str, language: str = "en", document_context: Optional[str] = None) -> Dict[str, Any]:
-        """Answer legal queries using RAG approach"""
+    async def answer_legal_query(
+        self,
+        query: str,
+        language: str = "en",
+        document_context: Optional[str] = None,
+        documents: Optional[Dict[str, Any]] = None,
+        document_types: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Answer legal queries using RAG approach.
+
+        documents scopes part of the retrieval to some of one user's uploads:
+        {"user_id": ..., "documents": [{"file_path", "filename", "extracted_text"}]}.
+        Only their most relevant passages go into the prompt. document_types
+        restricts statute retrieval to those acts.
+        """
         try:
-            # Get relevant documents from vector database
-            search_results = await self.vector_service.similarity_search(query, k=5)
+            # Get relevant provisions (exact Article/Section hits first, then vector search)
+            search_results, document_context = await self._retrieve_with_documents(query, documents, document_types, document_context)
             
-            if not search_results:
+            if not search_results and not document_context:
                 return {
-                    "response": "I couldn't find relevant legal information for your query. Please try rephrasing your question.",
+                    "response": NO_RESULTS_MESSAGE,
                     "sources": [],
                     "confidence": 0.0
                 }
             
             # Prepare context from search results
-            context = self._prepare_context(search_results)
+            packed = await self._prepare_context(query, search_results, language)
+            
+            # Serve repeated questions over the same context chunks from cache
+            cache_key = self._answer_cache_key(query, language, packed["results"], document_context)
+            if cache_key:
+                cached_response = await self.answer_cache.get(cache_key)
+                if cached_response is not None:
+                    cached_response["cached"] = True
+                    return cached_response
             
             # Create prompt
-            prompt = self._create_legal_prompt(query, context, language, document_context)
+            prompt = self._create_legal_prompt(query, packed["context"], language, document_context)
             
             # Generate response
-            response = self.model.generate_content(prompt)
+            response = await self._generate(prompt)
             
             # Parse response
-            parsed_response = self._parse_ai_response(response.text, search_results)
+            parsed_response = self._parse_ai_response(response.text, packed["results"])
+            
+            if cache_key:
+                await self.answer_cache.set(cache_key, parsed_response)
             
+            parsed_response["cached"] = False
             return parsed_response
             
         except Exception as e:
             logger.error(f"Error in AI service: {str(e)}")
             return {
-                "response": "I'm sorry, I encountered an error while processing your query. Please try again.",
+                "response": ERROR_MESSAGE,
                 "sources": [],
                 "confidence": 0.0
             }
     
+    async def stream_legal_query(
+        self,
+        query: str,
+        language: str = "en",
+        document_context: Optional[str] = None,
+        documents: Optional[Dict[str, Any]] = None,
+        document_types: Optional[List[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Answer legal queries as a stream of events.
+
+        Yields a "sources" event as soon as retrieval finishes, then "token" events
+        as Gemini produces text, then a final "done" event carrying the full
+        response and related sections. Failures are reported as an "error" event.
+        """
+        try:
+            search_results, document_context = await self._retrieve_with_documents(query, documents, document_types, document_context)
+            
+            if not search_results and not document_context:
+                yield {"event": "sources", "data": {"sources": [], "confidence": 0.0}}
+                yield {"event": "token", "data": {"text": NO_RESULTS_MESSAGE}}
+                yield {"event": "done", "data": {"response": NO_RESULTS_MESSAGE, "related_sections": []}}
+                return
+            
+            packed = await self._prepare_context(query, search_results, language)
+            cache_key = self._answer_cache_key(query, language, packed["results"], document_context)
+            cached_response = await self.answer_cache.get(cache_key) if cache_key else None
+            
+            yield {
+                "event": "sources",
+                "data": {
+                    "sources": self._collect_sources(packed["results"]),
+                    "confidence": self._average_confidence(packed["results"]),
+                    "cached": cached_response is not None
+                }
+            }
+            
+            if cached_response is not None:
+                yield {"event": "token", "data": {"text": cached_response["response"]}}
+                yield {
+                    "event": "done",
+                    "data": {
+                        "response": cached_response["response"],
+                        "related_sections": cached_response.get("related_sections", []),
+                        "cached": True
+                    }
+                }
+                return
+            
+            prompt = self._create_legal_prompt(query, packed["context"], language, document_context)
+            
+            response_parts = []
+            async with execution_service.limit("llm"):
+                response = await self.model.generate_content_async(prompt, stream=True)
+                async for chunk in response:
+                    text = chunk.text
+                    if text:
+                        response_parts.append(text)
+                        yield {"event": "token", "data": {"text": text}}
+            
+            response_text = "".join(response_parts)
+            parsed_response = self._parse_ai_response(response_text, packed["results"])
+            if cache_key:
+                await self.answer_cache.set(cache_key, parsed_response)
+            
+            yield {
+                "event": "done",
+                "data": {
+                    "response": response_text,
+                    "related_sections": parsed_response["related_sections"],
+                    "cached": False
+                }
+            }
+            
+        except Exception as e:
+            logger.error(f"Error streaming AI response: {str(e)}")
+            yield {"event": "error", "data": {"detail": ERROR_MESSAGE}}
+    
     async def explain_constitution_article(self, article: str, language: str = "en") -> Dict[str, Any]:
         """Explain specific constitutional articles"""
-        query = f"Article {article} Indian Constitution meaning explanation"
-        return await self.answer_legal_query(query, language)
+        return await self.answer_legal_query(self._constitution_query(article), language, document_types=["constitution"])
+    
+    def stream_constitution_article(self, article: str, language: str = "en") -> AsyncIterator[Dict[str, Any]]:
+        """Streaming variant of explain_constitution_article"""
+        return self.stream_legal_query(self._constitution_query(article), language, document_types=["constitution"])
+    
+    def _constitution_query(self, article: str) -> str:
+        return f"Article {article} Indian Constitution meaning explanation"
     
     async def analyze_legal_scenario(self, scenario: str, scenario_type: str, language: str = "en") -> Dict[str, Any]:
         """Analyze real-life legal scenarios"""
@@ -75,9 +207,18 @@ class AIService:
         return response
     
     async def analyze_legal_document(self, document_text: str, language: str = "en") -> Dict[str, Any]:
-        """Analyze uploaded legal documents"""
+        """Analyze uploaded legal documents.
+
+        Documents over DOCUMENT_ANALYSIS_SINGLE_SHOT_TOKENS (estimated) are
+        analysed map-reduce style instead of in a single prompt.
+        """
         try:
-            prompt = f"""
+            if estimate_tokens(document_text) > settings.DOCUMENT_ANALYSIS_SINGLE_SHOT_TOKENS:
+                analysis_mode = "map_reduce"
+                response = await self._analyze_long_document(document_text, language)
+            else:
+                analysis_mode = "single_shot"
+                prompt = f"""
             Analyze this legal document and provide a clear, simple explanation in {language}:
             
             Document: {document_text}
@@ -91,34 +232,171 @@ class AIService:
             
             Respond in a helpful, non-technical way that a common person can understand.
             """
-            
-            response = self.model.generate_content(prompt)
+                
+                response = await self._generate(prompt)
             
             return {
                 "analysis": response.text,
                 "document_type": self._identify_document_type(document_text),
                 "urgency_level": self._assess_urgency(document_text),
-                "recommended_action": self._suggest_action(response.text)
+                "recommended_action": self._suggest_action(response.text),
+                "analysis_mode": analysis_mode,
+                "analysis_status": "completed"
             }
             
         except Exception as e:
             logger.error(f"Error analyzing document: {str(e)}")
             return {
-                "analysis": "Error analyzing document. Please try again.",
+                "analysis": ANALYSIS_ERROR_MESSAGE,
                 "document_type": "unknown",
                 "urgency_level": "medium",
-                "recommended_action": "Consult a legal expert"
+                "recommended_action": "Consult a legal expert",
+                "analysis_status": "failed"
             }
     
-    def _prepare_context(self, search_results: List[Dict[str, Any]]) -> str:
-        """Prepare context from search results"""
-        context_parts = []
-        for result in search_results[:3]:  # Use top 3 results
-            source = result["metadata"].get("source", "Unknown")
-            content = result["content"][:500]  # Limit content length
-            context_parts.append(f"Source: {source}\nContent: {content}")
+    async def _analyze_long_document(self, document_text: str, language: str):
+        """Map-reduce analysis: extract notes from section-aware chunks concurrently, then merge them.
+
+        The chunk size grows for very long documents so the number of map calls
+        stays around DOCUMENT_ANALYSIS_MAX_CHUNKS, which bounds latency and cost.
+        """
+        chunk_tokens = max(
+            settings.DOCUMENT_ANALYSIS_CHUNK_TOKENS,
+            -(-estimate_tokens(document_text) // settings.DOCUMENT_ANALYSIS_MAX_CHUNKS)
+        )
+        chunks = self.text_processor.split_sections(document_text, chunk_tokens * CHARS_PER_TOKEN)
+        semaphore = asyncio.Semaphore(settings.DOCUMENT_ANALYSIS_MAX_CONCURRENCY)
         
-        return "\n\n".join(context_parts)
+        async def extract_notes(index: int, chunk: str) -> Optional[str]:
+            prompt = f"""
+            You are reading part {index + 1} of {len(chunks)} of a longer legal document.
+            From this part only, extract as short bullet points:
+            - Document type clues and the parties involved
+            - Key points and facts
+            - Obligations and actions required, and of whom
+            - Dates, deadlines, amounts and penalties
+            - Rights or remedies mentioned
+            Write "None" under a heading if this part has nothing for it. Do not add anything not in the text.
+            
+            Part {index + 1}:
+            {chunk}
+            """
+            async with semaphore:
+                try:
+                    response = await self._generate(prompt)
+                    return response.text
+                except Exception as e:
+                    logger.error(f"Error extracting notes from part {index + 1} of {len(chunks)}: {str(e)}")
+                    return None
+        
+        notes = await asyncio.gather(*[extract_notes(index, chunk) for index, chunk in enumerate(chunks)])
+        if not any(notes):
+            raise RuntimeError("No part of the document could be analyzed")
+        
+        combined_notes = "\n\n".join(
+            f"Notes from part {index + 1}:\n{part_notes}"
+            for index, part_notes in enumerate(notes) if part_notes
+        )
+        logger.info(f"Analyzed long document in {len(chunks)} parts ({sum(1 for n in notes if n)} succeeded)")
+        
+        prompt = f"""
+            The following notes were extracted, part by part, from one long legal document.
+            Combine them into a clear, simple explanation in {language}:
+            
+            {combined_notes}
+            
+            Please provide:
+            1. What type of legal document this is
+            2. Key points in simple language
+            3. What action (if any) is required
+            4. Important dates or deadlines
+            5. Your legal rights in this situation
+            
+            Merge duplicates, keep every distinct date and obligation, and respond in a helpful,
+            non-technical way that a common person can understand.
+            """
+        return await self._generate(prompt)
+    
+    async def _retrieve(self, query: str, document_types: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Resolve explicitly named Articles/Sections exactly, falling back to vector search"""
+        if self.statute_index.needs_refresh():
+            await execution_service.run_io(self.statute_index.refresh)
+        
+        provisions = self.statute_index.resolve(query)
+        if document_types:
+            provisions = [provision for provision in provisions if provision["document_type"] in document_types]
+        if provisions:
+            return [self.statute_index.to_search_result(provision) for provision in provisions[:MAX_EXACT_PROVISIONS]]
+        
+        return await self.vector_service.similarity_search(query, k=settings.CONTEXT_CANDIDATES, document_types=document_types)
+    
+    async def _retrieve_with_documents(
+        self,
+        query: str,
+        documents: Optional[Dict[str, Any]],
+        document_types: Optional[List[str]],
+        document_context: Optional[str]
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Run statute retrieval and, for referenced documents, passage retrieval concurrently"""
+        if not documents:
+            return await self._retrieve(query, document_types), document_context
+        search_results, document_context = await asyncio.gather(
+            self._retrieve(query, document_types),
+            self._document_passages(query, documents)
+        )
+        return search_results, document_context
+    
+    async def _document_passages(self, query: str, documents: Dict[str, Any]) -> Optional[str]:
+        """The passages of a user's documents most relevant to the query, within DOCUMENT_CONTEXT_TOKEN_BUDGET.
+
+        Documents not yet marked indexed (uploaded before per-user collections,
+        or whose chunks failed to store) are checked once: indexed on their
+        first question when their text is supplied, then marked indexed.
+        """
+        user_id = documents["user_id"]
+        collection = await self.vector_service.user_collection(user_id)
+        for document in documents["documents"]:
+            if document.get("indexed"):
+                continue
+            if not await self.vector_service.has_chunks(document["file_path"], collection=collection):
+                if not document.get("extracted_text"):
+                    continue
+                await self.vector_service.store_user_document(user_id, document["file_path"], text_to_pages(document["extracted_text"]))
+            await execution_service.run_io(document_jobs.mark_indexed, user_id, document["file_path"])
+        
+        filenames = {document["file_path"]: document.get("filename") for document in documents["documents"]}
+        results = await self.vector_service.search_user_documents(
+            query, user_id, list(filenames), k=settings.DOCUMENT_CONTEXT_TOP_K
+        )
+        
+        def page_label(result: Dict[str, Any]) -> str:
+            label = f"Page {result['metadata'].get('page', 0) + 1}"
+            if len(filenames) > 1 and filenames.get(result["metadata"].get("source")):
+                label = f"{filenames[result['metadata']['source']]}, {label}"
+            return f"[{label}]\n"
+        
+        packed = await self._prepare_context(query, results, language="", token_budget=settings.DOCUMENT_CONTEXT_TOKEN_BUDGET, label=page_label)
+        return packed["context"] or None
+    
+    async def _generate(self, prompt: str):
+        """Call Gemini through its native async client under the LLM concurrency limit"""
+        return await execution_service.run_llm(lambda: self.model.generate_content_async(prompt))
+    
+    async def _prepare_context(
+        self,
+        query: str,
+        search_results: List[Dict[str, Any]],
+        language: str,
+        token_budget: Optional[int] = None,
+        label=None
+    ) -> Dict[str, Any]:
+        """Pack search results into prompt context within the language's token budget (see ContextBuilder)"""
+        query_embedding = None
+        if any(result.get("embedding") is not None for result in search_results):
+            query_embedding = await self.vector_service.embed_query(query)
+        if token_budget is None:
+            token_budget = self.context_builder.budget_for(language)
+        return self.context_builder.build(search_results, query_embedding, token_budget, label)
     
     def _create_legal_prompt(self, query: str, context: str, language: str, document_context: Optional[str] = None) -> str:
         """Create structured prompt for AI"""
@@ -131,11 +409,11 @@ class AIService:
         document_section = ""
         if document_context:
             document_section = f"""
-            The user is asking a question related to the following document:
+            The user is asking a question related to their documents. The most relevant passages are:
             ---
             {document_context}
             ---
-            Please use this document as primary context for your answer, if relevant.
+            Please use these passages as primary context for your answer, if relevant.
             """
 
         return f"""
@@ -165,17 +443,33 @@ class AIService:
     
     def _parse_ai_response(self, response_text: str, search_results: List[Dict]) -> Dict[str, Any]:
         """Parse and structure AI response"""
-        sources = list(set([result["metadata"].get("source", "Unknown") for result in search_results]))
-        avg_confidence = sum([result["relevance_score"] for result in search_results]) / len(search_results)
-        
         return {
             "response": response_text,
-            "sources": sources,
-            "confidence": avg_confidence,
+            "sources": self._collect_sources(search_results),
+            "confidence": self._average_confidence(search_results),
             "related_sections": self._extract_legal_sections(response_text),
             "formatted_response": response_text  # Assuming the model returns markdown
         }
     
+    def _answer_cache_key(self, query: str, language: str, search_results: List[Dict], document_context: Optional[str]) -> Optional[str]:
+        """Cache key for an answer, or None when caching is disabled"""
+        if self.answer_cache is None:
+            return None
+        # Exact provision hits are keyed on their text too, so re-ingesting a changed Act invalidates the answers
+        chunk_ids = [
+            f"{result.get('id', '')}@{result['content_hash']}" if result.get("content_hash") else result.get("id", "")
+            for result in search_results
+        ]
+        return self.answer_cache.make_key(query, language, chunk_ids, extra=document_context)
+    
+    def _collect_sources(self, search_results: List[Dict]) -> List[str]:
+        return list(set([result["metadata"].get("source", "Unknown") for result in search_results]))
+    
+    def _average_confidence(self, search_results: List[Dict]) -> float:
+        if not search_results:
+            return 0.0
+        return sum([result["relevance_score"] for result in search_results]) / len(search_results)
+    
     def _extract_legal_sections(self, response_text: str) -> List[str]:
         """Extract mentioned legal sections from response"""
         import re
@@ -0,0 +1,395 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.executor import execution_service
+import numpy as np
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: persistent embedding caches are disabled
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_FILES = 16  # cache files in the pool; one per concurrently running process
+KEY_DIGEST_BYTES = 20  # sha1 of the model name and normalised text
+
+def normalize_query(text: str) -> str:
+    """Normalise query text so trivially different phrasings share a cache entry"""
+    text = text.lower().strip()
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip(" ?.!,;:")
+
+class AnswerCache:
+    """Two-tier cache of generated answers.
+
+    The first tier is an in-memory LRU with TTL expiry; the second is a SQLite
+    table that survives restarts. Keys include the IDs of the retrieved chunks,
+    so re-ingesting the corpus naturally stops old answers from being served.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.ANSWER_CACHE_SIZE,
+        ttl_seconds: int = settings.ANSWER_CACHE_TTL_SECONDS,
+        db_path: Optional[str] = settings.ANSWER_CACHE_PATH
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "expired": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answer_cache (key TEXT PRIMARY KEY, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM answer_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self._db.commit()
+        except Exception as e:
+            logger.error(f"Error opening answer cache database, using memory only: {str(e)}")
+            self._db = None
+
+    @staticmethod
+    def make_key(query: str, language: str, chunk_ids: List[str], extra: Optional[str] = None) -> str:
+        """Build a cache key from the normalised query, language and retrieved chunk set"""
+        key_parts = [normalize_query(query), language or "en", ",".join(sorted(chunk_ids))]
+        if extra:
+            key_parts.append(hashlib.sha256(extra.encode("utf-8")).hexdigest())
+        return hashlib.sha256("\x1f".join(key_parts).encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached answer, checking memory first and SQLite second"""
+        value = self._get_from_memory(key)
+        if value is not None:
+            return value
+
+        if self._db is not None:
+            entry = await execution_service.run_io(self._get_from_disk, key)
+            if entry is not None:
+                created_at, value = entry
+                # Keeps the stored age, so promotion does not extend the TTL
+                self._put_in_memory(key, value, created_at=created_at)
+                return dict(value)
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        """Store an answer in both tiers"""
+        self._put_in_memory(key, value)
+        if self._db is not None:
+            await execution_service.run_io(self._put_on_disk, key, value)
+
+    def _get_from_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            created_at, value = entry
+            if time.time() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                self._counters["expired"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._counters["memory_hits"] += 1
+            return dict(value)
+
+    def _put_in_memory(self, key: str, value: Dict[str, Any], created_at: Optional[float] = None):
+        """created_at is given when promoting an entry read from disk"""
+        with self._lock:
+            self._entries[key] = (time.time() if created_at is None else created_at, dict(value))
+            self._entries.move_to_end(key)
+            if created_at is None:
+                self._counters["writes"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _get_from_disk(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT payload, created_at FROM answer_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None:
+                return None
+
+            payload, created_at = row
+            if time.time() - created_at > self.ttl_seconds:
+                with self._db_lock:
+                    self._db.execute("DELETE FROM answer_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                with self._lock:
+                    self._counters["expired"] += 1
+                return None
+
+            with self._lock:
+                self._counters["disk_hits"] += 1
+            return created_at, json.loads(payload)
+
+        except Exception as e:
+            logger.error(f"Error reading answer cache: {str(e)}")
+            return None
+
+    def _put_on_disk(self, key: str, value: Dict[str, Any]):
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answer_cache (key, payload, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), time.time())
+                )
+                self._db.commit()
+        except Exception as e:
+            logger.error(f"Error writing answer cache: {str(e)}")
+
+    def clear(self):
+        """Drop every cached answer from both tiers"""
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM answer_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            counters = dict(self._counters)
+            memory_entries = len(self._entries)
+
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "memory_entries": memory_entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "persistent": self._db is not None,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+def normalize_embedding_text(text: str) -> str:
+    """Collapse whitespace before embedding; case is kept since cased models embed it differently"""
+    return re.sub(r'\s+', ' ', text).strip()
+
+class EmbeddingCache:
+    """Bounded LRU cache of query embeddings.
+
+    Vectors live in one contiguous float32 matrix (one row per slot), with
+    the SHA-1 of each slot's key stored alongside and checked on every read,
+    so a stale or crashed-over index can never hand out another query's
+    vector. When a path is given both are memory-mapped .npy files and the
+    key index (LRU order) is flushed next to them, so a restarted worker
+    starts warm. Each process takes an exclusive lock on its own file from a
+    small pool (path, path.1, path.2, ...); a process that finds every file
+    locked keeps its cache in memory.
+    """
+
+    INDEX_VERSION = 3
+
+    def __init__(self, model_name: str, max_entries: int = settings.EMBEDDING_CACHE_SIZE, path: Optional[str] = settings.EMBEDDING_CACHE_PATH):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.path = path
+        self.dimension: Optional[int] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._key_hashes: Optional[np.ndarray] = None
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._free_slots: List[int] = []
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "mismatches": 0}
+        self._dirty_writes = 0
+        self._lock_file = None
+        if path:
+            self.path = self._claim_file(path)
+        if self.path:
+            self._load()
+
+    def _claim_file(self, path: str) -> Optional[str]:
+        """The first cache file in the pool that no other process holds, locked for this process's lifetime"""
+        if fcntl is None:
+            return None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        root, extension = os.path.splitext(path)
+        for number in range(EMBEDDING_CACHE_FILES):
+            candidate = path if number == 0 else f"{root}.{number}{extension}"
+            lock_file = open(f"{candidate}.lock", "a")
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            self._lock_file = lock_file
+            return candidate
+        logger.info("Every embedding cache file is held by another process, caching in memory only")
+        return None
+
+    @staticmethod
+    def _digest(key: str) -> np.ndarray:
+        # Raw uint8 rows: numpy "S" strings would drop a digest's trailing NUL bytes
+        return np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+
+    def _holds(self, slot: int, key: str) -> bool:
+        return bool(np.array_equal(self._key_hashes[slot], self._digest(key)))
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\x1f{normalize_embedding_text(text)}".encode("utf-8")).hexdigest()
+
+    def _index_path(self) -> str:
+        return f"{self.path}.keys.json"
+
+    def _hashes_path(self) -> str:
+        return f"{self.path}.hashes.npy"
+
+    def _allocate(self, dimension: int):
+        self.dimension = dimension
+        if self.path:
+            self._vectors = np.lib.format.open_memmap(
+                self.path, mode="w+", dtype=np.float32, shape=(self.max_entries, dimension)
+            )
+            self._key_hashes = np.lib.format.open_memmap(
+                self._hashes_path(), mode="w+", dtype=np.uint8, shape=(self.max_entries, KEY_DIGEST_BYTES)
+            )
+        else:
+            self._vectors = np.zeros((self.max_entries, dimension), dtype=np.float32)
+            self._key_hashes = np.zeros((self.max_entries, KEY_DIGEST_BYTES), dtype=np.uint8)
+        self._slots.clear()
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def _load(self):
+        """Map a previously persisted cache, discarding it if the model, size or format changed"""
+        try:
+            if not all(os.path.exists(path) for path in (self.path, self._index_path(), self._hashes_path())):
+                return
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                index = json.load(f)
+
+            vectors = np.load(self.path, mmap_mode="r+")
+            key_hashes = np.load(self._hashes_path(), mmap_mode="r+")
+            if (
+                index.get("version") != self.INDEX_VERSION
+                or index.get("model_name") != self.model_name
+                or vectors.shape[0] != self.max_entries
+                or key_hashes.dtype != np.uint8
+                or key_hashes.shape != (self.max_entries, KEY_DIGEST_BYTES)
+            ):
+                logger.info("Embedding cache on disk was built for a different model, size or format, starting cold")
+                return
+
+            self.dimension = vectors.shape[1]
+            self._vectors = vectors
+            self._key_hashes = key_hashes
+            # Entries whose slot was rewritten after the last index flush are dropped
+            self._slots = OrderedDict(
+                (key, int(slot)) for key, slot in index["slots"]
+                if self._holds(int(slot), key)
+            )
+            used = set(self._slots.values())
+            self._free_slots = [slot for slot in range(self.max_entries - 1, -1, -1) if slot not in used]
+            logger.info(f"Loaded {len(self._slots)} cached query embeddings from {self.path}")
+
+        except Exception as e:
+            logger.error(f"Error loading embedding cache, starting cold: {str(e)}")
+            self._vectors = None
+            self._key_hashes = None
+            self._slots.clear()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Return a copy of the cached embedding for text, if present"""
+        key = self._key(text)
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is not None and not self._holds(slot, key):
+                # The slot no longer holds this key's vector
+                del self._slots[key]
+                self._counters["mismatches"] += 1
+                slot = None
+            if slot is None:
+                self._counters["misses"] += 1
+                return None
+            self._slots.move_to_end(key)
+            self._counters["hits"] += 1
+            return np.array(self._vectors[slot], dtype=np.float32)
+
+    def put(self, text: str, embedding) -> bool:
+        """Store an embedding, evicting the least recently used entry when full.
+
+        Returns True when the key index is due to be flushed; callers on the
+        event loop should then run flush on the I/O pool.
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        key = self._key(text)
+        with self._lock:
+            if self._vectors is None or vector.shape[0] != self.dimension:
+                self._allocate(vector.shape[0])
+
+            slot = self._slots.get(key)
+            if slot is None:
+                if not self._free_slots:
+                    _, slot = self._slots.popitem(last=False)
+                    self._counters["evictions"] += 1
+                else:
+                    slot = self._free_slots.pop()
+            # Clear the key hash first so a crash mid-write cannot pair it with the wrong vector
+            self._key_hashes[slot] = 0
+            self._vectors[slot] = vector
+            self._key_hashes[slot] = self._digest(key)
+            self._slots[key] = slot
+            self._slots.move_to_end(key)
+
+            self._dirty_writes += 1
+            return bool(self.path) and self._dirty_writes >= settings.EMBEDDING_CACHE_FLUSH_EVERY
+
+    def flush(self):
+        """Persist the key index and flush the memory-mapped vectors (blocking; run it on the I/O pool)"""
+        if not self.path or self._vectors is None:
+            return
+        try:
+            with self._lock:
+                index = {"version": self.INDEX_VERSION, "model_name": self.model_name, "slots": list(self._slots.items())}
+                self._vectors.flush()
+                self._key_hashes.flush()
+                self._dirty_writes = 0
+            tmp_path = f"{self._index_path()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self._index_path())
+        except Exception as e:
+            logger.error(f"Error flushing embedding cache: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit-rate counters"""
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._slots)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "dimension": self.dimension,
+            "bytes": int(self._vectors.nbytes) if self._vectors is not None else 0,
+            "persistent": bool(self.path),
+            "path": self.path,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,173 @@
+from typing import Any, Callable, Dict, List, Optional
+from app.config import settings
+import numpy as np
+import re
+
+CHARS_PER_TOKEN = 4  # rough average for English legal text; avoids a count_tokens round trip
+DEVANAGARI_CHARS_PER_TOKEN = 2
+DEVANAGARI_PATTERN = re.compile(r'[ऀ-ॿ]')
+SENTENCE_END_PATTERN = re.compile(r'[.!?।;:](?=\s)|\n')
+MIN_OVERLAP_CHARS = 10  # shorter suffix/prefix matches between adjacent chunks are coincidence
+MIN_TRIMMED_TOKENS = 40  # a passage that would be trimmed below this is left out instead
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; Devanagari packs fewer characters into a token than Latin text"""
+    devanagari = len(DEVANAGARI_PATTERN.findall(text))
+    return (len(text) - devanagari) // CHARS_PER_TOKEN + devanagari // DEVANAGARI_CHARS_PER_TOKEN
+
+def trim_to_sentence(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, ending at the last sentence boundary that fits"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max_tokens * CHARS_PER_TOKEN]
+    while cut and estimate_tokens(cut) > max_tokens:
+        cut = cut[:int(len(cut) * 0.9)]
+    boundaries = [match.end() for match in SENTENCE_END_PATTERN.finditer(cut)]
+    if boundaries and boundaries[-1] >= len(cut) // 2:
+        return cut[:boundaries[-1]].rstrip()
+    # No sentence ends late enough; fall back to the last word boundary
+    return cut.rsplit(None, 1)[0].rstrip() + " …"
+
+def merge_overlapping(first: str, second: str, max_overlap: int) -> str:
+    """Join two consecutive chunks, dropping the text the splitter repeated between them"""
+    for size in range(min(len(first), len(second), max_overlap), MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first}\n{second}"
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class ContextBuilder:
+    """Assembles retrieved chunks into prompt context under a token budget.
+
+    Exact provision hits come first. The remaining chunks are ordered by
+    maximal marginal relevance over their embeddings, so near-duplicates
+    (chunk overlap, the same clause in two acts) give way to chunks that add
+    something new. Consecutive chunks of the same source and page are merged
+    back into one passage without the overlap, and the last passage that does
+    not fit is trimmed at a sentence boundary.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = settings.CONTEXT_TOKEN_BUDGET,
+        token_budgets: Optional[Dict[str, int]] = None,
+        mmr_lambda: float = settings.CONTEXT_MMR_LAMBDA,
+        duplicate_similarity: float = settings.CONTEXT_DUPLICATE_SIMILARITY,
+        chunk_overlap: int = settings.CHUNK_OVERLAP
+    ):
+        self.token_budget = token_budget
+        self.token_budgets = settings.CONTEXT_TOKEN_BUDGETS if token_budgets is None else token_budgets
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_similarity = duplicate_similarity
+        # The splitter aligns overlaps on separators, so allow some slack
+        self.max_overlap = chunk_overlap * 2
+
+    def budget_for(self, language: str) -> int:
+        return self.token_budgets.get(language, self.token_budget)
+
+    def build(
+        self,
+        search_results: List[Dict[str, Any]],
+        query_embedding: Optional[List[float]] = None,
+        token_budget: Optional[int] = None,
+        label: Optional[Callable[[Dict[str, Any]], str]] = None
+    ) -> Dict[str, Any]:
+        """Select and pack search results.
+
+        Returns {"context": str, "results": the results used, "tokens": estimated tokens}.
+        label renders a passage header from the first result in it; the default
+        is "Source: <source>\\nContent: ".
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        label = label or (lambda result: f"Source: {result['metadata'].get('source', 'Unknown')}\nContent: ")
+
+        passages: List[Dict[str, Any]] = []
+        used: List[Dict[str, Any]] = []
+        remaining = budget
+        for result in self.order(search_results, query_embedding):
+            metadata = result["metadata"]
+            neighbour = self._adjacent_passage(passages, metadata)
+            if neighbour is not None:
+                first_index, last_index = neighbour["first_index"], neighbour["last_index"]
+                if metadata["chunk_index"] > last_index:
+                    merged = merge_overlapping(neighbour["content"], result["content"], self.max_overlap)
+                    last_index = metadata["chunk_index"]
+                else:
+                    merged = merge_overlapping(result["content"], neighbour["content"], self.max_overlap)
+                    first_index = metadata["chunk_index"]
+                cost = estimate_tokens(merged) - estimate_tokens(neighbour["content"])
+                if cost > remaining:
+                    # The passage keeps its bounds, so chunks beyond the skipped one are not treated as adjacent
+                    continue
+                neighbour.update(content=merged, first_index=first_index, last_index=last_index)
+                remaining -= cost
+                used.append(result)
+                continue
+
+            header = label(result)
+            cost = estimate_tokens(header) + estimate_tokens(result["content"])
+            content = result["content"]
+            if cost > remaining:
+                available = remaining - estimate_tokens(header)
+                if available < MIN_TRIMMED_TOKENS:
+                    continue
+                content = trim_to_sentence(content, available)
+                cost = estimate_tokens(header) + estimate_tokens(content)
+            passages.append({
+                "header": header,
+                "content": content,
+                "source": metadata.get("source"),
+                "page": metadata.get("page"),
+                "first_index": metadata.get("chunk_index"),
+                "last_index": metadata.get("chunk_index"),
+            })
+            remaining -= cost
+            used.append(result)
+
+        context = "\n\n".join(passage["header"] + passage["content"] for passage in passages)
+        return {"context": context, "results": used, "tokens": budget - remaining}
+
+    def order(self, search_results: List[Dict[str, Any]], query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Exact hits first, then maximal-marginal-relevance order; results without embeddings keep their rank at the end"""
+        exact = [result for result in search_results if result.get("exact_match")]
+        candidates = [result for result in search_results if not result.get("exact_match") and result.get("embedding") is not None]
+        others = [result for result in search_results if not result.get("exact_match") and result.get("embedding") is None]
+        if query_embedding is None or not candidates:
+            return exact + candidates + others
+
+        vectors = _normalize(np.asarray([result["embedding"] for result in candidates], dtype=np.float32))
+        relevance = vectors @ _normalize(np.asarray(query_embedding, dtype=np.float32))
+        pairwise = vectors @ vectors.T
+
+        selected: List[int] = []
+        remaining = list(range(len(candidates)))
+        while remaining:
+            if selected:
+                redundancy = pairwise[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining), dtype=np.float32)
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            best = int(np.argmax(scores))
+            index = remaining.pop(best)
+            if redundancy[best] >= self.duplicate_similarity:
+                continue
+            selected.append(index)
+        return exact + [candidates[index] for index in selected] + others
+
+    @staticmethod
+    def _adjacent_passage(passages: List[Dict[str, Any]], metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        chunk_index = metadata.get("chunk_index")
+        if chunk_index is None:
+            return None
+        for passage in passages:
+            if (
+                passage["first_index"] is not None
+                and passage["source"] == metadata.get("source")
+                and passage["page"] == metadata.get("page")
+                and chunk_index in (passage["first_index"] - 1, passage["last_index"] + 1)
+            ):
+                return passage
+        return None
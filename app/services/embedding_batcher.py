@@ -0,0 +1,119 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.executor import execution_service
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+class EmbeddingBatcher:
+    """Coalesces concurrent single-text embedding requests into batched forward passes.
+
+    Requests are collected until either max_batch_size texts are waiting or
+    max_wait_ms has passed since the first one arrived, then encoded with one
+    embed_documents call on the CPU lane. Each caller awaits its own future.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        max_batch_size: int = settings.EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms: float = settings.EMBEDDING_BATCH_MAX_WAIT_MS
+    ):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending_batches: set = set()
+        self._batches = 0
+        self._items = 0
+        self._histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self._histogram_overflow = 0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._collect_batches())
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed one text as part of the next batch"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _collect_batches(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait_ms / 1000
+
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Encode in the background so the next batch can start collecting immediately
+            task = self._loop.create_task(self._encode_batch(batch))
+            self._pending_batches.add(task)
+            task.add_done_callback(self._pending_batches.discard)
+
+    async def _encode_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        # Identical texts arriving together are encoded once
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        self._record(len(unique_texts))
+
+        try:
+            vectors = await execution_service.run_cpu(self.embed_fn, unique_texts)
+        except Exception as e:
+            logger.error(f"Error encoding embedding batch of {len(unique_texts)}: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        vectors_by_text = dict(zip(unique_texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(list(vectors_by_text[text]))
+
+    def _record(self, batch_size: int):
+        self._batches += 1
+        self._items += batch_size
+        for bucket in BATCH_SIZE_BUCKETS:
+            if batch_size <= bucket:
+                self._histogram[bucket] += 1
+                return
+        self._histogram_overflow += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch counts and the batch-size histogram"""
+        histogram = {f"le_{bucket}": count for bucket, count in self._histogram.items()}
+        histogram[f"gt_{BATCH_SIZE_BUCKETS[-1]}"] = self._histogram_overflow
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batches": self._batches,
+            "items": self._items,
+            "mean_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batch_size_histogram": histogram,
+        }
+
+    def close(self):
+        """Stop the collector task"""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
@@ -0,0 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Executor
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict
+from app.config import settings
+import asyncio
+import functools
+import multiprocessing
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ExecutionService:
+    """Runs blocking work off the event loop.
+
+    Work is split into separately sized lanes so a slow call in one lane cannot
+    starve the others:
+      - "cpu":     thread pool for embeddings, bcrypt and PDF parsing (these release the GIL)
+      - "process": process pool for Tesseract OCR and other pure-Python CPU work
+      - "io":      thread pool for blocking I/O such as Chroma and file access
+      - "llm":     concurrency limit only, for native async Gemini calls
+    Each lane has an admission semaphore; requests waiting on it are reported as queue depth.
+    """
+
+    def __init__(self):
+        self._limits = {
+            "cpu": settings.CPU_POOL_WORKERS,
+            "process": settings.PROCESS_POOL_WORKERS,
+            "io": settings.IO_POOL_WORKERS,
+            "llm": settings.LLM_MAX_CONCURRENCY,
+        }
+        self._pools: Dict[str, Executor] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._pool_lock = threading.Lock()
+        self._stats = {
+            lane: {"in_flight": 0, "queued": 0, "max_queued": 0, "completed": 0, "failed": 0, "total_wait_s": 0.0, "total_run_s": 0.0}
+            for lane in self._limits
+        }
+
+    def _get_pool(self, lane: str) -> Executor:
+        if lane not in self._pools:
+            with self._pool_lock:
+                if lane not in self._pools:
+                    if lane == "process":
+                        # spawn avoids forking a parent that already holds model threads
+                        self._pools[lane] = ProcessPoolExecutor(
+                            max_workers=self._limits[lane],
+                            mp_context=multiprocessing.get_context("spawn")
+                        )
+                    else:
+                        self._pools[lane] = ThreadPoolExecutor(
+                            max_workers=self._limits[lane],
+                            thread_name_prefix=f"nyayease-{lane}"
+                        )
+        return self._pools[lane]
+
+    def _get_semaphore(self, lane: str) -> asyncio.Semaphore:
+        if lane not in self._semaphores:
+            self._semaphores[lane] = asyncio.Semaphore(self._limits[lane])
+        return self._semaphores[lane]
+
+    @asynccontextmanager
+    async def limit(self, lane: str):
+        """Hold one concurrency slot of a lane, recording queue depth and timings"""
+        stats = self._stats[lane]
+        semaphore = self._get_semaphore(lane)
+
+        queued_at = time.perf_counter()
+        stats["queued"] += 1
+        stats["max_queued"] = max(stats["max_queued"], stats["queued"])
+        try:
+            await semaphore.acquire()
+        finally:
+            stats["queued"] -= 1
+
+        started_at = time.perf_counter()
+        stats["total_wait_s"] += started_at - queued_at
+        stats["in_flight"] += 1
+        try:
+            yield
+            stats["completed"] += 1
+        except BaseException:
+            stats["failed"] += 1
+            raise
+        finally:
+            stats["in_flight"] -= 1
+            stats["total_run_s"] += time.perf_counter() - started_at
+            semaphore.release()
+
+    async def _run_in_pool(self, lane: str, func: Callable, *args, **kwargs) -> Any:
+        async with self.limit(lane):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(lane), functools.partial(func, *args, **kwargs))
+
+    async def run_cpu(self, func: Callable, *args, **kwargs) -> Any:
+        """Run CPU-heavy work that releases the GIL (embeddings, bcrypt, PDF parsing)"""
+        return await self._run_in_pool("cpu", func, *args, **kwargs)
+
+    async def run_process(self, func: Callable, *args, **kwargs) -> Any:
+        """Run picklable CPU-bound work in the process pool (OCR)"""
+        return await self._run_in_pool("process", func, *args, **kwargs)
+
+    async def run_io(self, func: Callable, *args, **kwargs) -> Any:
+        """Run blocking I/O in the I/O thread pool"""
+        return await self._run_in_pool("io", func, *args, **kwargs)
+
+    async def run_llm(self, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Await a native async LLM call under the LLM concurrency limit"""
+        async with self.limit("llm"):
+            return await coro_factory()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-lane limits, queue depth and timing counters"""
+        snapshot = {}
+        for lane, stats in self._stats.items():
+            finished = stats["completed"] + stats["failed"]
+            snapshot[lane] = {
+                "limit": self._limits[lane],
+                "in_flight": stats["in_flight"],
+                "queue_depth": stats["queued"],
+                "max_queue_depth": stats["max_queued"],
+                "completed": stats["completed"],
+                "failed": stats["failed"],
+                "avg_wait_ms": round(1000 * stats["total_wait_s"] / finished, 2) if finished else 0.0,
+                "avg_run_ms": round(1000 * stats["total_run_s"] / finished, 2) if finished else 0.0,
+            }
+        return snapshot
+
+    def shutdown(self, wait: bool = True):
+        """Shut down all worker pools"""
+        with self._pool_lock:
+            for lane, pool in self._pools.items():
+                logger.info(f"Shutting down '{lane}' pool")
+                pool.shutdown(wait=wait, cancel_futures=True)
+            self._pools.clear()
+
+execution_service = ExecutionService()
@@ -0,0 +1,77 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.config import settings
+import hashlib
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    """Hash a file's contents without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class IngestionManifest:
+    """Per-file record of what has been ingested into the vector store.
+
+    Each entry stores the file's content hash, the embedding model and chunking
+    parameters it was processed with, and the IDs of its chunks, so unchanged
+    files can be skipped and the chunks of changed or removed files deleted.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(settings.CHROMA_PERSIST_DIRECTORY, "ingestion_manifest.json")
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+        except Exception as e:
+            logger.error(f"Error reading ingestion manifest, treating every file as new: {str(e)}")
+            self.files = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": self.files}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def ingestion_settings(self) -> Dict[str, Any]:
+        """Settings that change the stored chunks; a change forces re-ingestion"""
+        return {
+            "model_name": settings.EMBEDDING_MODEL,
+            "chunk_size": settings.CHUNK_SIZE,
+            "chunk_overlap": settings.CHUNK_OVERLAP,
+        }
+
+    def is_current(self, name: str, content_hash: str) -> bool:
+        """True when the file was already ingested with this content and these settings"""
+        entry = self.files.get(name)
+        if not entry or entry.get("sha256") != content_hash:
+            return False
+        return all(entry.get(key) == value for key, value in self.ingestion_settings().items())
+
+    def chunk_ids(self, name: str) -> List[str]:
+        return list(self.files.get(name, {}).get("chunk_ids", []))
+
+    def record(self, name: str, content_hash: str, chunk_ids: List[str]):
+        self.files[name] = {
+            "sha256": content_hash,
+            "chunk_count": len(chunk_ids),
+            "chunk_ids": chunk_ids,
+            **self.ingestion_settings(),
+            "ingested_at": datetime.utcnow().isoformat(),
+        }
+
+    def forget(self, name: str):
+        self.files.pop(name, None)
@@ -0,0 +1,270 @@
+from typing import Any, Callable, Dict, List, Optional
+from app.config import settings
+from app.services.executor import execution_service
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_END_OF_STREAM = None
+
+def chunk_pages(pages: List[Dict[str, Any]], chunk_size: int, chunk_overlap: int) -> List[Dict[str, Any]]:
+    """Split page-tagged text into chunks that remember the page they came from"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+
+    chunks = []
+    for page in pages:
+        for text in text_splitter.split_text(page["text"]):
+            chunks.append({"text": text, "page": page["page"]})
+    return chunks
+
+def parse_and_chunk(doc_path: str, chunk_size: int, chunk_overlap: int) -> Dict[str, Any]:
+    """Extract page text and split it into chunks (runs inside the process pool)"""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open(doc_path)
+    try:
+        pages = [{"page": page_num, "text": doc[page_num].get_text()} for page_num in range(doc.page_count)]
+    finally:
+        doc.close()
+
+    return {"page_count": len(pages), "chunks": chunk_pages(pages, chunk_size, chunk_overlap)}
+
+class IngestionStats:
+    """Throughput counters for one pipeline run"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.files = 0
+        self.pages = 0
+        self.chunks = 0
+        self.embedded_chunks = 0
+        self.resumed_chunks = 0
+        self.deleted_chunks = 0
+        self.failed_files: List[str] = []
+        self.error: Optional[str] = None
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+        return {
+            "files": self.files,
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "embedded_chunks": self.embedded_chunks,
+            "resumed_chunks": self.resumed_chunks,
+            "deleted_chunks": self.deleted_chunks,
+            "elapsed_s": round(elapsed, 2),
+            "pages_per_s": round(self.pages / elapsed, 2),
+            "chunks_per_s": round(self.chunks / elapsed, 2),
+            "failed_files": list(self.failed_files),
+            "error": self.error,
+        }
+
+class IngestionPipeline:
+    """Streaming bulk ingestion: parse/chunk -> embed -> write.
+
+    Files are parsed and chunked in the process pool, a bounded number at a
+    time. Chunks flow through bounded queues to a single embedding stage
+    (batches of embed_batch_size) and a writer that upserts batches of
+    write_batch_size into Chroma, so memory stays flat however large the
+    library is.
+
+    Chunk IDs are deterministic, so a run that crashed part-way can simply be
+    repeated. Chunks already in the collection are not embedded again, and
+    a file is reported done only after all of its chunks are written. If the
+    embed or write stage fails, the other stages are cancelled and every file
+    not done yet is listed in the stats' failed_files.
+    """
+
+    def __init__(
+        self,
+        vector_service,
+        embed_batch_size: int = settings.INGEST_EMBED_BATCH_SIZE,
+        write_batch_size: int = settings.INGEST_WRITE_BATCH_SIZE,
+        queue_size: int = settings.INGEST_QUEUE_SIZE,
+        parse_ahead: int = settings.PROCESS_POOL_WORKERS,
+        progress: Optional[Callable[[str], None]] = None
+    ):
+        self.vector_service = vector_service
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.queue_size = queue_size
+        self.parse_ahead = parse_ahead
+        self.progress = progress or logger.info
+        self.stats = IngestionStats()
+        self._files: Dict[str, Dict[str, Any]] = {}
+
+    async def run(
+        self,
+        files: List[Dict[str, str]],
+        force: bool = False,
+        on_file_done: Optional[Callable[[Dict[str, str], List[str]], None]] = None
+    ) -> Dict[str, Any]:
+        """Ingest files and return throughput stats.
+
+        Each file is a dict with "name", "path" and "sha256", plus optionally
+        "previous_chunk_ids" from the manifest so stale chunks can be deleted.
+        """
+        self.stats = IngestionStats()
+        self._files = {}
+        self._completed = set()
+        self._on_file_done = on_file_done
+        embed_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        parse_slots = asyncio.Semaphore(max(1, self.parse_ahead))
+
+        async def produce_one(file: Dict[str, str]):
+            try:
+                await self._produce(file, force, embed_queue, parse_slots)
+            except Exception as e:
+                # The file is not recorded as done, so the next run retries it
+                logger.error(f"Error ingesting {file['name']}: {str(e)}")
+                self.progress(f"[{file['name']}] failed: {str(e)}")
+
+        async def produce_all():
+            await asyncio.gather(*[produce_one(file) for file in files])
+            await embed_queue.put(_END_OF_STREAM)
+
+        stages = [
+            asyncio.create_task(produce_all()),
+            asyncio.create_task(self._embed_stage(embed_queue, write_queue)),
+            asyncio.create_task(self._write_stage(write_queue)),
+        ]
+        try:
+            await asyncio.gather(*stages)
+        except Exception as e:
+            # The surviving stages would wait forever on queues nobody serves any more
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            logger.error(f"Ingestion stopped: {str(e)}")
+            self.progress(f"Ingestion stopped: {str(e)}")
+            self.stats.error = str(e)
+        self.stats.failed_files = [file["name"] for file in files if file["name"] not in self._completed]
+        await execution_service.run_io(self.vector_service.lexical_index.save)
+        return self.stats.summary()
+
+    async def _produce(self, file: Dict[str, str], force: bool, embed_queue: asyncio.Queue, parse_slots: asyncio.Semaphore):
+        """Stage 1: parse and chunk one file, drop stale chunks and queue the rest for embedding"""
+        async with parse_slots:
+            parsed = await execution_service.run_process(
+                parse_and_chunk, file["path"], settings.CHUNK_SIZE, settings.CHUNK_OVERLAP
+            )
+            document_type = self.vector_service._get_document_type(file["path"])
+
+            items = []
+            for index, chunk in enumerate(parsed["chunks"]):
+                items.append({
+                    "id": self.vector_service._chunk_id(file["path"], index, chunk["text"]),
+                    "text": chunk["text"],
+                    "metadata": {
+                        "source": file["path"],
+                        "chunk_index": index,
+                        "document_type": document_type,
+                        "page": chunk["page"],
+                    },
+                    "file": file["name"],
+                })
+            new_ids = {item["id"] for item in items}
+
+            # Anything stored under this source that is not part of the new version is stale
+            existing = await execution_service.run_io(
+                self.vector_service.collection.get, where={"source": file["path"]}, include=[]
+            )
+            stored_ids = set(existing["ids"])
+            stale_ids = list((stored_ids | set(file.get("previous_chunk_ids", []))) - new_ids)
+            if stale_ids:
+                self.stats.deleted_chunks += await self.vector_service.delete_chunks(ids=stale_ids)
+
+            # Chunks written by an earlier, interrupted run are kept as they are
+            resumed = [] if force else [item for item in items if item["id"] in stored_ids]
+            if resumed:
+                self.vector_service.lexical_index.add([item["id"] for item in resumed], [item["text"] for item in resumed])
+            pending = [item for item in items if force or item["id"] not in stored_ids]
+
+            self._files[file["name"]] = {
+                "file": file,
+                "chunk_ids": [item["id"] for item in items],
+                "remaining": len(pending),
+                "total": len(items),
+            }
+            self.stats.files += 1
+            self.stats.pages += parsed["page_count"]
+            self.stats.chunks += len(items)
+            self.stats.resumed_chunks += len(resumed)
+            self.progress(
+                f"[{file['name']}] parsed {parsed['page_count']} pages into {len(items)} chunks"
+                + (f" ({len(resumed)} already stored)" if resumed else "")
+            )
+
+            if not pending:
+                await self._complete_file(file["name"])
+                return
+
+            for start in range(0, len(pending), self.embed_batch_size):
+                await embed_queue.put(pending[start:start + self.embed_batch_size])
+
+    async def _embed_stage(self, embed_queue: asyncio.Queue, write_queue: asyncio.Queue):
+        """Stage 2: embed chunk batches"""
+        while True:
+            batch = await embed_queue.get()
+            if batch is _END_OF_STREAM:
+                break
+            embeddings = await execution_service.run_cpu(
+                self.vector_service.embeddings.embed_documents, [item["text"] for item in batch]
+            )
+            for item, embedding in zip(batch, embeddings):
+                item["embedding"] = embedding
+            self.stats.embedded_chunks += len(batch)
+            await write_queue.put(batch)
+        await write_queue.put(_END_OF_STREAM)
+
+    async def _write_stage(self, write_queue: asyncio.Queue):
+        """Stage 3: upsert embedded chunks into Chroma in batches"""
+        buffer: List[Dict[str, Any]] = []
+        while True:
+            batch = await write_queue.get()
+            if batch is not _END_OF_STREAM:
+                buffer.extend(batch)
+            if buffer and (batch is _END_OF_STREAM or len(buffer) >= self.write_batch_size):
+                await self._write(buffer)
+                buffer = []
+            if batch is _END_OF_STREAM:
+                break
+
+    async def _write(self, items: List[Dict[str, Any]]):
+        await execution_service.run_io(
+            self.vector_service.collection.upsert,
+            ids=[item["id"] for item in items],
+            embeddings=[item["embedding"] for item in items],
+            documents=[item["text"] for item in items],
+            metadatas=[item["metadata"] for item in items],
+        )
+        self.vector_service.lexical_index.add([item["id"] for item in items], [item["text"] for item in items])
+
+        written_per_file: Dict[str, int] = {}
+        for item in items:
+            written_per_file[item["file"]] = written_per_file.get(item["file"], 0) + 1
+
+        for name, written in written_per_file.items():
+            state = self._files[name]
+            state["remaining"] -= written
+            done = state["total"] - state["remaining"]
+            self.progress(f"[{name}] {done}/{state['total']} chunks stored ({self.stats.summary()['chunks_per_s']} chunks/s overall)")
+            if state["remaining"] == 0:
+                await self._complete_file(name)
+
+    async def _complete_file(self, name: str):
+        state = self._files[name]
+        self._completed.add(name)
+        # Persist the lexical index before the file is recorded as done
+        await execution_service.run_io(self.vector_service.lexical_index.save)
+        if self._on_file_done:
+            self._on_file_done(state["file"], state["chunk_ids"])
@@ -0,0 +1,465 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func, or_
+from app.config import settings
+from app.database.connection import SessionLocal, create_tables
+from app.database.models import Document, DocumentJob
+from app.services.executor import execution_service
+from app.services.ocr_service import pages_to_text, text_to_pages
+import asyncio
+import os
+import socket
+import threading
+import uuid
+import weakref
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: stored files are then only coordinated within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+class DocumentJobError(Exception):
+    """A job failure whose message is safe to show to the user"""
+
+class DocumentJobQueue:
+    """Background processing of uploaded documents.
+
+    Uploads only persist the file and create a row in the document_jobs table;
+    a small pool of asyncio worker tasks then runs extraction, indexing and
+    analysis (the blocking parts already run in the execution pools). Job state
+    lives in SQLite. Every job records the process that owns it, and each
+    process touches its own unfinished jobs periodically; jobs whose owner has
+    stopped doing so for DOCUMENT_JOB_STALE_SECONDS (a crash or restart) are
+    taken over by any live process, while other workers' jobs are left alone.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.DOCUMENT_JOB_WORKERS,
+        max_attempts: int = settings.DOCUMENT_JOB_MAX_ATTEMPTS,
+        stale_seconds: int = settings.DOCUMENT_JOB_STALE_SECONDS,
+        session_factory=SessionLocal
+    ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.stale_seconds = stale_seconds
+        self.session_factory = session_factory
+        self.worker_id: Optional[str] = None
+        self._files_lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Jobs for identical content run one at a time so the second can reuse the first's results
+        self._content_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    async def start(self):
+        """Recover unfinished jobs and start the workers"""
+        if self._tasks:
+            return
+        # Set here rather than at import so every server process gets its own
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue = asyncio.Queue()
+        await execution_service.run_io(create_tables)
+        await self._requeue_stale_jobs()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(max(1, self.workers))]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        """Stop the workers; interrupted jobs stay "running" and are retried once they go stale"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(
+        self,
+        user_id: int,
+        filename: str,
+        file_path: str,
+        language: str = "en",
+        content_hash: Optional[str] = None,
+        upload_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Create a job for an uploaded file and queue it.
+
+        upload_path is the freshly written upload; it is moved to file_path
+        (or dropped, when an identical file is already stored) together with
+        creating the job, so a concurrent delete cannot remove the stored file
+        in between.
+        """
+        if not self._tasks:
+            await self.start()
+        job = await execution_service.run_io(self._create_job, user_id, filename, file_path, language, content_hash, upload_path)
+        self._queue.put_nowait(job["id"])
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers if self._tasks else 0, "queued": self._queue.qsize() if self._queue else 0}
+
+    async def _heartbeat(self):
+        """Keep this process's jobs fresh and take over jobs whose owner has gone away"""
+        while True:
+            await asyncio.sleep(max(1, self.stale_seconds // 4))
+            try:
+                await execution_service.run_io(self._touch_jobs)
+                await self._requeue_stale_jobs()
+            except Exception as e:
+                logger.error(f"Document job heartbeat failed: {str(e)}")
+
+    async def _requeue_stale_jobs(self):
+        recovered = await execution_service.run_io(self._recover_jobs)
+        for job_id in recovered:
+            self._queue.put_nowait(job_id)
+        if recovered:
+            logger.info(f"Re-queued {len(recovered)} unfinished document jobs")
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                logger.error(f"Document job {job_id} crashed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        job = await execution_service.run_io(self._claim_job, job_id)
+        if job is None:
+            return
+
+        try:
+            ai_service, ocr_service, vector_service = await execution_service.run_io(self._load_services)
+
+            lock = self._content_lock(job["content_hash"])
+            async with lock:
+                # Identical content uploaded before: reuse its text, chunks and analysis
+                previous = None
+                if job["content_hash"]:
+                    previous = await execution_service.run_io(self._find_previous, job["content_hash"], job["language"])
+
+                if previous:
+                    extracted_text = previous["extracted_text"]
+                    await self._update_job(job_id, stage="indexing", progress=0.4)
+                    user_collection = await vector_service.user_collection(job["user_id"])
+                    indexed = await vector_service.has_chunks(job["file_path"], collection=user_collection)
+                    if not indexed:
+                        # Another user's copy already has embeddings; only embed again if there are none
+                        copied = 0
+                        if previous["user_id"] != job["user_id"]:
+                            copied = await vector_service.copy_user_document(previous["user_id"], job["user_id"], job["file_path"])
+                        indexed = bool(copied) or await self._store_chunks(vector_service, job, text_to_pages(extracted_text))
+                else:
+                    # Extract page-tagged text once; it feeds both the vector store and extracted_text
+                    await self._update_job(job_id, stage="extracting", progress=0.05)
+
+                    async def on_ocr_progress(done: int, total: int):
+                        await self._update_job(job_id, progress=0.05 + 0.35 * done / total)
+
+                    try:
+                        pages = await ocr_service.extract_document(job["file_path"], on_progress=on_ocr_progress)
+                    except ValueError as e:
+                        raise DocumentJobError(str(e))
+                    extracted_text = pages_to_text(pages)
+                    if not extracted_text.strip():
+                        raise DocumentJobError("Could not extract text from document")
+
+                    # Store the document in the vector database
+                    await self._update_job(job_id, stage="indexing", progress=0.4)
+                    indexed = await self._store_chunks(vector_service, job, pages)
+
+                if previous and previous["analysis_result"]:
+                    analysis_result = previous["analysis_result"]
+                    analysis_status = "completed"
+                else:
+                    # Analyze document using AI
+                    await self._update_job(job_id, stage="analyzing", progress=0.6)
+                    analysis = await ai_service.analyze_legal_document(
+                        document_text=extracted_text,
+                        language=job["language"]
+                    )
+                    analysis_result = analysis["analysis"]
+                    analysis_status = analysis["analysis_status"]
+
+                await execution_service.run_io(self._complete_job, job, extracted_text, analysis_result, analysis_status, indexed)
+            logger.info(f"Document job {job_id} completed" + (" (reused an identical upload)" if previous else ""))
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, DocumentJobError):
+                message = str(e)
+            else:
+                logger.error(f"Error processing document job {job_id}: {str(e)}")
+                message = "Error processing document."
+            await execution_service.run_io(self._fail_job, job_id, message)
+            # The stored file may be shared with other uploads of the same content
+            await execution_service.run_io(self.remove_unused_file, job["file_path"])
+
+    def _content_lock(self, content_hash: Optional[str]) -> asyncio.Lock:
+        if not content_hash:
+            return asyncio.Lock()
+        lock = self._content_locks.get(content_hash)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._content_locks[content_hash] = lock
+        return lock
+
+    async def _store_chunks(self, vector_service, job: Dict[str, Any], pages: List[Dict[str, Any]]) -> bool:
+        """False when storing failed; the document is then indexed on its first question"""
+        try:
+            await vector_service.store_user_document(job["user_id"], job["file_path"], pages)
+            return True
+        except Exception as e:
+            logger.error(f"Error storing document chunks: {str(e)}")
+            return False
+
+    def _load_services(self):
+        # Imported here: the registry builds the models on first use
+        from app.services.registry import services
+        return services.ai_service, services.ocr_service, services.vector_service
+
+    @contextmanager
+    def _stored_files_lock(self):
+        """Exclusive across threads and processes while a stored file is placed or removed"""
+        with self._files_lock:
+            os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+            with open(os.path.join(settings.UPLOAD_DIR, ".files.lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _create_job(
+        self,
+        user_id: int,
+        filename: str,
+        file_path: str,
+        language: str,
+        content_hash: Optional[str],
+        upload_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        with self._stored_files_lock():
+            if upload_path:
+                if os.path.exists(file_path):
+                    os.remove(upload_path)
+                else:
+                    os.replace(upload_path, file_path)
+            return self._insert_job(user_id, filename, file_path, language, content_hash)
+
+    def _insert_job(self, user_id: int, filename: str, file_path: str, language: str, content_hash: Optional[str]) -> Dict[str, Any]:
+        db = self.session_factory()
+        try:
+            job = DocumentJob(
+                id=uuid.uuid4().hex,
+                user_id=user_id,
+                filename=filename,
+                file_path=file_path,
+                content_hash=content_hash,
+                language=language,
+                worker_id=self.worker_id,
+                status="queued",
+                stage="queued",
+                progress=0.0,
+            )
+            db.add(job)
+            db.commit()
+            return self._to_dict(job)
+        finally:
+            db.close()
+
+    def _claim_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Mark a queued job as running; None if it is gone or already taken"""
+        db = self.session_factory()
+        try:
+            # A conditional update, so only one process can claim a job that several have queued
+            claimed = db.query(DocumentJob).filter(DocumentJob.id == job_id, DocumentJob.status == "queued").update({
+                "status": "running",
+                "worker_id": self.worker_id,
+                "attempts": func.coalesce(DocumentJob.attempts, 0) + 1,
+                "updated_at": datetime.utcnow(),
+            }, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                return None
+            return self._to_dict(db.query(DocumentJob).filter(DocumentJob.id == job_id).first())
+        finally:
+            db.close()
+
+    async def _update_job(self, job_id: str, **fields):
+        await execution_service.run_io(self._write_job, job_id, fields)
+
+    def _write_job(self, job_id: str, fields: Dict[str, Any]):
+        db = self.session_factory()
+        try:
+            db.query(DocumentJob).filter(DocumentJob.id == job_id).update({**fields, "updated_at": datetime.utcnow()})
+            db.commit()
+        finally:
+            db.close()
+
+    def _find_previous(self, content_hash: str, language: str) -> Optional[Dict[str, Any]]:
+        """Extracted text of an earlier upload with this content, plus its analysis in this language if any"""
+        db = self.session_factory()
+        try:
+            previous = db.query(Document).filter(
+                Document.content_hash == content_hash,
+                Document.extracted_text.isnot(None)
+            ).order_by(Document.upload_date.desc()).first()
+            if previous is None:
+                return None
+
+            analysed = db.query(Document).filter(
+                Document.content_hash == content_hash,
+                Document.language == language,
+                Document.analysis_status == "completed"
+            ).order_by(Document.upload_date.desc()).first()
+            return {
+                "extracted_text": previous.extracted_text,
+                "user_id": previous.user_id,
+                "analysis_result": analysed.analysis_result if analysed else None,
+            }
+        finally:
+            db.close()
+
+    def file_in_use(self, file_path: str, user_id: Optional[int] = None) -> bool:
+        """True while any document or unfinished job (of user_id, if given) still refers to this stored file"""
+        db = self.session_factory()
+        try:
+            documents = db.query(Document.id).filter(Document.file_path == file_path)
+            jobs = db.query(DocumentJob.id).filter(
+                DocumentJob.file_path == file_path,
+                DocumentJob.status.in_(ACTIVE_STATUSES)
+            )
+            if user_id is not None:
+                documents = documents.filter(Document.user_id == user_id)
+                jobs = jobs.filter(DocumentJob.user_id == user_id)
+            return documents.first() is not None or jobs.first() is not None
+        finally:
+            db.close()
+
+    def mark_indexed(self, user_id: int, file_path: str):
+        """Record that a stored file's chunks are in its owner's collection (for every copy they uploaded)"""
+        db = self.session_factory()
+        try:
+            db.query(Document).filter(
+                Document.user_id == user_id,
+                Document.file_path == file_path
+            ).update({"indexed": True}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def remove_unused_file(self, file_path: str) -> bool:
+        """Delete a stored file unless a document or unfinished job still refers to it"""
+        with self._stored_files_lock():
+            if self.file_in_use(file_path) or not os.path.exists(file_path):
+                return False
+            os.remove(file_path)
+            return True
+
+    def _complete_job(self, job: Dict[str, Any], extracted_text: str, analysis_result: str, analysis_status: str, indexed: bool):
+        """Save the document and finish the job in one transaction"""
+        db = self.session_factory()
+        try:
+            db_document = Document(
+                user_id=job["user_id"],
+                filename=job["filename"],
+                file_path=job["file_path"],
+                content_hash=job["content_hash"],
+                language=job["language"],
+                extracted_text=extracted_text,
+                analysis_result=analysis_result,
+                analysis_status=analysis_status,
+                indexed=indexed
+            )
+            db.add(db_document)
+            db.flush()
+            now = datetime.utcnow()
+            db.query(DocumentJob).filter(DocumentJob.id == job["id"]).update({
+                "document_id": db_document.id,
+                "status": "completed",
+                "stage": "done",
+                "progress": 1.0,
+                "updated_at": now,
+                "finished_at": now,
+            })
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _fail_job(self, job_id: str, message: str):
+        now = datetime.utcnow()
+        self._write_job(job_id, {"status": "failed", "error": message, "finished_at": now})
+
+    def _touch_jobs(self):
+        """Show the other processes that this one is still working on its jobs"""
+        db = self.session_factory()
+        try:
+            db.query(DocumentJob).filter(
+                DocumentJob.worker_id == self.worker_id,
+                DocumentJob.status.in_(ACTIVE_STATUSES)
+            ).update({"updated_at": datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _recover_jobs(self) -> List[str]:
+        """Take over unfinished jobs whose owner stopped updating them and return the IDs to re-queue,
+        failing those retried too often"""
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            jobs = db.query(DocumentJob).filter(
+                DocumentJob.status.in_(ACTIVE_STATUSES),
+                or_(DocumentJob.worker_id.is_(None), DocumentJob.worker_id != self.worker_id),
+                DocumentJob.updated_at < now - timedelta(seconds=self.stale_seconds)
+            ).order_by(DocumentJob.created_at).all()
+            job_ids = []
+            for job in jobs:
+                if (job.attempts or 0) >= self.max_attempts:
+                    fields = {
+                        "status": "failed",
+                        "error": "Processing was interrupted too many times.",
+                        "finished_at": now,
+                    }
+                else:
+                    fields = {"status": "queued"}
+                # Unless another process took it over first
+                taken = db.query(DocumentJob).filter(
+                    DocumentJob.id == job.id,
+                    DocumentJob.updated_at == job.updated_at
+                ).update({**fields, "worker_id": self.worker_id, "updated_at": now}, synchronize_session=False)
+                if taken and fields["status"] == "queued":
+                    job_ids.append(job.id)
+            db.commit()
+            return job_ids
+        finally:
+            db.close()
+
+    @staticmethod
+    def _to_dict(job: DocumentJob) -> Dict[str, Any]:
+        return {
+            "id": job.id,
+            "user_id": job.user_id,
+            "filename": job.filename,
+            "file_path": job.file_path,
+            "content_hash": job.content_hash,
+            "language": job.language,
+            "status": job.status,
+            "stage": job.stage,
+            "progress": job.progress,
+            "attempts": job.attempts,
+        }
+
+document_jobs = DocumentJobQueue()
@@ -0,0 +1,194 @@
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import gzip
+import json
+import math
+import os
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\d+[a-z]*|[a-zऀ-ॿ]+')
+# "Article 21", "Section 498A", "IPC 302", "CrPC 41" also become single compound terms
+IDENTIFIER_PATTERN = re.compile(r'\b(article|art|section|sec|ipc|crpc)\.?\s*(\d+[a-z]*)\b')
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on",
+    "or", "that", "the", "this", "to", "was", "what", "which", "with", "shall", "such", "any",
+}
+IDENTIFIER_ALIASES = {"art": "article", "sec": "section"}
+# The change log is folded into the snapshot once it holds this many chunk changes
+# per indexed chunk (and at least LOG_COMPACT_MIN_ENTRIES)
+LOG_COMPACT_RATIO = 0.5
+LOG_COMPACT_MIN_ENTRIES = 1000
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word/number tokens plus compound legal identifiers such as "section:498a\""""
+    text = text.lower()
+    tokens = [token for token in TOKEN_PATTERN.findall(text) if token not in STOPWORDS]
+    for kind, number in IDENTIFIER_PATTERN.findall(text):
+        tokens.append(f"{IDENTIFIER_ALIASES.get(kind, kind)}:{number}")
+    return tokens
+
+class BM25Index:
+    """In-process inverted index with Okapi BM25 scoring.
+
+    Only per-chunk term frequencies are persisted: a gzipped JSON snapshot plus
+    an append-only change log (<path>.log, one JSON line per save). Postings and
+    document frequencies are rebuilt in memory on load. Chunks can be added and
+    removed incrementally as documents are ingested; save only appends the
+    chunks changed since the last save, and rewrites the snapshot once the log
+    has grown to LOG_COMPACT_RATIO of the index.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_length = 0
+        # Changes not yet written to the log: chunk_id -> term counts, or None when removed
+        self._pending: Dict[str, Optional[Dict[str, int]]] = {}
+        self._log_entries = 0
+        self._lock = threading.RLock()
+        if path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]):
+        """Index (or re-index) chunks"""
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id in self._doc_terms:
+                    self._remove_one(chunk_id)
+                self._add_one(chunk_id, dict(Counter(tokenize(text))))
+                if self.path:
+                    self._pending[chunk_id] = self._doc_terms[chunk_id]
+
+    def remove(self, ids: Iterable[str]):
+        """Drop chunks from the index"""
+        with self._lock:
+            for chunk_id in ids:
+                if chunk_id in self._doc_terms:
+                    self._remove_one(chunk_id)
+                    if self.path:
+                        self._pending[chunk_id] = None
+
+    def _add_one(self, chunk_id: str, term_counts: Dict[str, int]):
+        self._doc_terms[chunk_id] = term_counts
+        length = sum(term_counts.values())
+        self._doc_lengths[chunk_id] = length
+        self._total_length += length
+        for term, count in term_counts.items():
+            self._postings[term][chunk_id] = count
+
+    def _remove_one(self, chunk_id: str):
+        term_counts = self._doc_terms.pop(chunk_id)
+        self._total_length -= self._doc_lengths.pop(chunk_id, 0)
+        for term in term_counts:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, k: int = 5, allowed_ids: Optional[set] = None) -> List[Tuple[str, float]]:
+        """Return up to k (chunk_id, score) pairs ranked by BM25"""
+        query_terms = set(tokenize(query))
+        with self._lock:
+            doc_count = len(self._doc_terms)
+            if not doc_count or not query_terms:
+                return []
+            avg_length = self._total_length / doc_count
+
+            scores: Dict[str, float] = defaultdict(float)
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, term_frequency in postings.items():
+                    if allowed_ids is not None and chunk_id not in allowed_ids:
+                        continue
+                    length_norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[chunk_id] / avg_length)
+                    scores[chunk_id] += idf * term_frequency * (self.k1 + 1) / (term_frequency + length_norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    @property
+    def _log_path(self) -> str:
+        return f"{self.path}.log"
+
+    def load(self):
+        """Load the persisted snapshot, if any, and replay the change log on top of it"""
+        if not self.path:
+            return
+        try:
+            with self._lock:
+                self._doc_terms.clear()
+                self._doc_lengths.clear()
+                self._postings.clear()
+                self._total_length = 0
+                self._pending.clear()
+                self._log_entries = 0
+                if os.path.exists(self.path):
+                    with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                        data = json.load(f)
+                    for chunk_id, term_counts in data["docs"].items():
+                        self._add_one(chunk_id, term_counts)
+                if os.path.exists(self._log_path) and not self._replay_log():
+                    # Later saves would append onto the torn line, so fold the log in now
+                    self._write_snapshot()
+            if self._doc_terms:
+                logger.info(f"Loaded BM25 index with {len(self._doc_terms)} chunks from {self.path}")
+        except Exception as e:
+            logger.error(f"Error loading BM25 index, starting empty: {str(e)}")
+
+    def _replay_log(self) -> bool:
+        """Apply the logged changes; False if the log ends in a torn line"""
+        with open(self._log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    changes = json.loads(line)
+                except ValueError:
+                    return False  # a save interrupted mid-line; everything before it is intact
+                for chunk_id, term_counts in changes.items():
+                    if chunk_id in self._doc_terms:
+                        self._remove_one(chunk_id)
+                    if term_counts is not None:
+                        self._add_one(chunk_id, term_counts)
+                self._log_entries += len(changes)
+        return True
+
+    def save(self):
+        """Append the chunks changed since the last save to the log, compacting it when it has grown large"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._pending:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            if self._log_entries + len(self._pending) > max(LOG_COMPACT_MIN_ENTRIES, LOG_COMPACT_RATIO * len(self._doc_terms)):
+                self._write_snapshot()
+            else:
+                with open(self._log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(self._pending, separators=(",", ":")) + "\n")
+                self._log_entries += len(self._pending)
+            self._pending.clear()
+
+    def _write_snapshot(self):
+        """Rewrite the snapshot atomically and start an empty log"""
+        data = {"version": 1, "docs": self._doc_terms}
+        tmp_path = f"{self.path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        # Replaying an old log over the new snapshot is harmless, so a crash here loses nothing
+        if os.path.exists(self._log_path):
+            os.remove(self._log_path)
+        self._log_entries = 0
@@ -0,0 +1,118 @@
+from typing import Dict, Any, Optional
+from app.services.ai_service import AIService
+from app.services.ocr_service import OCRService
+from app.services.vector_service import VectorService
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ServiceRegistry:
+    """Process-wide container holding one instance of each heavyweight service.
+
+    Services are created lazily on first access and shared by every router, so a
+    worker loads the embedding model and opens the Chroma client only once.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._vector_service: Optional[VectorService] = None
+        self._ai_service: Optional[AIService] = None
+        self._ocr_service: Optional[OCRService] = None
+        self.ready = False
+        self.warmup_error: Optional[str] = None
+        self.warmup_timings: Dict[str, float] = {}
+
+    @property
+    def vector_service(self) -> VectorService:
+        if self._vector_service is None:
+            with self._lock:
+                if self._vector_service is None:
+                    self._vector_service = VectorService()
+        return self._vector_service
+
+    @property
+    def ai_service(self) -> AIService:
+        if self._ai_service is None:
+            with self._lock:
+                if self._ai_service is None:
+                    self._ai_service = AIService(vector_service=self.vector_service)
+        return self._ai_service
+
+    @property
+    def ocr_service(self) -> OCRService:
+        if self._ocr_service is None:
+            with self._lock:
+                if self._ocr_service is None:
+                    self._ocr_service = OCRService()
+        return self._ocr_service
+
+    def warm_up(self) -> Dict[str, Any]:
+        """Instantiate all services and exercise the embedding model and Chroma once"""
+        try:
+            started = time.perf_counter()
+            self.ocr_service
+            self.ai_service
+            self.warmup_timings["services_loaded_s"] = round(time.perf_counter() - started, 3)
+
+            self.ai_service.statute_index.load()
+
+            status = self.vector_service.warm_up()
+            self.warmup_timings["total_s"] = round(time.perf_counter() - started, 3)
+
+            self.ready = True
+            self.warmup_error = None
+            logger.info(f"Services warmed up in {self.warmup_timings['total_s']}s")
+            return status
+
+        except Exception as e:
+            self.ready = False
+            self.warmup_error = str(e)
+            logger.error(f"Error warming up services: {str(e)}")
+            raise
+
+    def status(self) -> Dict[str, Any]:
+        """Readiness snapshot used by the health endpoints"""
+        return {
+            "ready": self.ready,
+            "error": self.warmup_error,
+            "timings": self.warmup_timings,
+            "services": {
+                "vector_service": self._vector_service is not None,
+                "ai_service": self._ai_service is not None,
+                "ocr_service": self._ocr_service is not None,
+            }
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        """Cache and OCR statistics of the services that have been created so far"""
+        metrics: Dict[str, Any] = {}
+        if self._ai_service is not None and self._ai_service.answer_cache is not None:
+            metrics["answer_cache"] = self._ai_service.answer_cache.stats()
+        if self._vector_service is not None and self._vector_service.embedding_cache is not None:
+            metrics["embedding_cache"] = self._vector_service.embedding_cache.stats()
+        if self._vector_service is not None and self._vector_service.embedding_batcher is not None:
+            metrics["embedding_batcher"] = self._vector_service.embedding_batcher.stats()
+        if self._ocr_service is not None:
+            metrics["ocr"] = self._ocr_service.stats()
+        return metrics
+
+    def shutdown(self):
+        """Release resources held by the services that were created"""
+        if self._vector_service is not None:
+            self._vector_service.close()
+
+services = ServiceRegistry()
+
+def get_vector_service() -> VectorService:
+    """FastAPI dependency returning the shared VectorService"""
+    return services.vector_service
+
+def get_ai_service() -> AIService:
+    """FastAPI dependency returning the shared AIService"""
+    return services.ai_service
+
+def get_ocr_service() -> OCRService:
+    """FastAPI dependency returning the shared OCRService"""
+    return services.ocr_service
@@ -0,0 +1,170 @@
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import func
+from app.database.connection import SessionLocal
+from app.database.models import LegalDocument
+from app.utils.text_processing import TextProcessor
+import fitz  # PyMuPDF
+import hashlib
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_TITLES = {
+    "constitution": ("Constitution of India", "Article"),
+    "ipc": ("Indian Penal Code", "Section"),
+    "crpc": ("Code of Criminal Procedure", "Section"),
+}
+REFRESH_INTERVAL_SECONDS = 60  # how often a loaded index checks whether process_documents.py rebuilt the table
+
+class StatuteIndex:
+    """Exact lookup of Constitution Articles and Act Sections by number.
+
+    Provisions are parsed from the bare acts at ingestion time and stored in the
+    legal_documents table; at runtime they are held in a dict keyed on
+    (document_type, section) for O(1) lookup. The index reloads itself when the
+    table changes (checked cheaply through the row count and latest indexed_at),
+    and each provision carries a hash of its text so cached answers based on
+    an older wording are not reused.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self.text_processor = TextProcessor()
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple] = None
+        self._checked_at = 0.0
+        self.loaded = False
+
+    def load(self) -> int:
+        """Load all stored provisions into memory; on failure the previous entries are kept and loaded stays False"""
+        db = self.session_factory()
+        try:
+            signature = self._table_signature(db)
+            rows = db.query(LegalDocument).all()
+            entries = {
+                (row.document_type, row.section): {
+                    "document_type": row.document_type,
+                    "section": row.section,
+                    "title": row.title,
+                    "content": row.content,
+                    "content_hash": hashlib.sha256((row.content or "").encode("utf-8")).hexdigest()[:16],
+                }
+                for row in rows
+            }
+        except Exception as e:
+            logger.error(f"Error loading statute index: {str(e)}")
+            return len(self._entries)
+        finally:
+            db.close()
+
+        with self._lock:
+            self._entries = entries
+            self._signature = signature
+            self._checked_at = time.monotonic()
+            self.loaded = True
+        logger.info(f"Statute index loaded with {len(entries)} provisions")
+        return len(entries)
+
+    def refresh(self) -> int:
+        """Load the index if it is not loaded yet, or reload it if the stored provisions changed since"""
+        if not self.loaded:
+            return self.load()
+        if time.monotonic() - self._checked_at < REFRESH_INTERVAL_SECONDS:
+            return len(self._entries)
+        db = self.session_factory()
+        try:
+            signature = self._table_signature(db)
+        except Exception as e:
+            logger.error(f"Error checking statute index: {str(e)}")
+            return len(self._entries)
+        finally:
+            db.close()
+        self._checked_at = time.monotonic()
+        if signature == self._signature:
+            return len(self._entries)
+        return self.load()
+
+    def needs_refresh(self) -> bool:
+        return not self.loaded or time.monotonic() - self._checked_at >= REFRESH_INTERVAL_SECONDS
+
+    @staticmethod
+    def _table_signature(db) -> Tuple:
+        return tuple(db.query(func.count(LegalDocument.id), func.max(LegalDocument.indexed_at)).one())
+
+    def lookup(self, document_type: str, section: str) -> Optional[Dict[str, Any]]:
+        """Return the provision with this exact number, if known"""
+        return self._entries.get((document_type, section.upper()))
+
+    def resolve(self, text: str) -> List[Dict[str, Any]]:
+        """Return every provision explicitly referenced in text that the index knows about"""
+        provisions = []
+        for document_type, section in self.text_processor.extract_provision_references(text):
+            provision = self.lookup(document_type, section)
+            if provision:
+                provisions.append(provision)
+        return provisions
+
+    def to_search_result(self, provision: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape a provision like a vector search hit so it can be used as prompt context"""
+        document_name, label = DOCUMENT_TITLES.get(provision["document_type"], ("Act", "Section"))
+        return {
+            "id": f"{provision['document_type']}:{provision['section']}",
+            "content": provision["content"],
+            "metadata": {
+                "source": f"{document_name} - {label} {provision['section']}",
+                "document_type": provision["document_type"],
+                "section": provision["section"],
+                "title": provision["title"],
+            },
+            "distance": 0.0,
+            "relevance_score": 1.0,
+            "exact_match": True,
+            "content_hash": provision["content_hash"],
+        }
+
+    def remove(self, document_type: str) -> int:
+        """Delete the stored provisions of one document type"""
+        db = self.session_factory()
+        try:
+            deleted = db.query(LegalDocument).filter(LegalDocument.document_type == document_type).delete()
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def build_from_pdf(self, pdf_path: str, document_type: str) -> int:
+        """Parse a bare act into per-provision records, replacing any previous records of that type"""
+        doc = fitz.open(pdf_path)
+        try:
+            text = "\n".join(page.get_text() for page in doc)
+        finally:
+            doc.close()
+
+        provisions = self.text_processor.split_statute_provisions(text)
+        document_name, label = DOCUMENT_TITLES.get(document_type, ("Act", "Section"))
+
+        db = self.session_factory()
+        try:
+            db.query(LegalDocument).filter(LegalDocument.document_type == document_type).delete()
+            db.add_all([
+                LegalDocument(
+                    title=f"{document_name}, {label} {provision['section']}: {provision['title']}",
+                    document_type=document_type,
+                    section=provision["section"],
+                    content=provision["content"],
+                    embedding_id=None
+                )
+                for provision in provisions
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        logger.info(f"Indexed {len(provisions)} provisions of {document_type} from {pdf_path}")
+        return len(provisions)
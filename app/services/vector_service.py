@@ -1,113 +1,432 @@
-import chromadb
-from chromadb.config import Settings as ChromaSettings
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyMuPDFLoader
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from app.config import settings
-import uuid
+from app.services.executor import execution_service
+from app.services.cache_service import EmbeddingCache
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.lexical_index import BM25Index
+from app.services.ingestion_pipeline import chunk_pages
+from app.services.vector_store import VectorStore, create_vector_store
+from app.utils.embeddings import create_embeddings
+import asyncio
+import hashlib
+import os
 import logging
 
 logger = logging.getLogger(__name__)
 
 class VectorService:
-    def __init__(self):
-        self.client = chromadb.PersistentClient(
-            path=settings.CHROMA_PERSIST_DIRECTORY,
-            settings=ChromaSettings(anonymized_telemetry=False)
-        )
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=settings.EMBEDDING_MODEL
+    def __init__(self, store: Optional[VectorStore] = None):
+        # Chroma or the native memory-mapped store, per settings.VECTOR_STORE_BACKEND
+        self.store = store or create_vector_store()
+        # HuggingFaceEmbeddings (torch) or ONNX Runtime, per settings.EMBEDDING_BACKEND
+        self.embeddings = create_embeddings(
+            settings.EMBEDDING_BACKEND,
+            settings.EMBEDDING_MODEL,
+            path=settings.EMBEDDING_ONNX_PATH,
+            quantized=settings.EMBEDDING_ONNX_QUANTIZED,
+            threads=settings.EMBEDDING_ONNX_THREADS,
+            batch_size=settings.EMBEDDING_ONNX_BATCH_SIZE
         )
+        # Statute corpus; each user's uploads live in a collection of their own (see user_collection)
         self.collection_name = "legal_documents"
         self.collection = self._get_or_create_collection()
+        self._user_collections: Dict[int, Any] = {}
+        self.embedding_cache = EmbeddingCache(settings.EMBEDDING_MODEL) if settings.EMBEDDING_CACHE_SIZE > 0 else None
+        self.embedding_batcher = EmbeddingBatcher(self.embeddings.embed_documents) if settings.EMBEDDING_BATCHING_ENABLED else None
+        self.lexical_index = BM25Index(os.path.join(settings.CHROMA_PERSIST_DIRECTORY, "bm25_index.json.gz"))
         
-    def _get_or_create_collection(self):
-        try:
-            return self.client.get_collection(name=self.collection_name)
-        except:
-            return self.client.create_collection(
-                name=self.collection_name,
-                metadata={"description": "Indian Legal Documents Collection"}
+    def _get_or_create_collection(self, name: Optional[str] = None, description: str = "Indian Legal Documents Collection"):
+        return self.store.get_or_create_collection(name or self.collection_name, metadata={"description": description})
+    
+    def user_collection_name(self, user_id: int) -> str:
+        return f"user_{user_id}_documents"
+    
+    async def user_collection(self, user_id: int):
+        """The collection holding the chunks of one user's uploaded documents"""
+        collection = self._user_collections.get(user_id)
+        if collection is None:
+            collection = await execution_service.run_io(
+                self._get_or_create_collection,
+                self.user_collection_name(user_id),
+                f"Documents uploaded by user {user_id}"
             )
+            self._user_collections[user_id] = collection
+        return collection
+    
+    def warm_up(self) -> Dict[str, Any]:
+        """Load the embedding model weights and verify the Chroma connection"""
+        self.embeddings.embed_query("warm up")
+        heartbeat = self.store.heartbeat()
+        self.migrate_to_user_namespaces()
+        chunk_count = self.collection.count()
+        if chunk_count and len(self.lexical_index) == 0:
+            self.rebuild_lexical_index()
+        logger.info(f"Vector service warmed up ({chunk_count} chunks in '{self.collection_name}', {self.store.name} store)")
+        return {
+            "embedding_backend": settings.EMBEDDING_BACKEND,
+            "vector_store": self.store.name,
+            "store_heartbeat": heartbeat,
+            "chunk_count": chunk_count,
+            "lexical_chunk_count": len(self.lexical_index)
+        }
+    
+    def optimize(self) -> Dict[str, Any]:
+        """Store maintenance after bulk ingestion (segment merging, IVF training for the native store)"""
+        return self.store.optimize(self.collection)
+    
+    def rebuild_lexical_index(self, batch_size: int = 1000) -> int:
+        """Rebuild the BM25 index from every chunk stored in the collection"""
+        offset = 0
+        while True:
+            batch = self.collection.get(include=["documents"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            self.lexical_index.add(batch["ids"], batch["documents"])
+            offset += len(batch["ids"])
+        self.lexical_index.save()
+        logger.info(f"Rebuilt BM25 index over {offset} chunks")
+        return offset
+    
+    def migrate_to_user_namespaces(self, batch_size: int = 1000) -> int:
+        """One-off removal of uploaded documents from the statute collection.
+
+        Uploads used to be indexed next to the statutes (and then in one shared
+        user_documents collection), so any user's search could return them. Their
+        chunks are dropped here; each document is indexed again in its owner's
+        collection the first time it is asked about.
+        """
+        marker_path = os.path.join(settings.CHROMA_PERSIST_DIRECTORY, "user_namespaces.v1")
+        if os.path.exists(marker_path):
+            return 0
+        
+        upload_dir = os.path.abspath(settings.UPLOAD_DIR) + os.sep
+        stale_ids = []
+        offset = 0
+        while True:
+            batch = self.collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            for chunk_id, metadata in zip(batch["ids"], batch["metadatas"]):
+                if os.path.abspath(metadata.get("source", "")).startswith(upload_dir):
+                    stale_ids.append(chunk_id)
+            offset += len(batch["ids"])
+        
+        for start in range(0, len(stale_ids), batch_size):
+            self.collection.delete(ids=stale_ids[start:start + batch_size])
+        if stale_ids:
+            self.lexical_index.remove(stale_ids)
+            self.lexical_index.save()
+        try:
+            self.store.delete_collection("user_documents")
+        except Exception:
+            pass
+        
+        os.makedirs(os.path.dirname(marker_path), exist_ok=True)
+        with open(marker_path, "w") as f:
+            f.write(f"{len(stale_ids)}\n")
+        logger.info(f"Moved user uploads out of '{self.collection_name}' ({len(stale_ids)} chunks removed)")
+        return len(stale_ids)
     
     async def process_and_store_documents(self, document_paths: List[str]) -> bool:
         """Process legal documents and store in vector database"""
         try:
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=settings.CHUNK_SIZE,
-                chunk_overlap=settings.CHUNK_OVERLAP,
-                length_function=len,
-            )
-            
-            all_chunks = []
-            metadatas = []
-            ids = []
-            
+            total_chunks = 0
             for doc_path in document_paths:
-                # Load document
-                loader = PyMuPDFLoader(doc_path)
-                documents = loader.load()
-                
-                # Split into chunks
-                chunks = text_splitter.split_documents(documents)
-                
-                for i, chunk in enumerate(chunks):
-                    chunk_id = f"{doc_path.split('/')[-1]}_{i}_{uuid.uuid4().hex[:8]}"
-                    ids.append(chunk_id)
-                    all_chunks.append(chunk.page_content)
-                    metadatas.append({
-                        "source": doc_path,
-                        "chunk_index": i,
-                        "document_type": self._get_document_type(doc_path),
-                        "page": chunk.metadata.get("page", 0)
-                    })
-            
-            # Generate embeddings
-            embeddings = self.embeddings.embed_documents(all_chunks)
+                chunk_ids = await self.store_document(doc_path)
+                total_chunks += len(chunk_ids)
             
-            # Store in ChromaDB
-            self.collection.add(
-                embeddings=embeddings,
-                documents=all_chunks,
-                metadatas=metadatas,
-                ids=ids
-            )
-            
-            logger.info(f"Successfully processed and stored {len(all_chunks)} chunks")
+            logger.info(f"Successfully processed and stored {total_chunks} chunks")
             return True
             
         except Exception as e:
             logger.error(f"Error processing documents: {str(e)}")
             return False
     
-    async def similarity_search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """Perform similarity search on vector database"""
+    async def store_document(self, doc_path: str) -> List[str]:
+        """Chunk, embed and upsert one PDF, returning the IDs of its chunks"""
+        # Load document
+        loader = PyMuPDFLoader(doc_path)
+        documents = await execution_service.run_cpu(loader.load)
+        pages = [{"page": document.metadata.get("page", 0), "text": document.page_content} for document in documents]
+        return await self.store_pages(doc_path, pages)
+    
+    async def store_user_document(self, user_id: int, file_path: str, pages: List[Dict[str, Any]]) -> List[str]:
+        """Chunk and index an uploaded document in its owner's collection"""
+        return await self.store_pages(
+            file_path,
+            pages,
+            collection=await self.user_collection(user_id),
+            metadata={"document_type": "user_document", "user_id": user_id}
+        )
+    
+    async def copy_user_document(self, from_user_id: int, to_user_id: int, file_path: str) -> int:
+        """Copy an already embedded document between users' collections instead of embedding it again"""
+        source_collection = await self.user_collection(from_user_id)
+        stored = await execution_service.run_io(
+            source_collection.get, where={"source": file_path}, include=["documents", "metadatas", "embeddings"]
+        )
+        if not stored["ids"]:
+            return 0
+        
+        target_collection = await self.user_collection(to_user_id)
+        await execution_service.run_io(
+            target_collection.upsert,
+            ids=stored["ids"],
+            embeddings=stored["embeddings"],
+            documents=stored["documents"],
+            metadatas=[{**metadata, "user_id": to_user_id} for metadata in stored["metadatas"]]
+        )
+        return len(stored["ids"])
+    
+    async def store_pages(
+        self,
+        doc_path: str,
+        pages: List[Dict[str, Any]],
+        collection=None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> List[str]:
+        """Chunk, embed and upsert already extracted page text, returning the IDs of its chunks.
+
+        Chunk IDs are derived from the file name, chunk position and chunk text,
+        so storing an unchanged document again overwrites rather than duplicates.
+        Only chunks of the statute collection are added to the lexical index.
+        metadata is merged into every chunk's metadata.
+        """
+        collection = collection or self.collection
+        # Split into chunks
+        chunks = chunk_pages(pages, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
+        
+        all_chunks = []
+        metadatas = []
+        ids = []
+        for i, chunk in enumerate(chunks):
+            ids.append(self._chunk_id(doc_path, i, chunk["text"]))
+            all_chunks.append(chunk["text"])
+            metadatas.append({
+                "source": doc_path,
+                "chunk_index": i,
+                "document_type": self._get_document_type(doc_path),
+                "page": chunk["page"],
+                **(metadata or {})
+            })
+        
+        if not all_chunks:
+            return []
+        
+        # Generate embeddings
+        embeddings = await execution_service.run_cpu(self.embeddings.embed_documents, all_chunks)
+        
+        # Store in ChromaDB
+        await execution_service.run_io(
+            collection.upsert,
+            embeddings=embeddings,
+            documents=all_chunks,
+            metadatas=metadatas,
+            ids=ids
+        )
+        
+        # Keep the lexical index in step with the collection
+        if collection is self.collection:
+            self.lexical_index.add(ids, all_chunks)
+            await execution_service.run_io(self.lexical_index.save)
+        
+        return ids
+    
+    async def has_chunks(self, source: str, collection=None) -> bool:
+        """True when at least one chunk of this source file is stored"""
+        collection = collection or self.collection
+        existing = await execution_service.run_io(collection.get, where={"source": source}, limit=1, include=[])
+        return bool(existing["ids"])
+    
+    async def delete_chunks(self, ids: Optional[List[str]] = None, source: Optional[str] = None, collection=None) -> int:
+        """Delete chunks by ID and/or every chunk whose metadata source matches"""
+        collection = collection or self.collection
+        ids = list(ids or [])
+        if source:
+            existing = await execution_service.run_io(collection.get, where={"source": source}, include=[])
+            ids.extend(chunk_id for chunk_id in existing["ids"] if chunk_id not in ids)
+        
+        if not ids:
+            return 0
+        
+        await execution_service.run_io(collection.delete, ids=ids)
+        if collection is self.collection:
+            self.lexical_index.remove(ids)
+            await execution_service.run_io(self.lexical_index.save)
+        return len(ids)
+    
+    async def similarity_search(
+        self,
+        query: str,
+        k: int = 5,
+        mode: Optional[str] = None,
+        document_types: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Perform similarity search over the statute corpus.
+
+        mode is "vector" for dense retrieval only or "hybrid" to fuse dense and
+        BM25 rankings with reciprocal-rank fusion; it defaults to settings.RETRIEVAL_MODE.
+        document_types (e.g. ["constitution", "ipc"]) restricts the search to those acts.
+        """
         logger.info(f"Performing similarity search for query: {query}")
         try:
-            query_embedding = self.embeddings.embed_query(query)
+            mode = mode or settings.RETRIEVAL_MODE
+            where = self._metadata_filter("document_type", document_types)
+            if mode != "hybrid" or len(self.lexical_index) == 0:
+                return await self._vector_search(query, k, where=where)
             
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=k,
-                include=["documents", "metadatas", "distances"]
+            candidate_count = k * settings.HYBRID_CANDIDATE_MULTIPLIER
+            vector_results, lexical_hits = await asyncio.gather(
+                self._vector_search(query, candidate_count, where=where),
+                execution_service.run_cpu(self.lexical_index.search, query, candidate_count)
             )
+            if where and lexical_hits:
+                # The BM25 index spans the whole corpus; keep only hits inside the filter
+                allowed = await execution_service.run_io(
+                    self.collection.get, ids=[chunk_id for chunk_id, _ in lexical_hits], where=where, include=[]
+                )
+                allowed_ids = set(allowed["ids"])
+                lexical_hits = [hit for hit in lexical_hits if hit[0] in allowed_ids]
+            return await self._fuse_rankings(vector_results, lexical_hits, k)
             
-            search_results = []
-            for i in range(len(results["documents"][0])):
-                search_results.append({
-                    "content": results["documents"][0][i],
-                    "metadata": results["metadatas"][0][i],
-                    "distance": results["distances"][0][i],
-                    "relevance_score": 1 - results["distances"][0][i]
-                })
+        except Exception as e:
+            logger.error(f"Error in similarity search: {str(e)}")
+            return []
+    
+    async def search_user_documents(self, query: str, user_id: int, sources: List[str], k: int = 6) -> List[Dict[str, Any]]:
+        """Hybrid search over some of one user's uploaded documents.
+
+        Only that user's collection is touched. Dense hits are filtered on source;
+        the lexical side is a throwaway BM25 index over the selected documents' chunks.
+        """
+        try:
+            where = self._metadata_filter("source", sources)
+            if not where:
+                return []
+            collection = await self.user_collection(user_id)
+            stored = await execution_service.run_io(collection.get, where=where, include=["documents"])
+            if not stored["ids"]:
+                return []
             
-            return search_results
+            # Never ask Chroma for more neighbours than the filter can match
+            candidate_count = min(k * settings.HYBRID_CANDIDATE_MULTIPLIER, len(stored["ids"]))
+            vector_results = await self._vector_search(query, candidate_count, collection=collection, where=where)
+            lexical_index = BM25Index()
+            lexical_index.add(stored["ids"], stored["documents"])
+            lexical_hits = lexical_index.search(query, candidate_count)
+            return await self._fuse_rankings(vector_results, lexical_hits, k, collection=collection)
             
         except Exception as e:
-            logger.error(f"Error in similarity search: {str(e)}")
+            logger.error(f"Error searching documents of user {user_id}: {str(e)}")
             return []
     
+    async def _vector_search(self, query: str, k: int, collection=None, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        query_embedding = await self.embed_query(query)
+        collection = collection or self.collection
+        
+        query_kwargs = {"where": where} if where else {}
+        results = await execution_service.run_io(
+            collection.query,
+            query_embeddings=[query_embedding],
+            n_results=k,
+            include=["documents", "metadatas", "distances", "embeddings"],
+            **query_kwargs
+        )
+        
+        search_results = []
+        for i in range(len(results["documents"][0])):
+            search_results.append({
+                "id": results["ids"][0][i],
+                "content": results["documents"][0][i],
+                "metadata": results["metadatas"][0][i],
+                "distance": results["distances"][0][i],
+                "relevance_score": 1 - results["distances"][0][i],
+                # Lets the context builder diversify chunks without embedding them again
+                "embedding": results["embeddings"][0][i]
+            })
+        
+        return search_results
+    
+    async def _fuse_rankings(self, vector_results: List[Dict[str, Any]], lexical_hits: List, k: int, collection=None) -> List[Dict[str, Any]]:
+        """Merge dense and lexical rankings with reciprocal-rank fusion"""
+        collection = collection or self.collection
+        fused_scores: Dict[str, float] = {}
+        for rank, result in enumerate(vector_results):
+            fused_scores[result["id"]] = fused_scores.get(result["id"], 0.0) + 1 / (settings.RRF_K + rank + 1)
+        for rank, (chunk_id, _) in enumerate(lexical_hits):
+            fused_scores[chunk_id] = fused_scores.get(chunk_id, 0.0) + 1 / (settings.RRF_K + rank + 1)
+        
+        top_ids = sorted(fused_scores, key=fused_scores.get, reverse=True)[:k]
+        
+        results_by_id = {result["id"]: result for result in vector_results}
+        missing_ids = [chunk_id for chunk_id in top_ids if chunk_id not in results_by_id]
+        if missing_ids:
+            fetched = await execution_service.run_io(
+                collection.get,
+                ids=missing_ids,
+                include=["documents", "metadatas", "embeddings"]
+            )
+            # Lexical-only hits have no dense score; rate them like the weakest dense candidate
+            floor_score = min((result["relevance_score"] for result in vector_results), default=0.0)
+            for chunk_id, content, metadata, embedding in zip(
+                fetched["ids"], fetched["documents"], fetched["metadatas"], fetched["embeddings"]
+            ):
+                results_by_id[chunk_id] = {
+                    "id": chunk_id,
+                    "content": content,
+                    "metadata": metadata,
+                    "distance": None,
+                    "relevance_score": floor_score,
+                    "embedding": embedding
+                }
+        
+        fused_results = []
+        for chunk_id in top_ids:
+            if chunk_id in results_by_id:
+                result = dict(results_by_id[chunk_id])
+                result["fusion_score"] = fused_scores[chunk_id]
+                fused_results.append(result)
+        return fused_results
+    
+    async def embed_query(self, query: str) -> List[float]:
+        """Embed a query, serving repeated queries from the embedding cache"""
+        if self.embedding_cache is not None:
+            cached_embedding = self.embedding_cache.get(query)
+            if cached_embedding is not None:
+                return cached_embedding.tolist()
+        
+        if self.embedding_batcher is not None:
+            query_embedding = await self.embedding_batcher.embed(query)
+        else:
+            query_embedding = await execution_service.run_cpu(self.embeddings.embed_query, query)
+        
+        if self.embedding_cache is not None and self.embedding_cache.put(query, query_embedding):
+            await execution_service.run_io(self.embedding_cache.flush)
+        return query_embedding
+    
+    def close(self):
+        """Stop background batching and persist caches before the process exits"""
+        if self.embedding_batcher is not None:
+            self.embedding_batcher.close()
+        if self.embedding_cache is not None:
+            self.embedding_cache.flush()
+    
+    @staticmethod
+    def _metadata_filter(field: str, values: Optional[List[Any]]) -> Optional[Dict[str, Any]]:
+        """Chroma where clause matching any of values (None or empty means no filter)"""
+        if not values:
+            return None
+        if len(values) == 1:
+            return {field: values[0]}
+        return {field: {"$in": list(values)}}
+    
+    def _chunk_id(self, doc_path: str, index: int, content: str) -> str:
+        """Deterministic, content-hash based chunk ID"""
+        file_name = os.path.basename(doc_path)
+        digest = hashlib.sha256(f"{file_name}\x1f{index}\x1f{content}".encode("utf-8")).hexdigest()[:24]
+        return f"{file_name}_{index}_{digest}"
+    
     def _get_document_type(self, file_path: str) -> str:
         """Determine document type from file path"""
         file_name = file_path.lower()
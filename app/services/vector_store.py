@@ -0,0 +1,785 @@
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.utils.embeddings import MetadataColumns, normalize_rows, top_k_rows
+import numpy as np
+import json
+import os
+import shutil
+import threading
+import time
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, the native store is then single-process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GET_INCLUDE = ("metadatas", "documents")
+DEFAULT_QUERY_INCLUDE = ("metadatas", "documents", "distances")
+IVF_TRAINING_SAMPLE = 50_000
+IVF_TRAINING_ITERATIONS = 10
+QUANTIZATIONS = ("none", "float16", "int8")
+SCORE_BLOCK_ROWS = 2048  # rows de-quantised at a time; small enough for the scratch to stay in cache
+
+def quantize_vectors(vectors: np.ndarray, quantization: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """Search codes (and the per-dimension scale for int8) of normalised vectors; None for no quantization"""
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization: {quantization}")
+    if quantization == "none":
+        return None, None
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    scale = np.abs(vectors).max(axis=0, initial=0.0) / 127
+    scale[scale == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+class VectorStore:
+    """Where VectorService keeps its collections.
+
+    Collections follow the subset of the Chroma collection API the services
+    use: get, query, upsert, delete and count, with {field: value} and
+    {field: {"$in": [...]}} metadata filters.
+    """
+
+    name = "base"
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None):
+        raise NotImplementedError
+
+    def delete_collection(self, name: str):
+        raise NotImplementedError
+
+    def heartbeat(self) -> int:
+        raise NotImplementedError
+
+    def optimize(self, collection) -> Dict[str, Any]:
+        """Backend-specific maintenance after bulk ingestion"""
+        return {}
+
+class ChromaVectorStore(VectorStore):
+    """Chroma PersistentClient (HNSW index in CHROMA_PERSIST_DIRECTORY)"""
+
+    name = "chroma"
+
+    def __init__(self, path: str = settings.CHROMA_PERSIST_DIRECTORY):
+        import chromadb
+        from chromadb.config import Settings as ChromaSettings
+
+        self.client = chromadb.PersistentClient(
+            path=path,
+            settings=ChromaSettings(anonymized_telemetry=False)
+        )
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None):
+        return self.client.get_or_create_collection(name=name, metadata=metadata)
+
+    def delete_collection(self, name: str):
+        self.client.delete_collection(name)
+
+    def heartbeat(self) -> int:
+        return self.client.heartbeat()
+
+class NativeVectorStore(VectorStore):
+    """Memory-mapped .npy segments, one directory per collection (see NativeCollection)"""
+
+    name = "native"
+
+    def __init__(
+        self,
+        path: str = settings.NATIVE_VECTOR_STORE_DIRECTORY,
+        ivf_lists: int = settings.NATIVE_IVF_LISTS,
+        ivf_probes: int = settings.NATIVE_IVF_PROBES,
+        ivf_min_vectors: int = settings.NATIVE_IVF_MIN_VECTORS,
+        quantization: str = settings.NATIVE_QUANTIZATION,
+        rescore_factor: int = settings.NATIVE_RESCORE_FACTOR,
+        float16_cache_mb: int = settings.NATIVE_FLOAT16_CACHE_MB
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.path = path
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self.ivf_min_vectors = ivf_min_vectors
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.float16_cache_mb = float16_cache_mb
+        self._collections: Dict[str, NativeCollection] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> "NativeCollection":
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = NativeCollection(
+                    os.path.join(self.path, name), name, metadata,
+                    ivf_probes=self.ivf_probes, quantization=self.quantization, rescore_factor=self.rescore_factor,
+                    float16_cache_bytes=self.float16_cache_mb * 2**20
+                )
+            return self._collections[name]
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+            collection_path = os.path.join(self.path, name)
+            if not os.path.isdir(collection_path):
+                raise ValueError(f"Collection {name} does not exist")
+            shutil.rmtree(collection_path)
+
+    def heartbeat(self) -> int:
+        return time.time_ns()
+
+    def optimize(self, collection: "NativeCollection") -> Dict[str, Any]:
+        """Merge segments into one (re-encoding them if NATIVE_QUANTIZATION changed) and, for large collections, (re)train the IVF quantiser"""
+        collection.compact()
+        if self.ivf_lists and collection.count() >= self.ivf_min_vectors:
+            collection.build_ivf(self.ivf_lists)
+        return collection.stats()
+
+def create_vector_store(backend: str = settings.VECTOR_STORE_BACKEND) -> VectorStore:
+    if backend == "chroma":
+        return ChromaVectorStore()
+    if backend == "native":
+        return NativeVectorStore()
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+SEGMENT_SUFFIXES = ("vectors.npy", "offsets.npy", "documents.bin", "meta.json", "deleted.npy", "lists.npy", "codes.npy", "scale.npy")
+
+def _save_atomic(file_path: str, array: np.ndarray):
+    """np.save through a temporary file, so readers in other processes never see a partial array"""
+    temporary_path = f"{file_path}.tmp"
+    with open(temporary_path, "wb") as f:
+        np.save(f, array)
+    os.replace(temporary_path, file_path)
+
+class _Segment:
+    """One immutable batch of vectors; only its tombstones change after it is written"""
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+        self.vectors = np.load(self._file("vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(self._file("offsets.npy"), mmap_mode="r")
+        self.documents = np.memmap(self._file("documents.bin"), dtype=np.uint8, mode="r") if self.offsets[-1] else None
+        # Quantised search codes; the float32 vectors are then only read to rescore candidates
+        codes_path, scale_path = self._file("codes.npy"), self._file("scale.npy")
+        self.codes = np.load(codes_path, mmap_mode="r") if os.path.exists(codes_path) else None
+        self.scale = np.load(scale_path) if os.path.exists(scale_path) else None
+        # float32 copy of float16 codes, kept by the collection for segments that fit its cache
+        self.decoded: Optional[np.ndarray] = None
+        self.load_deleted()
+        self.lists: Optional[np.ndarray] = None
+        self.list_order: Optional[np.ndarray] = None
+        self.list_bounds: Optional[np.ndarray] = None
+        # IDs and metadata are read on first use so opening a collection only maps files
+        self._ids: Optional[List[str]] = None
+        self._metadata: Optional[MetadataColumns] = None
+        self._metadatas: Optional[List[Dict[str, Any]]] = None
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def live(self) -> int:
+        return len(self) - int(self.deleted.sum())
+
+    @property
+    def quantization(self) -> str:
+        if self.codes is None:
+            return "none"
+        return "int8" if self.codes.dtype == np.int8 else "float16"
+
+    @property
+    def search_bytes(self) -> int:
+        """Bytes scanned by search, i.e. what must stay resident for it to be fast"""
+        return (self.codes if self.codes is not None else self.vectors).nbytes
+
+    def scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Similarity of each query to each row (all rows, or the given ones), from the search codes"""
+        source = self.vectors if self.codes is None else self.codes
+        if self.decoded is not None:
+            source = self.decoded
+        if self.scale is not None:
+            queries = queries * self.scale  # int8 codes are vectors / scale
+        count = len(self) if rows is None else len(rows)
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            block = source[start:start + SCORE_BLOCK_ROWS] if rows is None else source[rows[start:start + SCORE_BLOCK_ROWS]]
+            scores[:, start:start + len(block)] = queries @ np.asarray(block, dtype=np.float32).T
+        return scores
+
+    def _file(self, suffix: str) -> str:
+        return os.path.join(self.path, f"{self.name}.{suffix}")
+
+    def load_metadata(self):
+        if self._ids is None:
+            with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+                sidecar = json.load(f)
+            self._metadatas = sidecar["metadatas"]
+            metadata = MetadataColumns(len(self))
+            metadata.set(range(len(self)), self._metadatas)
+            self._metadata = metadata
+            self._ids = sidecar["ids"]
+
+    @property
+    def ids(self) -> List[str]:
+        self.load_metadata()
+        return self._ids
+
+    @property
+    def metadatas(self) -> List[Dict[str, Any]]:
+        self.load_metadata()
+        return self._metadatas
+
+    def mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Live rows matching the filter"""
+        alive = ~self.deleted
+        if where:
+            self.load_metadata()
+            alive &= self._metadata.mask(where, len(self))
+        return alive
+
+    def document(self, row: int) -> str:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return self.documents[start:end].tobytes().decode("utf-8") if end > start else ""
+
+    def set_lists(self, lists: Optional[np.ndarray]):
+        """Attach IVF list assignments and index the rows of each list"""
+        self.lists = lists
+        if lists is None:
+            self.list_order = self.list_bounds = None
+            return
+        self.list_order = np.argsort(lists, kind="stable")
+        self.list_bounds = np.searchsorted(lists[self.list_order], np.arange(int(lists.max(initial=-1)) + 2))
+
+    def rows_in_lists(self, probes: np.ndarray) -> np.ndarray:
+        parts = [
+            self.list_order[self.list_bounds[probe]:self.list_bounds[probe + 1]]
+            for probe in probes if probe + 1 < len(self.list_bounds)
+        ]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def load_deleted(self):
+        deleted_path = self._file("deleted.npy")
+        self.deleted = np.load(deleted_path) if os.path.exists(deleted_path) else np.zeros(len(self.vectors), dtype=bool)
+
+    def save_deleted(self):
+        _save_atomic(self._file("deleted.npy"), self.deleted)
+
+    @staticmethod
+    def remove_files(path: str, name: str):
+        for suffix in SEGMENT_SUFFIXES:
+            file_path = os.path.join(path, f"{name}.{suffix}")
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    @staticmethod
+    def write(
+        path: str,
+        name: str,
+        ids: List[str],
+        vectors: np.ndarray,
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        quantization: str = "none"
+    ):
+        encoded = [(document or "").encode("utf-8") for document in documents]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(document) for document in encoded], out=offsets[1:])
+        prefix = os.path.join(path, name)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        np.save(f"{prefix}.vectors.npy", vectors)
+        codes, scale = quantize_vectors(vectors, quantization)
+        if codes is not None:
+            np.save(f"{prefix}.codes.npy", codes)
+        if scale is not None:
+            np.save(f"{prefix}.scale.npy", scale)
+        np.save(f"{prefix}.offsets.npy", offsets)
+        with open(f"{prefix}.documents.bin", "wb") as f:
+            f.write(b"".join(encoded))
+        with open(f"{prefix}.meta.json", "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "metadatas": metadatas}, f, ensure_ascii=False)
+
+class NativeCollection:
+    """A collection stored as append-only memory-mapped segments.
+
+    Each upsert writes a new segment: normalised float32 vectors (.npy),
+    UTF-8 documents with an offsets array, and a JSON sidecar of IDs and
+    metadata. Opening a collection only maps the .npy files; the sidecars are
+    read on first use. Overwritten and deleted rows are tombstoned, and small
+    trailing segments are merged as they accumulate (like a binary counter),
+    so a bulk load rewrites each vector only O(log n) times.
+
+    Several processes may share a collection directory (the server and
+    process_documents.py, or several workers). Writes hold an exclusive
+    flock on writer.lock and start from the latest manifest; every change
+    ends with an atomic manifest rewrite, which readers notice by its stat
+    signature and reload. Segments merged away are only retired: their files
+    are deleted when the collection is next opened while no other process
+    has it open (each open collection holds a shared lock on readers.lock).
+    Without fcntl (Windows) there is no locking, so keep to one process.
+
+    Search is exact (a matrix product per segment) unless an IVF coarse
+    quantiser has been trained with build_ivf: then each query scores only
+    the rows in its ivf_probes nearest lists. With a quantization, segments
+    also store float16 or int8 (per-dimension scale) codes; search scans the
+    codes and rescores the best rescore_factor * k rows against the float32
+    vectors, which stay on disk. numpy multiplies float16 an order of magnitude
+    slower than float32, so float16 codes are decoded into float32 copies held
+    in memory, up to float16_cache_bytes per collection; only segments beyond
+    that are scanned (slowly) from the codes. Cosine distance (1 - cosine similarity) is
+    reported as the distance.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        name: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        ivf_probes: int = 8,
+        quantization: str = "none",
+        rescore_factor: int = 4,
+        float16_cache_bytes: int = 0
+    ):
+        self.path = path
+        self.name = name
+        self.ivf_probes = ivf_probes
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self.float16_cache_bytes = float16_cache_bytes
+        self._lock = threading.RLock()
+        self._write_depth = 0
+        os.makedirs(path, exist_ok=True)
+
+        self._manifest_path = os.path.join(path, "manifest.json")
+        self._manifest: Dict[str, Any] = {}
+        self._manifest_signature: Optional[Tuple[int, int, int]] = None
+        self._segments: List[_Segment] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._locations: Optional[Dict[str, Tuple[_Segment, int]]] = None
+        self._readers_lock = open(os.path.join(path, "readers.lock"), "a")
+
+        with self._write_lock():
+            if not os.path.exists(self._manifest_path):
+                self._manifest = {
+                    "name": name, "metadata": metadata or {}, "dimension": None, "segments": [],
+                    "next_segment": 1, "ivf_lists": 0, "retired": []
+                }
+                self._write_manifest()
+            self._delete_retired()
+        if fcntl is not None:
+            fcntl.flock(self._readers_lock.fileno(), fcntl.LOCK_SH)
+        self.metadata = self._manifest["metadata"]
+
+    # Chroma-compatible API
+
+    def count(self) -> int:
+        self._refresh()
+        return sum(segment.live for segment in self._segments)
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None, metadatas: Optional[List[Dict[str, Any]]] = None):
+        if not ids:
+            return
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        documents = list(documents) if documents is not None else [""] * len(ids)
+        metadatas = [dict(metadata or {}) for metadata in metadatas] if metadatas is not None else [{} for _ in ids]
+
+        # The last occurrence of a repeated ID wins
+        latest = {item_id: position for position, item_id in enumerate(ids)}
+        if len(latest) < len(ids):
+            keep = sorted(latest.values())
+            ids, vectors = [ids[i] for i in keep], vectors[keep]
+            documents, metadatas = [documents[i] for i in keep], [metadatas[i] for i in keep]
+
+        with self._write_lock():
+            if self._manifest["dimension"] is None:
+                self._manifest["dimension"] = vectors.shape[1]
+            elif vectors.shape[1] != self._manifest["dimension"]:
+                raise ValueError(f"Expected {self._manifest['dimension']}-dimensional embeddings, got {vectors.shape[1]}")
+
+            locations = self._ensure_locations()
+            segment = self._write_segment(ids, vectors, documents, metadatas)
+            self._segments = self._segments + [segment]
+            self._write_manifest()
+
+            # Tombstone the rows these IDs replace; the newest segment wins on reload anyway
+            touched = self._tombstone([item_id for item_id in ids if item_id in locations])
+            for row, item_id in enumerate(ids):
+                locations[item_id] = (segment, row)
+            for old_segment in touched:
+                old_segment.save_deleted()
+            if touched:
+                self._write_manifest()  # lets other processes pick up the tombstones
+            self._merge_tail()
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        with self._write_lock():
+            if where:
+                matched = self.get(ids=ids, where=where, include=[])["ids"]
+                ids = matched
+            touched = self._tombstone(list(ids or []))
+            for segment in touched:
+                segment.save_deleted()
+            if touched:
+                self._write_manifest()
+                self._drop_dead_segments()
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include=DEFAULT_GET_INCLUDE
+    ) -> Dict[str, Any]:
+        self._refresh()
+        rows: List[Tuple[_Segment, int]] = []
+        if ids is not None:
+            locations = self._ensure_locations()
+            masks: Dict[int, np.ndarray] = {}
+            for item_id in dict.fromkeys(ids):
+                location = locations.get(item_id)
+                if location is None:
+                    continue
+                if where:
+                    segment, row = location
+                    if id(segment) not in masks:
+                        masks[id(segment)] = segment.mask(where)
+                    if not masks[id(segment)][row]:
+                        continue
+                rows.append(location)
+        else:
+            for segment in self._segments:
+                rows.extend((segment, int(row)) for row in np.flatnonzero(segment.mask(where)))
+
+        offset = offset or 0
+        rows = rows[offset:offset + limit] if limit is not None else rows[offset:]
+        return self._rows_to_result(rows, include)
+
+    def query(
+        self,
+        query_embeddings,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include=DEFAULT_QUERY_INCLUDE
+    ) -> Dict[str, Any]:
+        self._refresh()
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        segments = self._segments
+        self._decode_float16(segments)
+        masks = [segment.mask(where) for segment in segments]
+
+        per_query: List[List[Tuple[_Segment, int, float]]] = []
+        for query in queries:
+            hits = self._search_ivf(query, n_results, segments, masks) if self._centroids is not None else None
+            if hits is None or len(hits) < n_results:
+                hits = self._search_exact(query[np.newaxis, :], n_results, segments, masks)[0]
+            per_query.append(hits)
+
+        result: Dict[str, Any] = {"ids": [], "documents": None, "metadatas": None, "distances": None, "embeddings": None}
+        for field in ("documents", "metadatas", "distances", "embeddings"):
+            if field in include:
+                result[field] = []
+        for hits in per_query:
+            rows = [(segment, row) for segment, row, _ in hits]
+            fields = self._rows_to_result(rows, include)
+            result["ids"].append(fields["ids"])
+            for field in ("documents", "metadatas", "embeddings"):
+                if field in include:
+                    result[field].append(fields[field])
+            if "distances" in include:
+                result["distances"].append([1.0 - score for _, _, score in hits])
+        return result
+
+    # Maintenance
+
+    def compact(self):
+        """Rewrite every live row into a single segment encoded with the current quantization"""
+        with self._write_lock():
+            if len(self._segments) > 1 or any(
+                segment.deleted.any() or segment.quantization != self.quantization for segment in self._segments
+            ):
+                self._merge(self._segments)
+
+    def build_ivf(self, lists: int, iterations: int = IVF_TRAINING_ITERATIONS, seed: int = 0):
+        """Train a spherical k-means coarse quantiser and assign every row to a list"""
+        with self._write_lock():
+            live = [(segment, np.flatnonzero(~segment.deleted)) for segment in self._segments]
+            total = sum(len(rows) for _, rows in live)
+            if total < lists:
+                return
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(total, size=min(total, IVF_TRAINING_SAMPLE), replace=False))
+            parts, start = [], 0
+            for segment, rows in live:
+                chosen = sample_rows[(sample_rows >= start) & (sample_rows < start + len(rows))] - start
+                parts.append(np.asarray(segment.vectors[rows[chosen]]))
+                start += len(rows)
+            sample = np.concatenate(parts)
+
+            centroids = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+            for _ in range(iterations):
+                assignments = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignments, sample)
+                empty = np.bincount(assignments, minlength=lists) == 0
+                # Re-seed empty lists from random sample vectors
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+                centroids = normalize_rows(sums)
+
+            _save_atomic(os.path.join(self.path, "centroids.npy"), centroids)
+            for segment in self._segments:
+                lists_for_segment = self._assign_lists(segment.vectors, centroids)
+                _save_atomic(segment._file("lists.npy"), lists_for_segment)
+                segment.set_lists(lists_for_segment)
+            self._centroids = centroids
+            self._manifest["ivf_lists"] = lists
+            self._write_manifest()
+            logger.info(f"Trained IVF quantiser for '{self.name}' ({lists} lists over {total} vectors)")
+
+    def stats(self) -> Dict[str, Any]:
+        self._refresh()
+        return {
+            "segments": len(self._segments),
+            "vectors": self.count(),
+            "tombstones": sum(len(segment) - segment.live for segment in self._segments),
+            "retired_segments": len(self._manifest.get("retired", [])),
+            "ivf_lists": self._manifest["ivf_lists"],
+            "quantization": self.quantization,
+            "mapped_bytes": sum(segment.vectors.nbytes for segment in self._segments),
+            "search_bytes": sum(segment.search_bytes for segment in self._segments),
+            "decoded_bytes": sum(segment.decoded.nbytes for segment in self._segments if segment.decoded is not None),
+        }
+
+    # Internals
+
+    def _search_exact(self, queries: np.ndarray, k: int, segments: List[_Segment], masks: List[np.ndarray]) -> List[List[Tuple[_Segment, int, float]]]:
+        candidates: List[List[Tuple[_Segment, int, float]]] = [[] for _ in range(len(queries))]
+        for segment, mask in zip(segments, masks):
+            if not mask.any():
+                continue
+            scores = segment.scores(queries)
+            scores[:, ~mask] = -np.inf
+            indices, top_scores = top_k_rows(scores, self._depth(segment, k))
+            for query_index, (row_indices, row_scores) in enumerate(zip(indices, top_scores)):
+                keep = row_scores != -np.inf
+                candidates[query_index].extend(self._rescore(segment, queries[query_index], row_indices[keep], row_scores[keep]))
+        return [sorted(hits, key=lambda hit: hit[2], reverse=True)[:k] for hits in candidates]
+
+    def _search_ivf(self, query: np.ndarray, k: int, segments: List[_Segment], masks: List[np.ndarray]) -> Optional[List[Tuple[_Segment, int, float]]]:
+        centroids = self._centroids
+        probes = np.argsort(-(centroids @ query))[:self.ivf_probes]
+        hits: List[Tuple[_Segment, int, float]] = []
+        for segment, mask in zip(segments, masks):
+            if segment.lists is None:
+                return None  # written before the quantiser existed
+            rows = segment.rows_in_lists(probes)
+            rows = rows[mask[rows]]
+            if not len(rows):
+                continue
+            scores = segment.scores(query[np.newaxis, :], rows)
+            indices, top_scores = top_k_rows(scores, self._depth(segment, k))
+            hits.extend(self._rescore(segment, query, rows[indices[0]], top_scores[0]))
+        return sorted(hits, key=lambda hit: hit[2], reverse=True)[:k]
+
+    def _decode_float16(self, segments: List[_Segment]):
+        """Give float16 segments a float32 copy to score against, while they fit in float16_cache_bytes"""
+        budget = self.float16_cache_bytes - sum(segment.decoded.nbytes for segment in segments if segment.decoded is not None)
+        for segment in segments:
+            if segment.decoded is not None or segment.quantization != "float16":
+                continue
+            size = segment.codes.size * np.dtype(np.float32).itemsize
+            if size <= budget:
+                segment.decoded = np.asarray(segment.codes, dtype=np.float32)
+                budget -= size
+
+    def _depth(self, segment: _Segment, k: int) -> int:
+        """Candidates to take from a segment's codes for k results"""
+        return k if segment.codes is None else k * self.rescore_factor
+
+    @staticmethod
+    def _rescore(segment: _Segment, query: np.ndarray, rows: np.ndarray, scores: np.ndarray) -> List[Tuple[_Segment, int, float]]:
+        """Replace approximate scores of quantised rows with full-precision ones"""
+        if segment.codes is not None and len(rows):
+            order = np.argsort(rows)  # ascending reads from the memory-mapped vectors
+            scores = np.empty(len(rows), dtype=np.float32)
+            scores[order] = np.asarray(segment.vectors[rows[order]]) @ query
+        return [(segment, int(row), float(score)) for row, score in zip(rows, scores)]
+
+    @staticmethod
+    def _assign_lists(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+        lists = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch_size):
+            lists[start:start + batch_size] = np.argmax(np.asarray(vectors[start:start + batch_size]) @ centroids.T, axis=1)
+        return lists
+
+    def _rows_to_result(self, rows: List[Tuple[_Segment, int]], include) -> Dict[str, Any]:
+        return {
+            "ids": [segment.ids[row] for segment, row in rows],
+            "documents": [segment.document(row) for segment, row in rows] if "documents" in include else None,
+            "metadatas": [dict(segment.metadatas[row]) for segment, row in rows] if "metadatas" in include else None,
+            "embeddings": [np.array(segment.vectors[row]) for segment, row in rows] if "embeddings" in include else None,
+        }
+
+    def _ensure_locations(self) -> Dict[str, Tuple[_Segment, int]]:
+        """ID -> (segment, row) of every live row; later segments win over earlier ones"""
+        if self._locations is None:
+            with self._lock:
+                if self._locations is None:
+                    locations: Dict[str, Tuple[_Segment, int]] = {}
+                    for segment in self._segments:
+                        for row in np.flatnonzero(~segment.deleted):
+                            item_id = segment.ids[row]
+                            previous = locations.get(item_id)
+                            if previous is not None:
+                                # A crash between writing a segment and its tombstones
+                                previous[0].deleted[previous[1]] = True
+                            locations[item_id] = (segment, int(row))
+                    self._locations = locations
+        return self._locations
+
+    def _tombstone(self, ids: List[str]) -> List[_Segment]:
+        locations = self._ensure_locations()
+        touched = {}
+        for item_id in ids:
+            location = locations.pop(item_id, None)
+            if location is None:
+                continue
+            segment, row = location
+            segment.deleted[row] = True
+            touched[id(segment)] = segment
+        return list(touched.values())
+
+    def _write_segment(self, ids: List[str], vectors: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]) -> _Segment:
+        name = f"{self._manifest['next_segment']:08d}"
+        self._manifest["next_segment"] += 1
+        _Segment.write(self.path, name, ids, vectors, documents, metadatas, self.quantization)
+        segment = _Segment(self.path, name)
+        if self._centroids is not None:
+            lists = self._assign_lists(vectors, self._centroids)
+            _save_atomic(segment._file("lists.npy"), lists)
+            segment.set_lists(lists)
+        return segment
+
+    def _merge_tail(self):
+        """Merge trailing segments while the newest is at least half the size of the one before it"""
+        while len(self._segments) >= 2 and self._segments[-1].live * 2 >= self._segments[-2].live:
+            self._merge(self._segments[-2:])
+
+    def _merge(self, segments: List[_Segment]):
+        ids, vectors, documents, metadatas = [], [], [], []
+        for segment in segments:
+            rows = np.flatnonzero(~segment.deleted)
+            ids.extend(segment.ids[row] for row in rows)
+            vectors.append(np.asarray(segment.vectors[rows]))
+            documents.extend(segment.document(row) for row in rows)
+            metadatas.extend(segment.metadatas[row] for row in rows)
+
+        position = self._segments.index(segments[0])
+        remaining = [segment for segment in self._segments if segment not in segments]
+        if ids:
+            merged = self._write_segment(ids, np.concatenate(vectors), documents, metadatas)
+            remaining.insert(position, merged)
+            locations = self._ensure_locations()
+            for row, item_id in enumerate(ids):
+                locations[item_id] = (merged, row)
+        self._segments = remaining
+        # Other processes may still read the old files; they are deleted on a later exclusive open
+        self._manifest.setdefault("retired", []).extend(segment.name for segment in segments)
+        self._write_manifest()
+
+    def _drop_dead_segments(self):
+        """Rewrite segments that are mostly tombstones"""
+        for segment in list(self._segments):
+            if segment.live * 2 < len(segment):
+                self._merge([segment])
+
+    def _write_manifest(self):
+        """Atomically replace the manifest; only called under the write lock"""
+        self._manifest["segments"] = [segment.name for segment in self._segments]
+        temporary_path = f"{self._manifest_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f)
+        os.replace(temporary_path, self._manifest_path)
+        self._manifest_signature = self._stat_manifest()
+
+    def _stat_manifest(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self._manifest_path)
+        except FileNotFoundError:
+            return None
+        # os.replace gives every rewrite a new inode, so this changes even within one mtime tick
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self):
+        """Reload the manifest if another process (or a previous open) changed it"""
+        signature = self._stat_manifest()
+        if signature is None or signature == self._manifest_signature:
+            return
+        with self._lock:
+            if signature == self._manifest_signature:
+                return
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            current = {segment.name: segment for segment in self._segments}
+            segments = []
+            for segment_name in manifest["segments"]:
+                segment = current.get(segment_name)
+                if segment is None:
+                    segment = _Segment(self.path, segment_name)
+                else:
+                    segment.load_deleted()
+                segments.append(segment)
+            centroids = None
+            if manifest["ivf_lists"]:
+                centroids = np.load(os.path.join(self.path, "centroids.npy"))
+                for segment in segments:
+                    segment.set_lists(np.load(segment._file("lists.npy"), mmap_mode="r"))
+            self._manifest = manifest
+            self._segments = segments
+            self._centroids = centroids
+            self._locations = None
+            self._manifest_signature = signature
+
+    @contextmanager
+    def _write_lock(self):
+        """Exclusive across threads and processes; the collection is brought up to date on entry"""
+        with self._lock:
+            if self._write_depth:
+                self._write_depth += 1
+                try:
+                    yield
+                finally:
+                    self._write_depth -= 1
+                return
+            with open(os.path.join(self.path, "writer.lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                self._write_depth = 1
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    self._write_depth = 0
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _delete_retired(self):
+        """Remove the files of merged-away segments, if no other process has the collection open"""
+        retired = self._manifest.get("retired")
+        if not retired or fcntl is None:
+            return
+        try:
+            fcntl.flock(self._readers_lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return  # another process may still read them; a later open will retry
+        try:
+            for segment_name in retired:
+                _Segment.remove_files(self.path, segment_name)
+            self._manifest["retired"] = []
+            self._write_manifest()
+        finally:
+            fcntl.flock(self._readers_lock.fileno(), fcntl.LOCK_UN)
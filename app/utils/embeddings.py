@@ -1,14 +1,55 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import List, Union
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import json
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalise row vectors as contiguous float32 (zero vectors stay zero)"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column indices and scores of the k highest scores in each row, best first.
+
+    argpartition finds the top k in linear time; only those k are sorted.
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(scores.dtype)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+def create_embeddings(backend: str, model_name: str, **onnx_options):
+    """LangChain-style embeddings (embed_documents / embed_query) on the torch or ONNX Runtime backend"""
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(model_name=model_name)
+    if backend == "onnx":
+        return OnnxEmbeddings(**onnx_options)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
 class EmbeddingService:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", backend: str = "torch", **onnx_options):
+        """backend "onnx" loads the export in onnx_options["path"] (see OnnxEmbeddings) instead of model_name"""
         try:
-            self.model = SentenceTransformer(model_name)
+            if backend == "onnx":
+                self.model = OnnxEmbeddings(**onnx_options)
+            else:
+                # Imported here so SimilarityIndex can be used without loading torch
+                from sentence_transformers import SentenceTransformer
+
+                self.model = SentenceTransformer(model_name)
             self.dimension = self.model.get_sentence_embedding_dimension()
         except Exception as e:
             logger.error(f"Error loading embedding model: {str(e)}")
@@ -32,12 +73,395 @@ class EmbeddingService:
     
     def find_most_similar(self, query_embedding: np.ndarray, candidate_embeddings: np.ndarray, top_k: int = 5) -> List[int]:
         """Find most similar embeddings"""
-        similarities = []
-        for i, candidate in enumerate(candidate_embeddings):
-            similarity = self.compute_similarity(query_embedding, candidate)
-            similarities.append((i, similarity))
-        
-        # Sort by similarity (descending)
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        
-        return [idx for idx, _ in similarities[:top_k]]
+        if len(candidate_embeddings) == 0:
+            return []
+        scores = normalize_rows(candidate_embeddings) @ normalize_rows(query_embedding)
+        indices, _ = top_k_rows(scores[np.newaxis, :], top_k)
+        return indices[0].tolist()
+
+class OnnxEmbeddings:
+    """Sentence embeddings from an ONNX export of a sentence-transformers model, on ONNX Runtime.
+
+    path is a directory holding model.onnx (model_quantized.onnx when
+    quantized) and the model's tokenizer.json, as written by
+    app/scripts/export_onnx_embeddings.py. Pooling and normalisation follow
+    the sentence-transformers config saved next to them (mean pooling and L2
+    normalisation when there is none, as for all-MiniLM-L6-v2), so vectors
+    match the torch model's and stay compatible with an existing index.
+    Texts are batched by token length to keep padding down.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        quantized: bool = False,
+        threads: int = 0,
+        batch_size: int = 32,
+        max_length: Optional[int] = None
+    ):
+        # Imported here so the torch backend does not need ONNX Runtime
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.path = path
+        self.batch_size = batch_size
+        model_path = os.path.join(path, "model_quantized.onnx" if quantized else "model.onnx")
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        output_names = [output.name for output in self.session.get_outputs()]
+        # Exports that include pooling have a sentence_embedding output
+        self.pooled = "sentence_embedding" in output_names
+        self.output_name = "sentence_embedding" if self.pooled else output_names[0]
+
+        sentence_config = self._read_json("sentence_bert_config.json")
+        pooling_config = self._read_json(os.path.join("1_Pooling", "config.json"))
+        modules = self._read_json("modules.json")
+        self.pooling = "cls" if pooling_config.get("pooling_mode_cls_token") else "mean"
+        self.normalize = modules is None or any(module.get("type", "").endswith("Normalize") for module in modules)
+        self.max_length = max_length or sentence_config.get("max_seq_length") or 256
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        tokenizer_config = self._read_json("tokenizer_config.json")
+        pad_token = tokenizer_config.get("pad_token") or "[PAD]"
+        if isinstance(pad_token, dict):
+            pad_token = pad_token.get("content", "[PAD]")
+        self.pad_id = self.tokenizer.token_to_id(pad_token) or 0
+        self._dimension: Optional[int] = None
+
+    def _read_json(self, name: str) -> Any:
+        file_path = os.path.join(self.path, name)
+        if not os.path.exists(file_path):
+            return None if name == "modules.json" else {}
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = int(self.encode(["dimension"]).shape[1])
+        return self._dimension
+
+    def encode(self, texts: Union[str, List[str]], convert_to_numpy: bool = True, batch_size: Optional[int] = None) -> np.ndarray:
+        """Embeddings as a float32 matrix, one row per text in input order"""
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return np.empty((0, self._dimension or 0), dtype=np.float32)
+        batch_size = batch_size or self.batch_size
+        encodings = self.tokenizer.encode_batch(list(texts))
+        order = np.argsort([len(encoding.ids) for encoding in encodings], kind="stable")
+        embeddings: Optional[np.ndarray] = None
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            vectors = self._run([encodings[index] for index in batch])
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            embeddings[batch] = vectors
+        self._dimension = embeddings.shape[1]
+        return embeddings
+
+    def _run(self, encodings) -> np.ndarray:
+        length = max(len(encoding.ids) for encoding in encodings)
+        input_ids = np.full((len(encodings), length), self.pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), length), dtype=np.int64)
+        token_type_ids = np.zeros((len(encodings), length), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            size = len(encoding.ids)
+            input_ids[row, :size] = encoding.ids
+            attention_mask[row, :size] = 1
+            token_type_ids[row, :size] = encoding.type_ids
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        outputs = self.session.run([self.output_name], {name: value for name, value in feed.items() if name in self.input_names})[0]
+
+        if self.pooled:
+            vectors = outputs
+        elif self.pooling == "cls":
+            vectors = outputs[:, 0]
+        else:
+            mask = attention_mask[:, :, np.newaxis].astype(np.float32)
+            vectors = (outputs * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return normalize_rows(vectors) if self.normalize else np.asarray(vectors, dtype=np.float32)
+
+    # LangChain Embeddings interface, as used by VectorService
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+class MetadataColumns:
+    """Row metadata as integer category codes, one column per field.
+
+    Filters ({field: value} or {field: {"$in": [...]}}, ANDed, in the Chroma
+    style) become vectorised boolean masks over the rows.
+    """
+
+    def __init__(self, capacity: int = 0):
+        self.capacity = capacity
+        self._columns: Dict[str, np.ndarray] = {}  # field -> category code per row (-1: missing)
+        self._codes: Dict[str, Dict[Any, int]] = {}  # field -> value -> code
+        self._values: Dict[str, List[Any]] = {}  # field -> code -> value
+
+    def reserve(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        for field, column in self._columns.items():
+            grown = np.full(capacity, -1, dtype=np.int32)
+            grown[:self.capacity] = column
+            self._columns[field] = grown
+        self.capacity = capacity
+
+    def set(self, rows: Iterable[int], metadatas: List[Dict[str, Any]]):
+        """Replace the metadata of rows (fields missing from a dict are cleared)"""
+        rows = list(rows)
+        for field in {field for metadata in metadatas for field in metadata} | set(self._columns):
+            column = self._column(field)
+            for row, metadata in zip(rows, metadatas):
+                column[row] = self._code(field, metadata.get(field))
+
+    def move(self, source: int, target: int):
+        for column in self._columns.values():
+            column[target] = column[source]
+
+    def clear(self, row: int):
+        for column in self._columns.values():
+            column[row] = -1
+
+    def get(self, row: int) -> Dict[str, Any]:
+        return {field: self._values[field][column[row]] for field, column in self._columns.items() if column[row] >= 0}
+
+    def mask(self, where: Optional[Dict[str, Any]], size: int) -> Optional[np.ndarray]:
+        """Boolean mask over the first size rows, or None without a filter"""
+        if not where:
+            return None
+        mask = np.ones(size, dtype=bool)
+        for field, condition in where.items():
+            if isinstance(condition, dict):
+                if set(condition) != {"$in"}:
+                    raise ValueError(f"Unsupported filter on {field}: {condition}")
+                values = condition["$in"]
+            else:
+                values = [condition]
+            codes = [self._codes.get(field, {}).get(value) for value in values]
+            codes = [code for code in codes if code is not None]
+            if not codes:
+                return np.zeros(size, dtype=bool)
+            mask &= np.isin(self._columns[field][:size], codes)
+        return mask
+
+    def to_arrays(self, size: int) -> Dict[str, np.ndarray]:
+        """Columns and their value tables as arrays (for np.savez)"""
+        arrays = {f"meta__{field}": column[:size] for field, column in self._columns.items()}
+        arrays.update({f"values__{field}": np.asarray(values, dtype=object) for field, values in self._values.items()})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, size: int, capacity: Optional[int] = None) -> "MetadataColumns":
+        metadata = cls(capacity or size)
+        for key in arrays:
+            if key.startswith("meta__"):
+                field = key[len("meta__"):]
+                metadata._column(field)[:size] = arrays[key]
+                metadata._values[field] = list(arrays[f"values__{field}"])
+                metadata._codes[field] = {value: code for code, value in enumerate(metadata._values[field])}
+        return metadata
+
+    def _column(self, field: str) -> np.ndarray:
+        if field not in self._columns:
+            self._columns[field] = np.full(self.capacity, -1, dtype=np.int32)
+            self._codes[field] = {}
+            self._values[field] = []
+        return self._columns[field]
+
+    def _code(self, field: str, value: Any) -> int:
+        if value is None:
+            return -1
+        codes = self._codes[field]
+        if value not in codes:
+            codes[value] = len(self._values[field])
+            self._values[field].append(value)
+        return codes[value]
+
+class SimilarityIndex:
+    """In-process cosine similarity index over a contiguous float32 matrix.
+
+    Vectors are normalised once on insert, so a search is a single matrix
+    product (batched over many queries at once) followed by an argpartition
+    top-k. Rows can be appended, overwritten and deleted; deletes move the
+    last row into the gap so the matrix stays dense. Metadata filters are
+    boolean masks over MetadataColumns.
+    """
+
+    def __init__(self, dimension: int, capacity: int = 1024, query_batch_size: int = 256):
+        self.dimension = dimension
+        self.query_batch_size = query_batch_size
+        self._vectors = np.zeros((max(1, capacity), dimension), dtype=np.float32)
+        self._size = 0
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._metadata = MetadataColumns(len(self._vectors))
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._rows
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """The normalised vectors, one row per item (a view, not a copy)"""
+        return self._vectors[:self._size]
+
+    @property
+    def ids(self) -> List[str]:
+        return list(self._ids)
+
+    def add(self, ids: List[str], embeddings: Union[np.ndarray, List[List[float]]], metadatas: Optional[List[Dict[str, Any]]] = None):
+        """Insert vectors, overwriting any existing rows with the same IDs"""
+        embeddings = normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension))
+        if len(ids) != len(embeddings):
+            raise ValueError("ids and embeddings must have the same length")
+        metadatas = metadatas or [{} for _ in ids]
+
+        new_ids = [item_id for item_id in dict.fromkeys(ids) if item_id not in self._rows]
+        self._reserve(self._size + len(new_ids))
+        for item_id in new_ids:
+            self._rows[item_id] = self._size
+            self._ids.append(item_id)
+            self._size += 1
+
+        rows = np.fromiter((self._rows[item_id] for item_id in ids), dtype=np.int64, count=len(ids))
+        self._vectors[rows] = embeddings
+        self._metadata.set(rows, metadatas)
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """Remove vectors by ID; returns how many were present"""
+        deleted = 0
+        for item_id in ids:
+            row = self._rows.pop(item_id, None)
+            if row is None:
+                continue
+            last = self._size - 1
+            if row != last:
+                moved_id = self._ids[last]
+                self._vectors[row] = self._vectors[last]
+                self._metadata.move(last, row)
+                self._ids[row] = moved_id
+                self._rows[moved_id] = row
+            self._ids.pop()
+            self._metadata.clear(last)
+            self._size -= 1
+            deleted += 1
+        return deleted
+
+    def get(self, item_id: str) -> Optional[np.ndarray]:
+        row = self._rows.get(item_id)
+        return None if row is None else self._vectors[row].copy()
+
+    def metadata(self, item_id: str) -> Dict[str, Any]:
+        return self._metadata.get(self._rows[item_id])
+
+    def mask(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Boolean row mask for a Chroma-style filter: {field: value} or {field: {"$in": [...]}}, ANDed"""
+        return self._metadata.mask(where, self._size)
+
+    def search(
+        self,
+        query_embeddings: Union[np.ndarray, List[float], List[List[float]]],
+        k: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """Top-k (id, cosine similarity) for each query, best first.
+
+        A single query vector may be passed as a 1-D array; the result is still
+        one list per query.
+        """
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dimension))
+        if self._size == 0:
+            return [[] for _ in range(len(queries))]
+
+        rows, matrix, excluded = None, self.vectors, None
+        mask = self.mask(where)
+        if mask is not None:
+            matching = int(mask.sum())
+            if matching == 0:
+                return [[] for _ in range(len(queries))]
+            if matching < self._size // 2:
+                # Small partitions: score only the matching rows
+                rows = np.flatnonzero(mask)
+                matrix = self._vectors[rows]
+            else:
+                excluded = ~mask
+
+        results: List[List[Tuple[str, float]]] = []
+        for start in range(0, len(queries), self.query_batch_size):
+            scores = queries[start:start + self.query_batch_size] @ matrix.T
+            if excluded is not None:
+                scores[:, excluded] = -np.inf
+            indices, top_scores = top_k_rows(scores, k)
+            for row_indices, row_scores in zip(indices, top_scores):
+                hits = []
+                for index, score in zip(row_indices, row_scores):
+                    if score == -np.inf:
+                        break
+                    hits.append((self._ids[rows[index] if rows is not None else index], float(score)))
+                results.append(hits)
+        return results
+
+    def save(self, path: str):
+        """Persist vectors, IDs and metadata to one .npz file"""
+        np.savez(
+            path,
+            vectors=self.vectors,
+            ids=np.asarray(self._ids, dtype=object),
+            **self._metadata.to_arrays(self._size)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "SimilarityIndex":
+        data = np.load(path, allow_pickle=True)
+        vectors = data["vectors"]
+        index = cls(vectors.shape[1], capacity=len(vectors))
+        index._vectors[:len(vectors)] = vectors
+        index._size = len(vectors)
+        index._ids = [str(item_id) for item_id in data["ids"]]
+        index._rows = {item_id: row for row, item_id in enumerate(index._ids)}
+        index._metadata = MetadataColumns.from_arrays(data, len(vectors), capacity=len(index._vectors))
+        return index
+
+    @classmethod
+    def from_collection(cls, collection, batch_size: int = 5000) -> "SimilarityIndex":
+        """Build an index from every vector stored in a Chroma collection"""
+        index: Optional[SimilarityIndex] = None
+        offset = 0
+        while True:
+            batch = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+            if not len(batch["ids"]):
+                break
+            embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+            if index is None:
+                index = cls(embeddings.shape[1], capacity=collection.count())
+            index.add(batch["ids"], embeddings, batch["metadatas"])
+            offset += len(batch["ids"])
+        if index is None:
+            raise ValueError("The collection is empty; the index dimension is unknown")
+        return index
+
+    def _reserve(self, size: int):
+        """Grow the matrix geometrically so appends are amortised O(1)"""
+        capacity = len(self._vectors)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dimension), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+        self._metadata.reserve(capacity)
@@ -0,0 +1,79 @@
+from PIL import Image, ImageOps
+from typing import Any, Dict
+import numpy as np
+
+# Small-angle skew search range (degrees); larger rotations are left to Tesseract's OSD
+MAX_SKEW_DEGREES = 5.0
+SKEW_STEP_DEGREES = 0.5
+SKEW_PROBE_SIDE = 800  # skew is estimated on a thumbnail this size
+
+def downscale(image: Image.Image, max_side: int) -> Image.Image:
+    """Shrink an image so its longest side is at most max_side pixels (0 disables)"""
+    if max_side and max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """Global threshold that best separates ink from paper (Otsu's method)"""
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = histogram.sum()
+    if not total:
+        return 128
+    levels = np.arange(256)
+    weight_background = np.cumsum(histogram)
+    weight_foreground = total - weight_background
+    cumulative_mean = np.cumsum(histogram * levels)
+    mean_background = cumulative_mean / np.maximum(weight_background, 1)
+    mean_foreground = (cumulative_mean[-1] - cumulative_mean) / np.maximum(weight_foreground, 1)
+    between_class_variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+    return int(np.argmax(between_class_variance))
+
+def binarize(image: Image.Image) -> Image.Image:
+    """Convert to black text on a white background"""
+    gray = np.asarray(image.convert("L"))
+    threshold = otsu_threshold(gray)
+    return Image.fromarray(np.where(gray > threshold, 255, 0).astype(np.uint8), mode="L")
+
+def estimate_skew(image: Image.Image) -> float:
+    """Estimate small text-line skew in degrees with a projection-profile search.
+
+    Text lines are horizontal when the row sums of the ink pixels vary the most,
+    so the candidate angle with the highest row-profile variance wins.
+    """
+    probe = downscale(image.convert("L"), SKEW_PROBE_SIDE)
+    gray = np.asarray(probe)
+    ink = Image.fromarray(np.where(gray > otsu_threshold(gray), 0, 255).astype(np.uint8), mode="L")
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-MAX_SKEW_DEGREES, MAX_SKEW_DEGREES + SKEW_STEP_DEGREES / 2, SKEW_STEP_DEGREES):
+        rotated = np.asarray(ink.rotate(float(angle), resample=Image.NEAREST, fillcolor=0), dtype=np.float32)
+        score = float(np.var(rotated.sum(axis=1)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+def deskew(image: Image.Image) -> Image.Image:
+    angle = estimate_skew(image)
+    if abs(angle) < SKEW_STEP_DEGREES / 2:
+        return image
+    fill = 255 if image.mode == "L" else (255,) * len(image.getbands())
+    return image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+
+def preprocess_image(image: Image.Image, profile: Dict[str, Any]) -> Image.Image:
+    """Prepare a page image for Tesseract according to an OCR profile.
+
+    Profile keys: "max_side" (downscale oversized photos), "grayscale",
+    "deskew" and "binarize". Camera EXIF orientation is always applied.
+    """
+    image = ImageOps.exif_transpose(image)
+    image = downscale(image, profile.get("max_side", 0))
+    if profile.get("grayscale") or profile.get("binarize"):
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if profile.get("deskew"):
+        image = deskew(image)
+    if profile.get("binarize"):
+        image = binarize(image)
+    return image
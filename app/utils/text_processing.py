@@ -1,8 +1,40 @@
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import string
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+# "21. Protection of life and personal liberty.—No person ..." (the heading may wrap onto a second line
+# and amended provisions carry a footnote marker such as "1[354A. ...")
+PROVISION_HEADING_PATTERN = re.compile(
+    r'(?m)^[ \t]*(?:\d+\[)?(\d{1,3}[A-Z]{0,3})\.[ \t]+([^\n]{2,250}?(?:\n[^\n]{0,250}?)?)\.?[ \t]*[—–]'
+)
+RUNNING_HEADER_PATTERNS = [
+    re.compile(r'^\s*\d+\s*$'),  # page numbers
+    re.compile(r'^\s*\([xivl]+\)\s*$'),  # roman page numbers
+    re.compile(r'^\s*THE CONSTITUTION OF\s+INDIA\s*$'),
+    re.compile(r'^\s*\(Part [^)]*\)\s*$'),
+]
+MAX_PROVISION_CHARS = 12000
+
+# Lines that open a new section of an agreement, judgment or notice: page markers from extraction,
+# "ARTICLE 5", "Clause 3.2", "12. Termination", "(a) ...", short ALL-CAPS headings
+SECTION_BREAK_PATTERN = re.compile(
+    r'^\s*(?:--- Page \d+ ---'
+    r'|(?i:article|clause|section|schedule|annexure|part|chapter)\s+[\dIVXLC]+[\w.]*'
+    r'|\d{1,3}(?:\.\d{1,3})*\.?\s+[A-Z]'
+    r'|\([a-z0-9]{1,4}\)\s'
+    r'|[A-Z][A-Z &,/-]{3,80}:?\s*$)'
+)
+
+# Explicit references to provisions in free text, mapped to the document type that defines them
+PROVISION_REFERENCE_PATTERNS = [
+    (re.compile(r'\b(?:article|art\.?)\s*(\d{1,3}[a-z]{0,3})\b', re.IGNORECASE), None, "constitution"),
+    (re.compile(r'\b(?:crpc|code of criminal procedure)\s*(?:section|sec\.?|s\.)?\s*(\d{1,3}[a-z]{0,3})\b', re.IGNORECASE), None, "crpc"),
+    (re.compile(r'\b(?:ipc|indian penal code)\s*(?:section|sec\.?|s\.)?\s*(\d{1,3}[a-z]{0,3})\b', re.IGNORECASE), None, "ipc"),
+    (re.compile(r'\b(\d{1,3}[a-z]{0,3})\s*(?:of\s+(?:the\s+)?)?(ipc|crpc)\b', re.IGNORECASE), 2, None),
+    (re.compile(r'\b(?:section|sec\.?)\s*(\d{1,3}[a-z]{0,3})\b(?:\s*(?:of\s+(?:the\s+)?)?(ipc|crpc|indian penal code|code of criminal procedure))?', re.IGNORECASE), 2, "ipc"),
+]
+
 class TextProcessor:
     def __init__(self):
         self.legal_terms = {
@@ -76,6 +108,104 @@ class TextProcessor:
         chunks = splitter.split_text(text)
         return chunks
     
+    def split_statute_provisions(self, text: str) -> List[Dict[str, str]]:
+        """Split a bare act into its numbered provisions (Constitution Articles, IPC Sections).
+
+        Headings must appear in ascending order, which filters out footnotes such as
+        "1. Subs. by the Constitution (First Amendment) Act" that restart numbering.
+        """
+        lines = [
+            line for line in text.splitlines()
+            if not any(pattern.match(line) for pattern in RUNNING_HEADER_PATTERNS)
+        ]
+        text = "\n".join(lines)
+        
+        headings = []
+        last_number = 0
+        for match in PROVISION_HEADING_PATTERN.finditer(text):
+            section = match.group(1)
+            number = int(re.match(r'\d+', section).group())
+            if not last_number <= number <= last_number + 30:
+                continue
+            headings.append((match.start(), section, " ".join(match.group(2).split())))
+            last_number = number
+        
+        provisions = []
+        for i, (start, section, title) in enumerate(headings):
+            end = headings[i + 1][0] if i + 1 < len(headings) else len(text)
+            content = re.sub(r'[ \t]+', ' ', text[start:end]).strip()
+            provisions.append({
+                "section": section.upper(),
+                "title": title,
+                "content": content[:MAX_PROVISION_CHARS]
+            })
+        
+        return provisions
+    
+    def split_sections(self, text: str, max_chars: int) -> List[str]:
+        """Split a long document into chunks of at most max_chars that end on section boundaries.
+
+        Paragraphs are grouped under the heading that opens them (clauses, numbered
+        paragraphs, page markers) and whole groups are packed into chunks; only a
+        single group longer than max_chars is split further.
+        """
+        sections: List[str] = []
+        current: List[str] = []
+        for line in text.splitlines():
+            if current and SECTION_BREAK_PATTERN.match(line):
+                sections.append("\n".join(current).strip())
+                current = []
+            current.append(line)
+        if current:
+            sections.append("\n".join(current).strip())
+        
+        splitter = RecursiveCharacterTextSplitter(chunk_size=max_chars, chunk_overlap=0)
+        chunks: List[str] = []
+        buffer = ""
+        for section in filter(None, sections):
+            if len(section) > max_chars:
+                if buffer:
+                    chunks.append(buffer)
+                    buffer = ""
+                chunks.extend(splitter.split_text(section))
+            elif buffer and len(buffer) + len(section) + 2 > max_chars:
+                chunks.append(buffer)
+                buffer = section
+            else:
+                buffer = f"{buffer}\n\n{section}" if buffer else section
+        if buffer:
+            chunks.append(buffer)
+        return chunks
+    
+    def extract_provision_references(self, text: str) -> List[Tuple[str, str]]:
+        """Find explicit provision references such as "Article 21", "Section 498A" or "302 IPC".
+
+        Returns (document_type, section) pairs in order of appearance. A bare "Section N"
+        is assumed to refer to the IPC unless the text names some other Act.
+        """
+        # "Section 41 of the Motor Vehicles Act" must not be read as IPC 41
+        names_other_act = re.search(r'\b\w+\s+act\b', text, re.IGNORECASE) is not None
+        
+        references = []
+        for pattern, act_group, default_type in PROVISION_REFERENCE_PATTERNS:
+            for match in pattern.finditer(text):
+                act = match.group(act_group) if act_group else None
+                if act:
+                    document_type = "crpc" if act.lower() in ("crpc", "code of criminal procedure") else "ipc"
+                elif act_group and names_other_act:
+                    continue
+                else:
+                    document_type = default_type
+                references.append((match.start(), document_type, match.group(1).upper()))
+        
+        seen = set()
+        ordered = []
+        for _, document_type, section in sorted(references):
+            if (document_type, section) not in seen:
+                seen.add((document_type, section))
+                ordered.append((document_type, section))
+        return ordered
+    
     def detect_document_type(self, text: str) -> str:
         """Detect type of legal document"""
         text_lower = text.lower()
@@ -33,4 +33,25 @@ def validate_file_type(filename: str) -> bool:
 
 def validate_query_length(query: str, max_length: int = 1000) -> bool:
     """Validate query length"""
-    return len(query.strip()) > 0 and len(query) <= max_length
\ No newline at end of file
+    return len(query.strip()) > 0 and len(query) <= max_length
+
+# Leading bytes of the binary formats we accept (see settings.ALLOWED_EXTENSIONS)
+FILE_SIGNATURES = {
+    ".pdf": (b"%PDF-",),
+    ".docx": (b"PK\x03\x04",),  # OOXML is a zip archive
+}
+
+def sniff_file_type(head: bytes, file_ext: str) -> bool:
+    """Check that the first bytes of a file match its extension"""
+    if file_ext == ".txt":
+        # Plain text: no NUL bytes (UTF-16 text is not accepted) and no known binary signature
+        if b"\x00" in head:
+            return False
+        return not any(head.startswith(signature) for signatures in FILE_SIGNATURES.values() for signature in signatures)
+    signatures = FILE_SIGNATURES.get(file_ext)
+    if signatures is None:
+        return False
+    # PDFs may carry a little junk before the header; readers accept it within the first 1 KB
+    if file_ext == ".pdf":
+        return b"%PDF-" in head[:1024]
+    return any(head.startswith(signature) for signature in signatures)